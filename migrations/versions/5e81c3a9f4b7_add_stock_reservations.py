@@ -0,0 +1,69 @@
+"""add_stock_reservations
+
+Revision ID: 5e81c3a9f4b7
+Revises: d94a0c7f51e2
+Create Date: 2026-10-17 19:12:47.630915
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5e81c3a9f4b7"
+down_revision: str = "d94a0c7f51e2"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stock_reservations",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("key", sa.String(length=32), nullable=False),
+        sa.Column("buyer_id", sa.Integer(), nullable=False),
+        sa.Column("seller_id", sa.Integer(), nullable=False),
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("from_universe_id", sa.Integer(), nullable=False),
+        sa.Column("to_universe_id", sa.Integer(), nullable=False),
+        sa.Column("transaction_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("applied", sa.Boolean(), server_default=sa.false(), nullable=False),
+        sa.ForeignKeyConstraint(["buyer_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["seller_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["item_id"], ["items.id"]),
+        sa.ForeignKeyConstraint(["from_universe_id"], ["universes.id"]),
+        sa.ForeignKeyConstraint(["to_universe_id"], ["universes.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_stock_reservations_key", "stock_reservations", ["key"], unique=True)
+
+
+def downgrade() -> None:
+    # Apply the purchases the reconciler has not caught up with before dropping them
+    op.execute(
+        """
+        INSERT INTO transactions (
+            buyer_id, seller_id, item_id, amount, quantity,
+            from_universe_id, to_universe_id, transaction_time
+        )
+        SELECT
+            buyer_id, seller_id, item_id, amount, quantity,
+            from_universe_id, to_universe_id, transaction_time
+        FROM stock_reservations WHERE NOT applied
+        """
+    )
+    op.execute(
+        """
+        UPDATE items SET stock = items.stock - pending.quantity
+        FROM (
+            SELECT item_id, SUM(quantity) AS quantity FROM stock_reservations
+            WHERE NOT applied GROUP BY item_id
+        ) AS pending
+        WHERE items.id = pending.item_id
+        """
+    )
+    op.drop_index("ix_stock_reservations_key", table_name="stock_reservations")
+    op.drop_table("stock_reservations")
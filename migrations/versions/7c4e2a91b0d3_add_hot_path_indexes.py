@@ -0,0 +1,45 @@
+"""add_hot_path_indexes
+
+Revision ID: 7c4e2a91b0d3
+Revises: 51bddb579501
+Create Date: 2026-10-17 09:12:44.204117
+
+"""
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7c4e2a91b0d3"
+down_revision: str = "51bddb579501"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+INDEXES = [
+    # Each side of the trade history UNION: (party, transaction_time, id)
+    ("ix_transactions_buyer_id_time", "transactions", ["buyer_id", "transaction_time", "id"]),
+    ("ix_transactions_seller_id_time", "transactions", ["seller_id", "transaction_time", "id"]),
+    # Item listings filtered by universe
+    ("ix_items_universe_id", "items", ["universe_id"]),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY builds without blocking writes but cannot run inside a transaction. A build
+    # that fails leaves an INVALID index behind, which IF NOT EXISTS would then keep: drop it
+    # before running the upgrade again.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
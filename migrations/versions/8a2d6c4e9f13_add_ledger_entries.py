@@ -0,0 +1,58 @@
+"""add_ledger_entries
+
+Revision ID: 8a2d6c4e9f13
+Revises: 5e81c3a9f4b7
+Create Date: 2026-10-17 21:03:26.481907
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8a2d6c4e9f13"
+down_revision: str = "5e81c3a9f4b7"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # Existing balances become the users' snapshots, with no entries folded in yet
+    op.add_column(
+        "users", sa.Column("balance_entry_id", sa.Integer(), server_default="0", nullable=False)
+    )
+    op.create_table(
+        "ledger_entries",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("universe_id", sa.Integer(), nullable=False),
+        sa.Column("delta", sa.Float(), nullable=False),
+        sa.Column("reason", sa.String(length=16), nullable=False),
+        sa.Column("transaction_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["universe_id"], ["universes.id"]),
+        sa.ForeignKeyConstraint(["transaction_id"], ["transactions.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_ledger_entries_user_id_id", "ledger_entries", ["user_id", "id"])
+
+
+def downgrade() -> None:
+    # Fold the entries appended since each user's snapshot before dropping the ledger
+    op.execute(
+        """
+        UPDATE users SET balance = users.balance + unfolded.delta
+        FROM (
+            SELECT ledger_entries.user_id, SUM(ledger_entries.delta) AS delta
+            FROM ledger_entries JOIN users ON users.id = ledger_entries.user_id
+            WHERE ledger_entries.id > users.balance_entry_id
+            GROUP BY ledger_entries.user_id
+        ) AS unfolded
+        WHERE users.id = unfolded.user_id
+        """
+    )
+    op.drop_index("ix_ledger_entries_user_id_id", table_name="ledger_entries")
+    op.drop_table("ledger_entries")
+    op.drop_column("users", "balance_entry_id")
@@ -0,0 +1,32 @@
+"""add_row_versions
+
+Revision ID: b3f1d8e6a27c
+Revises: 7c4e2a91b0d3
+Create Date: 2026-10-17 14:03:18.550392
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b3f1d8e6a27c"
+down_revision: str = "7c4e2a91b0d3"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+TABLES = ["users", "items"]
+
+
+def upgrade() -> None:
+    # A constant default only touches the catalog on PostgreSQL 11+, without rewriting rows
+    for table in TABLES:
+        op.add_column(
+            table, sa.Column("version", sa.Integer(), server_default="0", nullable=False)
+        )
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        op.drop_column(table, "version")
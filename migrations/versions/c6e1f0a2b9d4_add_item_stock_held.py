@@ -0,0 +1,29 @@
+"""add_item_stock_held
+
+Revision ID: c6e1f0a2b9d4
+Revises: 8a2d6c4e9f13
+Create Date: 2026-10-17 23:12:40.573104
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c6e1f0a2b9d4"
+down_revision: str = "8a2d6c4e9f13"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # Items already held in Redis are marked by running the hold-stock command for them again
+    op.add_column(
+        "items", sa.Column("stock_held", sa.Boolean(), server_default=sa.false(), nullable=False)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("items", "stock_held")
@@ -0,0 +1,54 @@
+"""add_item_stock_shards
+
+Revision ID: d94a0c7f51e2
+Revises: b3f1d8e6a27c
+Create Date: 2026-10-17 16:41:05.118273
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d94a0c7f51e2"
+down_revision: str = "b3f1d8e6a27c"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "items", sa.Column("stock_shards", sa.Integer(), server_default="0", nullable=False)
+    )
+    op.create_table(
+        "item_stock_shards",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("stock", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["item_id"], ["items.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_item_stock_shards_item_id_shard",
+        "item_stock_shards",
+        ["item_id", "shard"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    # Fold the stock of sharded items back into their rows before dropping the shards
+    op.execute(
+        """
+        UPDATE items SET stock = items.stock + shards.stock
+        FROM (
+            SELECT item_id, SUM(stock) AS stock FROM item_stock_shards GROUP BY item_id
+        ) AS shards
+        WHERE items.id = shards.item_id
+        """
+    )
+    op.drop_index("ix_item_stock_shards_item_id_shard", table_name="item_stock_shards")
+    op.drop_table("item_stock_shards")
+    op.drop_column("items", "stock_shards")
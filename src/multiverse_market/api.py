@@ -1,59 +1,129 @@
 import logging
+import typing as ty
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
 
-from multiverse_market.models.responses import CurrencyExchangeResponse
+from multiverse_market.models.responses import CurrencyExchangeResponse, TradeHistoryPage
 
-from .dependencies import MarketDependency
-from .models.requests import CurrencyExchange, ItemPurchase
+from .dependencies import (
+    IdempotencyDependency,
+    MarketDependency,
+    TradeStreamDependency,
+    admit_request,
+    limit_writes,
+)
+from .models.requests import BatchItemPurchase, CurrencyExchange, ItemPurchase
 from .models.schemas import (
     ItemSchema,
     TransactionSchema,
     UniverseSchema,
     UserSchema,
 )
+from .services import ExportFormat, encode_trades
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(admit_request)])
+
+MAX_TRADES_PAGE_SIZE = 500
+
+# Clients retrying a POST send the same key, and get the first response instead of a rerun
+IdempotencyKey = ty.Annotated[str | None, Header(alias="Idempotency-Key", max_length=255)]
 
 
 @router.get("/universes", response_model=list[UniverseSchema])
 async def list_universes(market: MarketDependency):
     """List all available universes."""
     logger.debug("Handling request to list universes")
-    return await market.list_universes()
+    return Response(await market.list_universes_json(), media_type="application/json")
 
 
 @router.get("/users/{user_id}", response_model=UserSchema)
 async def get_user(user_id: int, market: MarketDependency):
     """Get user details."""
-    logger.debug(f"Handling request to get user {user_id}")
+    logger.debug("Handling request to get user %s", user_id)
     return await market.get_user(user_id)
 
 
 @router.get("/items", response_model=list[ItemSchema])
 async def list_items(market: MarketDependency, universe_id: int | None = None):
     """List available items, optionally filtered by universe."""
-    logger.debug(f"Handling request to list items for universe {universe_id}")
-    return await market.list_items(universe_id)
+    logger.debug("Handling request to list items for universe %s", universe_id)
+    return Response(await market.list_items_json(universe_id), media_type="application/json")
 
 
-@router.post("/exchange", response_model=CurrencyExchangeResponse)
-async def exchange_currency(exchange: CurrencyExchange, market: MarketDependency):
+@router.post(
+    "/exchange", response_model=CurrencyExchangeResponse, dependencies=[Depends(limit_writes)]
+)
+async def exchange_currency(
+    exchange: CurrencyExchange,
+    market: MarketDependency,
+    idempotency: IdempotencyDependency,
+    idempotency_key: IdempotencyKey = None,
+):
     """Exchange currency between universes."""
-    logger.info(f"Processing currency exchange request for user {exchange.user_id}")
-    return await market.exchange_currency(exchange)
-
-
-@router.post("/buy", response_model=TransactionSchema)
-async def buy_item(purchase: ItemPurchase, market: MarketDependency):
+    logger.info("Processing currency exchange request for user %s", exchange.user_id)
+    if idempotency_key is None:
+        return await market.exchange_currency(exchange)
+    return await idempotency.run(
+        f"exchange:{idempotency_key}", exchange, lambda: market.exchange_currency(exchange)
+    )
+
+
+@router.post("/buy", response_model=TransactionSchema, dependencies=[Depends(limit_writes)])
+async def buy_item(
+    purchase: ItemPurchase,
+    market: MarketDependency,
+    idempotency: IdempotencyDependency,
+    idempotency_key: IdempotencyKey = None,
+):
     """Purchase an item."""
-    logger.info(f"Processing purchase request for user {purchase.buyer_id}")
-    return await market.buy_item(purchase)
+    logger.info("Processing purchase request for user %s", purchase.buyer_id)
+    if idempotency_key is None:
+        return await market.buy_item(purchase)
+    return await idempotency.run(
+        f"buy:{idempotency_key}", purchase, lambda: market.buy_item(purchase)
+    )
 
 
-@router.get("/users/{user_id}/trades", response_model=list[TransactionSchema])
-async def get_user_trades(user_id: int, market: MarketDependency):
-    """Get all trades for a user."""
-    return await market.get_user_trades(user_id)
+@router.post(
+    "/buy/batch", response_model=list[TransactionSchema], dependencies=[Depends(limit_writes)]
+)
+async def buy_items(purchase: BatchItemPurchase, market: MarketDependency):
+    """Purchase several items at once; either every line succeeds or none does."""
+    logger.info("Processing batch purchase request for user %s", purchase.buyer_id)
+    return await market.buy_items(purchase)
+
+
+@router.get("/users/{user_id}/trades", response_model=TradeHistoryPage)
+async def get_user_trades(
+    user_id: int,
+    market: MarketDependency,
+    limit: int = Query(50, ge=1, le=MAX_TRADES_PAGE_SIZE),
+    before: str | None = None,
+    after: str | None = None,
+):
+    """Get a page of a user's trades, newest first.
+
+    Follow ``next_cursor`` with ``before`` for older trades and ``prev_cursor`` with ``after``
+    for newer ones.
+    """
+    return await market.get_user_trades(user_id, limit=limit, before=before, after=after)
+
+
+@router.get("/users/{user_id}/trades/export")
+async def export_user_trades(
+    user_id: int,
+    market: MarketDependency,
+    trades: TradeStreamDependency,
+    format: ExportFormat = ExportFormat.NDJSON,
+):
+    """Stream a user's whole trade history, newest first, as NDJSON or CSV."""
+    logger.info("Exporting trades for user %s as %s", user_id, format)
+    await market.get_user(user_id)  # Fail with 404 before the stream starts
+    return StreamingResponse(
+        encode_trades(trades(user_id), format),
+        media_type=format.media_type,
+        headers={"Content-Disposition": f'attachment; filename="trades-{user_id}.{format}"'},
+    )
@@ -2,12 +2,25 @@
 
 import asyncio
 import logging
+import typing as ty
+from collections.abc import Awaitable, Callable
 from pathlib import Path
 
 import typer
 
-from .dependencies import async_session
-from .scripts.seed_data import seed_data
+from .dependencies import (
+    async_session,
+    background_service,
+    engine,
+    inventory_reconciler,
+    redis,
+    settings,
+)
+from .exceptions import ItemNotFoundException
+from .models import ItemSchema
+from .scripts.generate_data import DataGenerator, load
+from .scripts.seed_data import load_seed_file, seed_data
+from .services import MarketService
 
 logger = logging.getLogger(__name__)
 
@@ -17,21 +30,166 @@ app = typer.Typer()
 @app.command()
 def seed(
     environment: str = typer.Option("development", help="Environment to seed data for"),
-    data_file: Path | None = typer.Option(None, help="Optional JSON file with custom seed data"),
+    data_file: Path | None = typer.Option(
+        None,
+        exists=True,
+        help="JSON file of rows per table, a CSV file named after its table, or a directory "
+        "of such CSV files",
+    ),
 ) -> None:
     """Seed the database with test data."""
 
     async def _seed() -> None:
-        logger.info(f"Starting database seeding for {environment} environment")
+        logger.info("Starting database seeding for %s environment", environment)
+        data = None
         if data_file:
-            logger.debug(f"Using custom seed data from {data_file}")
+            logger.debug("Using custom seed data from %s", data_file)
+            data = load_seed_file(data_file)
 
         async with async_session() as session:
-            await seed_data(session)
-            logger.info(f"Successfully seeded {environment} database")
+            await seed_data(session, data)
+            logger.info("Successfully seeded %s database", environment)
 
     asyncio.run(_seed())
 
 
+@app.command()
+def generate(
+    universes: int = typer.Option(20, min=1, help="Number of universes"),
+    users: int = typer.Option(100_000, min=1, help="Number of users"),
+    items: int = typer.Option(50_000, min=1, help="Number of items"),
+    transactions: int = typer.Option(1_000_000, min=0, help="Number of transactions"),
+    item_skew: float = typer.Option(1.1, min=0, help="Zipf exponent of item popularity"),
+    buyer_skew: float = typer.Option(0.8, min=0, help="Zipf exponent of buyer activity"),
+    chunk_size: int = typer.Option(50_000, min=1, help="Rows sent per COPY"),
+    seed: int | None = typer.Option(None, help="Random seed, for a reproducible data set"),
+    truncate: bool = typer.Option(False, help="Empty the market tables first"),
+) -> None:
+    """Generate a synthetic, production-scale data set and bulk load it (PostgreSQL only)."""
+    generator = DataGenerator(
+        universes=universes,
+        users=users,
+        items=items,
+        transactions=transactions,
+        item_skew=item_skew,
+        buyer_skew=buyer_skew,
+        seed=seed,
+    )
+
+    async def _generate() -> dict[str, int]:
+        try:
+            return await load(engine, generator, chunk_size=chunk_size, truncate=truncate)
+        finally:
+            await engine.dispose()
+
+    loaded = asyncio.run(_generate())
+    for table, count in loaded.items():
+        typer.echo(f"{table}: {count} rows")
+
+
+def _run_with_service(operation: Callable[[MarketService], Awaitable[ty.Any]]) -> ty.Any:
+    """Run an admin operation with a market service of its own, reporting unknown items."""
+
+    async def _run() -> ty.Any:
+        try:
+            async with async_session() as session:
+                return await operation(background_service(session))
+        finally:
+            await redis.aclose()
+            await engine.dispose()
+
+    try:
+        return asyncio.run(_run())
+    except ItemNotFoundException as e:
+        typer.echo(e.detail, err=True)
+        raise typer.Exit(1) from None
+
+
+def _shard_item_stock(item_id: int, shards: int | None) -> ItemSchema:
+    return _run_with_service(lambda service: service.shard_item_stock(item_id, shards))
+
+
+def _require_redis_inventory() -> None:
+    if not settings.REDIS_INVENTORY:
+        typer.echo("Stock is only held in Redis with REDIS_INVENTORY enabled", err=True)
+        raise typer.Exit(1)
+
+
+@app.command()
+def shard_stock(
+    item_id: int = typer.Argument(..., help="Item whose stock to shard"),
+    shards: int = typer.Option(..., min=0, help="Number of shard rows; 0 unshards the item"),
+) -> None:
+    """Spread a hot item's stock over several rows, so concurrent purchases lock different ones."""
+    item = _shard_item_stock(item_id, shards)
+    spread = f"over {shards} shards" if shards else "unsharded"
+    typer.echo(f"item {item.id}: {item.stock} in stock, {spread}")
+
+
+@app.command()
+def rebalance_stock(item_id: int = typer.Argument(..., help="Sharded item to rebalance")) -> None:
+    """Even out the stock between the shards of an item."""
+    item = _shard_item_stock(item_id, None)
+    typer.echo(f"item {item.id}: {item.stock} in stock, rebalanced")
+
+
+@app.command()
+def hold_stock(item_id: int = typer.Argument(..., help="Item whose stock to hold")) -> None:
+    """Hold a hot item's stock in Redis, so purchases reserve it without locking its row."""
+    _require_redis_inventory()
+    item = _run_with_service(lambda service: service.hold_item_stock(item_id))
+    typer.echo(f"item {item.id}: {item.stock} in stock, held in Redis")
+
+
+@app.command()
+def release_stock(
+    item_id: int = typer.Argument(..., help="Item whose stock to release"),
+    timeout: float = typer.Option(60.0, min=0, help="Seconds to wait for pending purchases"),
+) -> None:
+    """Move an item's stock back to its row, once every purchase held in Redis is applied."""
+    _require_redis_inventory()
+
+    async def _release(service: MarketService) -> ItemSchema:
+        # Apply pending purchases from here too, in case no application process is running
+        if inventory_reconciler is not None:
+            inventory_reconciler.start()
+        try:
+            return await service.release_item_stock(item_id, timeout=timeout)
+        finally:
+            if inventory_reconciler is not None:
+                await inventory_reconciler.close()
+
+    try:
+        item = _run_with_service(_release)
+    except TimeoutError:
+        typer.echo(f"Purchases of item {item_id} are still pending; it stays held", err=True)
+        raise typer.Exit(1) from None
+    typer.echo(f"item {item.id}: {item.stock} in stock, released from Redis")
+
+
+@app.command()
+def check_inventory() -> None:
+    """Compare the stock of every item held in Redis with its row in the database."""
+    _require_redis_inventory()
+    counts = _run_with_service(lambda service: service.check_inventory())
+    typer.echo(f"{'item':>8} {'redis':>10} {'reserved':>10} {'database':>10} {'drift':>8}")
+    for count in counts:
+        typer.echo(
+            f"{count.item_id:>8} {count.redis_stock:>10} {count.reserved:>10}"
+            f" {count.database_stock:>10} {count.drift:>8}"
+        )
+    if any(count.drift for count in counts):
+        raise typer.Exit(1)
+
+
+@app.command()
+def snapshot_balances(
+    batch_size: int = typer.Option(1000, min=1, help="Users folded per transaction"),
+) -> None:
+    """Fold every user's ledger entries into their balance, as needed to turn the ledger off."""
+    folded = _run_with_service(lambda service: service.snapshot_balances(batch_size))
+    typer.echo(f"{folded} balances snapshotted")
+
+
 if __name__ == "__main__":
     app()
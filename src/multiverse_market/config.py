@@ -34,7 +34,87 @@ class Settings(BaseSettings):
         ssl = "?ssl=true" if self.REDIS__SSL else ""
         return f"redis://{password}{self.REDIS__HOST}:{self.REDIS__PORT}/{self.REDIS__DB}{ssl}"
 
+    REDIS_POOL_SIZE: int = 10
+    REDIS_POOL_TIMEOUT: float = 5.0  # seconds a request waits for a free connection
     REDIS_CACHE_TTL: int = 3600  # 1 hour
+    # Read-through TTLs in seconds; 0 disables caching of that entry
+    CACHE_USER_TTL: int = 30
+    CACHE_ITEM_LIST_TTL: int = 30
+    CACHE_UNIVERSE_LIST_TTL: int = 3600
+    EXCHANGE_RATE_CHECK_INTERVAL: float = 1.0  # seconds between rate version checks
+
+    # In-process cache tier in front of Redis (opt-in)
+    CACHE_LOCAL_TIER: bool = False
+    CACHE_LOCAL_MAX_SIZE: int = 10_000
+    CACHE_LOCAL_TTL: float = 5.0  # upper bound on staleness if an invalidation is lost
+
+    # Purchase group commit for hot items (opt-in)
+    PURCHASE_BATCHING: bool = False
+    PURCHASE_BATCH_WINDOW_MS: float = 2.0
+    PURCHASE_BATCH_MAX_SIZE: int = 64
+
+    # Background health checks of PostgreSQL and Redis, in seconds
+    HEALTH_CHECK_INTERVAL: float = 5.0
+    HEALTH_CHECK_TIMEOUT: float = 2.0
+
+    # Warm-up run on startup before the process reports ready
+    WARMUP_ENABLED: bool = True
+    WARMUP_TOP_ITEMS: int = 0  # cache listings holding this many most traded items; 0 skips
+
+    # Token buckets in Redis, per client address across routes and per route across
+    # clients (opt-in); user ids are not trusted since the API does not authenticate callers
+    RATE_LIMITING: bool = False
+    RATE_LIMIT_CLIENT_RATE: float = 20.0  # requests per second
+    RATE_LIMIT_CLIENT_BURST: int = 40
+    # Addresses or networks of the proxies in front of the API, e.g. ["10.0.0.0/8"]. A client
+    # is then identified by the last X-Forwarded-For entry they did not add; left empty, all
+    # clients of a proxy share the proxy's bucket
+    RATE_LIMIT_TRUSTED_PROXIES: list[str] = []
+    RATE_LIMIT_ROUTE_RATE: float = 1000.0
+    RATE_LIMIT_ROUTE_BURST: int = 2000
+
+    # How balance and stock updates guard against concurrent writers of the same row:
+    # "atomic" (one conditional UPDATE), "pessimistic" (SELECT ... FOR UPDATE) or
+    # "optimistic" (compare-and-swap on the row version, retried with jittered backoff)
+    CONCURRENCY_STRATEGY: str = "atomic"
+    OPTIMISTIC_MAX_RETRIES: int = 5  # attempts after the first before answering 409
+    OPTIMISTIC_BACKOFF: float = 0.005  # seconds, doubled per retry, full jitter
+
+    # Balances kept as an append-only ledger, with a snapshot on each user's row that the
+    # entries are folded into (opt-in); run snapshot-balances before turning it off again.
+    # For auditability, not throughput: appends still take turns on the user's row lock
+    BALANCE_LEDGER: bool = False
+    LEDGER_SNAPSHOT_ENTRIES: int = 32  # entries a user's writes pile up before folding them
+
+    # Stock of designated hot items held in Redis, reserved by a script and applied to the
+    # database in batches by a background reconciler (opt-in); see the hold-stock command
+    REDIS_INVENTORY: bool = False
+    INVENTORY_BATCH_SIZE: int = 100  # reservations applied per reconciler commit
+    INVENTORY_RECONCILE_INTERVAL: float = 0.1  # seconds between passes while idle
+    INVENTORY_CLAIM_IDLE: float = 5.0  # seconds before a pending reservation is replayed
+    INVENTORY_RESERVATION_GRACE: float = 30.0  # seconds before an uncommitted one is released
+
+    # Writes in flight per process, leaving the rest of the database pool to reads; writes
+    # are shed with 429 after queueing for a slot, or while database checkouts wait
+    WRITE_CONCURRENCY_LIMIT: int = 10
+    WRITE_QUEUE_TIMEOUT: float = 2.0  # seconds a write waits for a slot
+    WRITE_SHED_CHECKOUT_WAIT: float = 0.1  # seconds of recent average checkout wait
+    SHED_RETRY_AFTER: int = 1  # seconds, sent in Retry-After
+
+    # Responses to POSTs sent with an Idempotency-Key header, in seconds
+    IDEMPOTENCY_TTL: int = 86400  # how long a key's response is replayed
+    IDEMPOTENCY_LOCK_TTL: int = 30  # claim left by a crashed process expires after this
+    IDEMPOTENCY_WAIT_TIMEOUT: float = 10.0  # duplicates wait this long for the original
+
+    # Rows fetched per server-side cursor round trip when exporting trade history
+    TRADE_EXPORT_BATCH_SIZE: int = 1000
+
+    # Fraction of requests whose info and debug logs are kept; warnings are always kept
+    LOG_SAMPLE_RATE: float = 1.0
+
+    # Admin token for per-request profiling with an X-Profile header; empty disables it
+    PROFILING_TOKEN: str = ""
+    PROFILE_DIR: str = "logs/profiles"
 
     # API
     API_V1_PREFIX: str = "/api/v1"
@@ -1,17 +1,56 @@
 import asyncio
 import logging
-from collections.abc import AsyncGenerator
+import os
+import socket
+from collections.abc import (
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Collection,
+    Iterator,
+    Sequence,
+)
+from contextlib import asynccontextmanager
+from ipaddress import ip_address, ip_network
 from typing import Annotated
 
-from fastapi import Depends
-from redis.asyncio import ConnectionPool, Redis
+from fastapi import Depends, FastAPI, Request
+from redis.asyncio import Redis
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from .config import Settings
-from .infrastructure import RedisCache
+from .infrastructure import (
+    BucketLimit,
+    HealthMonitor,
+    IdempotencyStore,
+    InstrumentedAsyncQueuePool,
+    InstrumentedBlockingConnectionPool,
+    InventoryReconciler,
+    ReadThroughCache,
+    RedisCache,
+    RedisInvalidationBus,
+    RedisInventory,
+    TieredCache,
+    TokenBuckets,
+    WriteLimiter,
+)
+from .infrastructure.metrics import Labels, registry
 from .interfaces import CacheBackend, MarketBackend
-from .repositories import ItemRepository, TransactionRepository, UniverseRepository, UserRepository
-from .services import MarketService
+from .models import ItemPurchase, Transaction
+from .repositories import (
+    BalanceLedger,
+    ConcurrencyControl,
+    ConcurrencyStrategy,
+    ItemRepository,
+    SQLAlchemyUnitOfWork,
+    TransactionRepository,
+    UnitOfWork,
+    UniverseRepository,
+    UserRepository,
+)
+from .services import ExchangeRateTable, MarketService, PurchaseBatcher, warm_up
+from .services.batcher import PurchaseResult
 
 logger = logging.getLogger(__name__)
 
@@ -22,19 +61,276 @@ settings = Settings()
 engine = create_async_engine(
     settings.database_url,
     echo=settings.DB_ECHO,
+    poolclass=InstrumentedAsyncQueuePool,
     pool_size=settings.DB_POOL_SIZE,
     max_overflow=settings.DB_MAX_OVERFLOW,
 )
 
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-# Redis setup with connection pooling
-redis_pool = ConnectionPool.from_url(
-    settings.redis_url, encoding="utf-8", decode_responses=True, max_connections=10
+# Redis setup with connection pooling; requests beyond the pool size wait for a connection
+redis_pool = InstrumentedBlockingConnectionPool.from_url(
+    settings.redis_url,
+    encoding="utf-8",
+    decode_responses=True,
+    max_connections=settings.REDIS_POOL_SIZE,
+    timeout=settings.REDIS_POOL_TIMEOUT,
 )
 
 redis = Redis(connection_pool=redis_pool)
 
+# Shared by every request so hot keys are served from process memory
+tiered_cache = (
+    TieredCache(
+        RedisCache(redis),
+        RedisInvalidationBus(redis),
+        max_size=settings.CACHE_LOCAL_MAX_SIZE,
+        local_ttl=settings.CACHE_LOCAL_TTL,
+    )
+    if settings.CACHE_LOCAL_TIER
+    else None
+)
+
+# Conditional balance and stock updates of every repository built by this process
+concurrency = ConcurrencyControl(
+    ConcurrencyStrategy(settings.CONCURRENCY_STRATEGY),
+    max_retries=settings.OPTIMISTIC_MAX_RETRIES,
+    backoff=settings.OPTIMISTIC_BACKOFF,
+)
+# Balance writes of every user repository built by this process
+ledger = BalanceLedger(settings.LEDGER_SNAPSHOT_ENTRIES) if settings.BALANCE_LEDGER else None
+
+# Shared by every request so rates are built once per process, not looked up per call
+exchange_rates = ExchangeRateTable(check_interval=settings.EXCHANGE_RATE_CHECK_INTERVAL)
+
+# Shared by every request so hit rates cover the whole process
+read_through = ReadThroughCache(
+    ttls={
+        "user": settings.CACHE_USER_TTL,
+        "items": settings.CACHE_ITEM_LIST_TTL,
+        "universes": settings.CACHE_UNIVERSE_LIST_TTL,
+    },
+    default_ttl=settings.REDIS_CACHE_TTL,
+)
+
+
+def _pool_connections() -> Iterator[tuple[Labels, float]]:
+    yield ("database", "in_use"), engine.pool.checkedout()
+    yield ("database", "idle"), engine.pool.checkedin()
+    yield ("redis", "in_use"), redis_pool.in_use
+    yield ("redis", "idle"), redis_pool.idle
+
+
+def _pool_saturation() -> Iterator[tuple[Labels, float]]:
+    yield (
+        ("database",),
+        engine.pool.checkedout() / (settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW),
+    )
+    yield ("redis",), redis_pool.in_use / redis_pool.max_connections
+
+
+def _local_cache_lookups() -> Iterator[tuple[Labels, float]]:
+    if tiered_cache is not None:
+        yield ("hit",), tiered_cache.local.hits
+        yield ("miss",), tiered_cache.local.misses
+
+
+def _local_cache_evictions() -> Iterator[tuple[Labels, float]]:
+    if tiered_cache is not None:
+        yield (), tiered_cache.local.evictions
+
+
+def _read_through_lookups() -> Iterator[tuple[Labels, float]]:
+    for result, counts in (("hit", read_through.hits), ("miss", read_through.misses)):
+        for kind, count in sorted(counts.items()):
+            yield (kind, result), count
+
+
+registry.callback(
+    "pool_connections",
+    "Connections of the database and Redis pools, by state",
+    ("pool", "state"),
+    _pool_connections,
+)
+registry.callback(
+    "pool_saturation_ratio",
+    "Share of a pool's connection limit checked out",
+    ("pool",),
+    _pool_saturation,
+)
+registry.callback(
+    "local_cache_lookups_total",
+    "Keys looked up in the in-process cache tier, by result",
+    ("result",),
+    _local_cache_lookups,
+    type="counter",
+)
+registry.callback(
+    "local_cache_evictions_total",
+    "Entries evicted from the in-process cache tier to stay within its size",
+    (),
+    _local_cache_evictions,
+    type="counter",
+)
+registry.callback(
+    "read_through_lookups_total",
+    "Read-through cache lookups, by kind of entry and result",
+    ("kind", "result"),
+    _read_through_lookups,
+    type="counter",
+)
+
+
+def background_service(session: AsyncSession) -> MarketService:
+    """Build a market service for work done outside any request, such as admin commands."""
+    return MarketService(
+        UserRepository(session, concurrency, ledger),
+        ItemRepository(session, concurrency),
+        TransactionRepository(session),
+        UniverseRepository(session),
+        tiered_cache or RedisCache(redis),
+        SQLAlchemyUnitOfWork(session),
+        exchange_rates=exchange_rates,
+        read_through=read_through,
+        inventory=RedisInventory(redis) if settings.REDIS_INVENTORY else None,
+    )
+
+
+async def _apply_purchase_group(
+    item_id: int, purchases: Sequence[ItemPurchase]
+) -> list[PurchaseResult]:
+    """Apply a coalesced purchase group in its own session, outside any request."""
+    async with async_session() as session:
+        return await background_service(session).buy_item_group(item_id, purchases)
+
+
+# Shared by every request so concurrent purchases of an item land in the same group
+purchase_batcher = (
+    PurchaseBatcher(
+        _apply_purchase_group,
+        window=settings.PURCHASE_BATCH_WINDOW_MS / 1000,
+        max_batch_size=settings.PURCHASE_BATCH_MAX_SIZE,
+    )
+    if settings.PURCHASE_BATCHING
+    else None
+)
+
+
+async def _apply_reservations(keys: Collection[str]) -> set[str]:
+    """Apply reservations of stock held in Redis in their own session, outside any request."""
+    async with async_session() as session:
+        return await background_service(session).apply_reservations(keys)
+
+
+# Applies purchases of stock held in Redis to the database, including those of crashed processes
+inventory_reconciler = (
+    InventoryReconciler(
+        RedisInventory(redis),
+        _apply_reservations,
+        consumer=f"{socket.gethostname()}:{os.getpid()}",
+        batch_size=settings.INVENTORY_BATCH_SIZE,
+        interval=settings.INVENTORY_RECONCILE_INTERVAL,
+        claim_idle=settings.INVENTORY_CLAIM_IDLE,
+        grace=settings.INVENTORY_RESERVATION_GRACE,
+    )
+    if settings.REDIS_INVENTORY
+    else None
+)
+
+
+def _checkout_wait() -> float:
+    # Looked up on each call: disposing of the engine replaces its pool
+    return engine.pool.recent_wait.value()
+
+
+# Shared by every request, so the limit applies to the whole process
+write_limiter = WriteLimiter(
+    settings.WRITE_CONCURRENCY_LIMIT,
+    settings.WRITE_SHED_CHECKOUT_WAIT,
+    _checkout_wait,
+    queue_timeout=settings.WRITE_QUEUE_TIMEOUT,
+    retry_after=settings.SHED_RETRY_AFTER,
+)
+
+
+async def _check_database() -> None:
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+# Probes run in the background, so requests borrow pooled connections without a handshake
+health_monitor = HealthMonitor(
+    {"database": _check_database, "redis": redis.ping},
+    interval=settings.HEALTH_CHECK_INTERVAL,
+    timeout=settings.HEALTH_CHECK_TIMEOUT,
+)
+
+
+# Set once warm-up has completed; readiness is only reported from then on
+warmed_up = asyncio.Event()
+
+
+async def _warm_up() -> None:
+    """Warm up, retrying until the database and Redis can be reached."""
+    while True:
+        try:
+            await warm_up(
+                engine,
+                async_session,
+                background_service,
+                pool_size=settings.DB_POOL_SIZE,
+                top_items=settings.WARMUP_TOP_ITEMS,
+                concurrency=concurrency,
+                ledger=ledger,
+            )
+        except Exception as e:
+            logger.warning("Warm-up failed, retrying: %s", e)
+            await asyncio.sleep(settings.HEALTH_CHECK_INTERVAL)
+        else:
+            warmed_up.set()
+            return
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    """Own the database engine, the Redis pool and the background tasks using them.
+
+    Warm-up runs in the background, so liveness is reported while the process warms up.
+    """
+    status = await health_monitor.check()
+    logger.info("Starting with dependency health %s", status)
+    health_monitor.start()
+    if tiered_cache is not None:
+        tiered_cache.start()
+    if inventory_reconciler is not None:
+        inventory_reconciler.start()
+    warmed_up.clear()
+    warming = asyncio.create_task(_warm_up()) if settings.WARMUP_ENABLED else None
+    if warming is None:
+        warmed_up.set()
+    try:
+        yield
+    finally:
+        logger.info("Shutting down")
+        if warming is not None:
+            warming.cancel()
+            await asyncio.gather(warming, return_exceptions=True)
+        await health_monitor.close()
+        if purchase_batcher is not None:
+            await purchase_batcher.drain()
+        if inventory_reconciler is not None:
+            await inventory_reconciler.close()
+        if tiered_cache is not None:
+            await tiered_cache.close()
+        await redis.aclose()
+        await redis_pool.aclose()
+        await engine.dispose()
+
+
+def is_ready() -> bool:
+    """Tell whether the process is warm and its dependencies are healthy."""
+    return warmed_up.is_set() and health_monitor.healthy
+
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     logger.debug("Creating new database session")
@@ -46,38 +342,126 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
-async def get_redis() -> AsyncGenerator[Redis, None]:
-    logger.debug("Attempting Redis connection")
-    for attempt in range(3):
-        try:
-            await redis.ping()
-            logger.debug("Redis connection successful")
-            try:
-                yield redis
-            finally:
-                logger.debug("Closing Redis connection")
-                await redis.close()
-            return
-        except Exception as e:
-            logger.warning(f"Redis connection attempt {attempt + 1} failed: {e!s}")
-            if attempt == 2:
-                raise
-            await asyncio.sleep(0.1 * (attempt + 1))
+def get_session_factory() -> async_sessionmaker[AsyncSession]:
+    """Get the session factory, for work that outlives the request's own session."""
+    return async_session
+
+
+TradeStream = Callable[[int], AsyncIterator[Sequence[Transaction]]]
+
+
+async def get_trade_stream(
+    session_factory: async_sessionmaker[AsyncSession] = Depends(get_session_factory),
+) -> TradeStream:
+    """Get a function streaming a user's trade history in batches.
+
+    Each stream opens and closes its own session: a streamed body is sent after the request's
+    dependencies have been torn down, so it cannot use the request session.
+    """
+
+    async def stream(user_id: int) -> AsyncIterator[Sequence[Transaction]]:
+        async with session_factory() as session:
+            repository = TransactionRepository(session)
+            batches = repository.stream_user_trades(
+                user_id, batch_size=settings.TRADE_EXPORT_BATCH_SIZE
+            )
+            async for batch in batches:
+                yield batch
+
+    return stream
+
+
+async def get_redis() -> Redis:
+    """Get the application's Redis client, whose pool lives as long as the application."""
+    return redis
 
 
 async def get_cache_backend(redis: Redis = Depends(get_redis)) -> CacheBackend:
     """Get cache backend."""
+    if tiered_cache is not None:
+        return tiered_cache
     return RedisCache(redis)
 
 
+async def get_inventory(redis: Redis = Depends(get_redis)) -> RedisInventory | None:
+    """Get the stock of hot items held in Redis, or ``None`` when none is held there."""
+    return RedisInventory(redis) if settings.REDIS_INVENTORY else None
+
+
+async def get_idempotency_store(redis: Redis = Depends(get_redis)) -> IdempotencyStore:
+    """Get the store replaying responses to requests sent with an idempotency key."""
+    return IdempotencyStore(
+        redis,
+        ttl=settings.IDEMPOTENCY_TTL,
+        lock_ttl=settings.IDEMPOTENCY_LOCK_TTL,
+        wait_timeout=settings.IDEMPOTENCY_WAIT_TIMEOUT,
+    )
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ip_address(host)
+    except ValueError:
+        return False
+    return any(address in ip_network(proxy) for proxy in settings.RATE_LIMIT_TRUSTED_PROXIES)
+
+
+def _rate_limit_subject(request: Request) -> str:
+    """Identify who a request comes from by its client address.
+
+    When the request came through proxies listed in ``RATE_LIMIT_TRUSTED_PROXIES``, the address
+    is the last one of ``X-Forwarded-For`` that no trusted proxy added; entries further left
+    were sent by the client and could be forged. User ids in the path or body are not used:
+    the API does not authenticate callers, so anyone could drain another user's bucket by
+    naming them.
+    """
+    host = request.client.host if request.client else "unknown"
+    forwarded = [
+        address.strip()
+        for header in request.headers.getlist("X-Forwarded-For")
+        for address in header.split(",")
+        if address.strip()
+    ]
+    while forwarded and _is_trusted_proxy(host):
+        host = forwarded.pop()
+    return f"client:{host}"
+
+
+async def admit_request(request: Request, redis: Redis = Depends(get_redis)) -> None:
+    """Draw from the caller's and the route's token buckets, refusing the request with 429."""
+    if not settings.RATE_LIMITING:
+        return
+    route = request.scope["route"]
+    await TokenBuckets(redis).acquire(
+        [
+            BucketLimit(
+                _rate_limit_subject(request),
+                settings.RATE_LIMIT_CLIENT_RATE,
+                settings.RATE_LIMIT_CLIENT_BURST,
+            ),
+            BucketLimit(
+                f"route:{request.method}:{route.path}",
+                settings.RATE_LIMIT_ROUTE_RATE,
+                settings.RATE_LIMIT_ROUTE_BURST,
+            ),
+        ]
+    )
+
+
+async def limit_writes() -> AsyncIterator[None]:
+    """Hold one of the process's write slots while handling a write, shedding it if none."""
+    async with write_limiter.admit():
+        yield
+
+
 async def get_user_repository(db: AsyncSession = Depends(get_db)) -> UserRepository:
     """Get user repository."""
-    return UserRepository(db)
+    return UserRepository(db, concurrency, ledger)
 
 
 async def get_item_repository(db: AsyncSession = Depends(get_db)) -> ItemRepository:
     """Get item repository."""
-    return ItemRepository(db)
+    return ItemRepository(db, concurrency)
 
 
 async def get_transaction_repository(db: AsyncSession = Depends(get_db)) -> TransactionRepository:
@@ -90,15 +474,33 @@ async def get_universe_repository(db: AsyncSession = Depends(get_db)) -> Univers
     return UniverseRepository(db)
 
 
+async def get_unit_of_work(db: AsyncSession = Depends(get_db)) -> UnitOfWork:
+    """Get the unit of work owning the request's database session."""
+    return SQLAlchemyUnitOfWork(db)
+
+
 async def get_market_service(
     users: UserRepository = Depends(get_user_repository),
     items: ItemRepository = Depends(get_item_repository),
     transactions: TransactionRepository = Depends(get_transaction_repository),
     universes: UniverseRepository = Depends(get_universe_repository),
     cache: CacheBackend = Depends(get_cache_backend),
+    unit_of_work: UnitOfWork = Depends(get_unit_of_work),
+    inventory: RedisInventory | None = Depends(get_inventory),
 ) -> MarketBackend:
     """Get market service instance."""
-    return MarketService(users, items, transactions, universes, cache)
+    return MarketService(
+        users,
+        items,
+        transactions,
+        universes,
+        cache,
+        unit_of_work,
+        purchase_batcher,
+        exchange_rates,
+        read_through,
+        inventory,
+    )
 
 
 # Dependency types
@@ -108,5 +510,8 @@ TransactionRepositoryDependency = Annotated[
     TransactionRepository, Depends(get_transaction_repository)
 ]
 UniverseRepositoryDependency = Annotated[UniverseRepository, Depends(get_universe_repository)]
+UnitOfWorkDependency = Annotated[UnitOfWork, Depends(get_unit_of_work)]
 CacheDependency = Annotated[CacheBackend, Depends(get_cache_backend)]
+IdempotencyDependency = Annotated[IdempotencyStore, Depends(get_idempotency_store)]
 MarketDependency = Annotated[MarketBackend, Depends(get_market_service)]
+TradeStreamDependency = Annotated[TradeStream, Depends(get_trade_stream)]
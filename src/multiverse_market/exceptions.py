@@ -51,3 +51,46 @@ class InsufficientStockException(InsufficientResourcesException):
     """Item has insufficient stock."""
 
     detail = "Insufficient stock"
+
+
+class StockHeldException(InsufficientStockException):
+    """Item's stock moved to Redis while a purchase was taking it from the item's row."""
+
+
+class InvalidCursorException(MultiverseMarketException):
+    """Pagination cursor is malformed or used inconsistently."""
+
+    status_code = status.HTTP_400_BAD_REQUEST
+    detail = "Invalid pagination cursor"
+
+
+class IdempotencyKeyReusedException(MultiverseMarketException):
+    """Idempotency key was already used with a different request body."""
+
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    detail = "Idempotency key was already used for a different request"
+
+
+class RequestInProgressException(MultiverseMarketException):
+    """A request with the same idempotency key is still being processed."""
+
+    status_code = status.HTTP_409_CONFLICT
+    detail = "A request with this idempotency key is still in progress"
+
+
+class ConcurrentUpdateException(MultiverseMarketException):
+    """Optimistic update kept losing to concurrent writes of the same row."""
+
+    status_code = status.HTTP_409_CONFLICT
+    detail = "The resource is being modified concurrently, please retry"
+
+
+class TooManyRequestsException(MultiverseMarketException):
+    """Request refused by admission control; the client should retry after a delay."""
+
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    detail = "Too many requests"
+
+    def __init__(self, retry_after: int, detail: str | None = None) -> None:
+        super().__init__(detail)
+        self.headers = {"Retry-After": str(retry_after)}
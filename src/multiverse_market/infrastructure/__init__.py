@@ -1,5 +1,48 @@
 """Infrastructure layer containing external service integrations."""
 
+from .admission import BucketLimit, TokenBuckets, WriteLimiter
 from .cache import RedisCache
+from .health import HealthCheck, HealthMonitor
+from .idempotency import IdempotencyStore
+from .inventory import InventoryCount, InventoryReconciler, RedisInventory, Reservation
+from .metrics import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedBlockingConnectionPool,
+    MetricsMiddleware,
+    MetricsRegistry,
+)
+from .namespaces import CATALOG, EXCHANGE_RATES, ITEMS, USERS, CacheNamespace
+from .profiling import ProfilingMiddleware, QueryStats, track_queries
+from .read_through import ReadThroughCache
+from .tiered_cache import InvalidationBus, LocalCache, RedisInvalidationBus, TieredCache
 
-__all__ = ["RedisCache"] 
\ No newline at end of file
+__all__ = [
+    "CATALOG",
+    "EXCHANGE_RATES",
+    "ITEMS",
+    "USERS",
+    "BucketLimit",
+    "CacheNamespace",
+    "HealthCheck",
+    "HealthMonitor",
+    "IdempotencyStore",
+    "InstrumentedAsyncQueuePool",
+    "InstrumentedBlockingConnectionPool",
+    "InvalidationBus",
+    "InventoryCount",
+    "InventoryReconciler",
+    "LocalCache",
+    "MetricsMiddleware",
+    "MetricsRegistry",
+    "ProfilingMiddleware",
+    "QueryStats",
+    "ReadThroughCache",
+    "RedisCache",
+    "RedisInvalidationBus",
+    "RedisInventory",
+    "Reservation",
+    "TieredCache",
+    "TokenBuckets",
+    "WriteLimiter",
+    "track_queries",
+]
@@ -0,0 +1,128 @@
+"""Admission control: token buckets shared through Redis, and load shedding of writes."""
+
+import asyncio
+import logging
+import math
+import typing as ty
+from collections.abc import AsyncIterator, Callable, Sequence
+from contextlib import asynccontextmanager
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from ..exceptions import TooManyRequestsException
+from .metrics import REQUESTS_SHED
+
+logger = logging.getLogger(__name__)
+
+# Takes a token from every bucket in KEYS, or from none of them. ARGV holds a refill rate in
+# tokens per second and a capacity per bucket. Returns 0 when admitted, otherwise the
+# milliseconds until every bucket holds a token again. Time is read from Redis so that every
+# application process refills the buckets against the same clock.
+TOKEN_BUCKET_SCRIPT = """
+redis.replicate_commands()
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1]) / 1000
+    local capacity = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'at')
+    local available = tonumber(bucket[1]) or capacity
+    local at = tonumber(bucket[2]) or now
+    available = math.min(capacity, available + math.max(0, now - at) * rate)
+    tokens[i] = available
+    if available < 1 then
+        wait = math.max(wait, math.ceil((1 - available) / rate))
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1]) / 1000
+    local capacity = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tostring(tokens[i] - 1), 'at', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate))
+end
+return 0
+"""
+
+
+class BucketLimit(ty.NamedTuple):
+    """Token bucket refilled at ``rate`` tokens per second, holding at most ``capacity``."""
+
+    key: str
+    rate: float
+    capacity: int
+
+
+class TokenBuckets:
+    """Token buckets kept in Redis, shared by every application process.
+
+    Redis errors admit the request: losing rate limiting is better than losing the API.
+    """
+
+    PREFIX = "ratelimit"
+
+    def __init__(self, redis: Redis) -> None:
+        self._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def acquire(self, limits: Sequence[BucketLimit]) -> None:
+        """Take a token from every bucket, or raise with the time until one is available."""
+        keys = [f"{self.PREFIX}:{limit.key}" for limit in limits]
+        args = [value for limit in limits for value in (limit.rate, limit.capacity)]
+        try:
+            wait_ms = await self._script(keys=keys, args=args)
+        except RedisError as e:
+            logger.warning("Rate limiting unavailable, admitting request: %s", e)
+            return
+        if wait_ms:
+            REQUESTS_SHED.inc("rate_limit")
+            raise TooManyRequestsException(retry_after=max(1, math.ceil(wait_ms / 1000)))
+
+
+class WriteLimiter:
+    """Bounds concurrent writes in this process and sheds them while the database is congested.
+
+    At most ``limit`` writes run at once, leaving the rest of the database pool to reads; a
+    write waits up to ``queue_timeout`` seconds for a slot. A write is refused at once when
+    checkouts from the pool recently waited longer than ``max_checkout_wait`` seconds.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        max_checkout_wait: float,
+        checkout_wait: Callable[[], float],
+        *,
+        queue_timeout: float,
+        retry_after: int = 1,
+    ) -> None:
+        self.limit = limit
+        self.max_checkout_wait = max_checkout_wait
+        self.queue_timeout = queue_timeout
+        self._checkout_wait = checkout_wait
+        self._retry_after = retry_after
+        self._slots = asyncio.Semaphore(limit)
+        self.in_flight = 0
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """Hold a write slot for the duration of the block, or raise if the write is shed."""
+        if self._checkout_wait() > self.max_checkout_wait:
+            REQUESTS_SHED.inc("pool_wait")
+            raise TooManyRequestsException(retry_after=self._retry_after)
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await self._slots.acquire()
+        except TimeoutError:
+            REQUESTS_SHED.inc("concurrency")
+            raise TooManyRequestsException(retry_after=self._retry_after) from None
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
@@ -1,26 +1,98 @@
 """Redis cache implementation."""
 import logging
+import typing as ty
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
 
-from ..interfaces import CacheBackend
+from ..interfaces import CacheBackend, CachePipeline
+from .metrics import CACHE_LOOKUPS
 
 logger = logging.getLogger(__name__)
 
+# Sets KEYS[1] to ARGV[3] for ARGV[2] seconds if it holds ARGV[1], or is absent when ARGV[1]
+# is empty. Returns 1 when set.
+COMPARE_AND_SETEX_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if (current or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[3], 'EX', ARGV[2])
+return 1
+"""
+
+
+class RedisCachePipeline(CachePipeline):
+    def __init__(self, pipeline: Pipeline) -> None:
+        self._pipeline = pipeline
+
+    def setex(self, key: str, expires: int, value: str) -> None:
+        self._pipeline.setex(key, expires, value)
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self._pipeline.delete(*keys)
+
+    def incr(self, key: str) -> None:
+        self._pipeline.incr(key)
+
 
 class RedisCache(CacheBackend):
     def __init__(self, redis: Redis) -> None:
         logger.debug("Initializing RedisCache")
         self._redis = redis
+        self._compare_and_setex = redis.register_script(COMPARE_AND_SETEX_SCRIPT)
 
     async def get(self, key: str) -> str | None:
-        logger.debug(f"Cache lookup for key: {key}")
-        return await self._redis.get(key)
+        logger.debug("Cache lookup for key: %s", key)
+        value = await self._redis.get(key)
+        CACHE_LOOKUPS.inc("redis", "miss" if value is None else "hit")
+        return value
 
     async def setex(self, key: str, expires: int, value: str) -> None:
-        logger.debug(f"Setting cache key: {key} with expiry: {expires}s")
+        logger.debug("Setting cache key: %s with expiry: %ss", key, expires)
         await self._redis.setex(key, expires, value)
 
     async def delete(self, key: str) -> None:
-        logger.debug(f"Deleting cache key: {key}")
-        await self._redis.delete(key) 
\ No newline at end of file
+        logger.debug("Deleting cache key: %s", key)
+        await self._redis.delete(key)
+
+    async def compare_and_setex(
+        self, key: str, expected: str | None, expires: int, value: str
+    ) -> bool:
+        logger.debug("Setting cache key: %s with expiry: %ss, if unchanged", key, expires)
+        stored = await self._compare_and_setex(keys=[key], args=[expected or "", expires, value])
+        return bool(stored)
+
+    async def incr(self, key: str) -> int:
+        logger.debug("Incrementing cache counter: %s", key)
+        return await self._redis.incr(key)
+
+    async def get_many(self, keys: ty.Sequence[str]) -> list[str | None]:
+        logger.debug("Cache lookup for %s keys", len(keys))
+        if not keys:
+            return []
+        values = await self._redis.mget(keys)
+        misses = values.count(None)
+        CACHE_LOOKUPS.inc("redis", "hit", amount=len(values) - misses)
+        CACHE_LOOKUPS.inc("redis", "miss", amount=misses)
+        return values
+
+    async def set_many(self, values: ty.Mapping[str, str], expires: int) -> None:
+        logger.debug("Setting %s cache keys with expiry: %ss", len(values), expires)
+        async with self.pipeline() as pipeline:
+            for key, value in values.items():
+                pipeline.setex(key, expires, value)
+
+    async def delete_many(self, keys: ty.Sequence[str]) -> None:
+        logger.debug("Deleting %s cache keys", len(keys))
+        if keys:
+            await self._redis.delete(*keys)
+
+    @asynccontextmanager
+    async def pipeline(self) -> AsyncIterator[CachePipeline]:
+        async with self._redis.pipeline(transaction=False) as pipeline:
+            yield RedisCachePipeline(pipeline)
+            await pipeline.execute()
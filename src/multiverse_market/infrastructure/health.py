@@ -0,0 +1,72 @@
+"""Background health checks of the services the application depends on."""
+
+import asyncio
+import logging
+import typing as ty
+from collections.abc import Awaitable, Callable, Mapping
+
+logger = logging.getLogger(__name__)
+
+HealthCheck = Callable[[], Awaitable[object]]
+
+
+class HealthMonitor:
+    """Probes external dependencies from a background task.
+
+    Each check is a coroutine function that raises when its dependency is unavailable. They
+    run every ``interval`` seconds, concurrently and bounded by ``timeout``, and the latest
+    outcome is kept in ``status`` so that callers read it without a round trip.
+    """
+
+    def __init__(
+        self,
+        checks: Mapping[str, HealthCheck],
+        *,
+        interval: float = 5.0,
+        timeout: float = 2.0,
+    ) -> None:
+        self._checks = dict(checks)
+        self.interval = interval
+        self.timeout = timeout
+        self.status: dict[str, bool] = dict.fromkeys(self._checks, False)
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def healthy(self) -> bool:
+        return all(self.status.values())
+
+    async def check(self) -> dict[str, bool]:
+        """Run every check once and record the outcome."""
+        results = await asyncio.gather(
+            *(self._probe(name, check) for name, check in self._checks.items())
+        )
+        for name, healthy in zip(self._checks, results, strict=True):
+            if healthy != self.status[name]:
+                log = logger.info if healthy else logger.warning
+                log("%s is %s", name, "healthy" if healthy else "unhealthy")
+            self.status[name] = healthy
+        return dict(self.status)
+
+    async def _probe(self, name: str, check: HealthCheck) -> bool:
+        try:
+            await asyncio.wait_for(check(), self.timeout)
+        except Exception as e:
+            logger.debug("Health check %s failed: %s", name, e)
+            return False
+        return True
+
+    def start(self) -> None:
+        """Start checking in the background."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> ty.NoReturn:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,177 @@
+"""Idempotency keys: retried requests get the first completed response instead of rerunning."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from ..exceptions import IdempotencyKeyReusedException, RequestInProgressException
+
+logger = logging.getLogger(__name__)
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Client errors that a retry may not get again, so they release the key instead of being stored
+RETRYABLE_STATUSES = frozenset({409, 429})
+
+# Sets KEYS[1] to ARGV[2] for ARGV[3] seconds, only while it still holds the claim in ARGV[1].
+# Returns 1 when set, 0 when the claim was lost.
+STORE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+# Extends the claim in ARGV[1] on KEYS[1] to ARGV[2] seconds, if it still holds it
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+return redis.call('EXPIRE', KEYS[1], ARGV[2])
+"""
+
+# Deletes KEYS[1] if it still holds the claim in ARGV[1]
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+return redis.call('DEL', KEYS[1])
+"""
+
+
+def fingerprint(request: BaseModel) -> str:
+    """Hash a request body, to tell a retry from another request reusing its key."""
+    return hashlib.sha256(request.model_dump_json().encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Stores the responses of requests sent with an idempotency key in Redis.
+
+    The first request with a key claims it and runs. Its response is stored for ``ttl``
+    seconds, client errors included, and replayed to later requests with the same key and
+    body. Duplicates arriving while it runs wait for its response rather than running
+    concurrently. A claim is released when its request fails with a server error or a
+    retryable conflict, so the client can retry. It is renewed while its request runs, and
+    expires after ``lock_ttl`` seconds if its process dies. Claims carry a unique token, and
+    only the request holding one stores its response or releases it.
+    """
+
+    PREFIX = "idempotency"
+
+    def __init__(
+        self,
+        redis: Redis,
+        *,
+        ttl: int,
+        lock_ttl: int,
+        wait_timeout: float,
+        poll_interval: float = 0.01,
+    ) -> None:
+        self._redis = redis
+        self._ttl = ttl
+        self._lock_ttl = lock_ttl
+        self._wait_timeout = wait_timeout
+        self._poll_interval = poll_interval
+        self._store_script = redis.register_script(STORE_SCRIPT)
+        self._renew_script = redis.register_script(RENEW_SCRIPT)
+        self._release_script = redis.register_script(RELEASE_SCRIPT)
+
+    async def run(
+        self, key: str, request: BaseModel, call: Callable[[], Awaitable[BaseModel]]
+    ) -> Response:
+        """Answer ``request`` from the response stored for ``key``, or by awaiting ``call``."""
+        redis_key = f"{self.PREFIX}:{key}"
+        request_hash = fingerprint(request)
+        claim = json.dumps({"fingerprint": request_hash, "token": uuid.uuid4().hex})
+        deadline = time.monotonic() + self._wait_timeout
+        while True:
+            if await self._redis.set(redis_key, claim, nx=True, ex=self._lock_ttl):
+                return await self._execute(redis_key, claim, request_hash, call)
+
+            stored = await self._redis.get(redis_key)
+            if stored is None:
+                continue  # Released or expired since the claim failed; try again
+            record = json.loads(stored)
+            if record["fingerprint"] != request_hash:
+                raise IdempotencyKeyReusedException()
+            if "status" in record:
+                logger.info("Replaying response for idempotency key %s", key)
+                return Response(
+                    record["body"],
+                    status_code=record["status"],
+                    media_type="application/json",
+                    headers={REPLAYED_HEADER: "true"},
+                )
+            if time.monotonic() >= deadline:
+                raise RequestInProgressException()
+            await asyncio.sleep(self._poll_interval)
+
+    async def _execute(
+        self,
+        redis_key: str,
+        claim: str,
+        request_hash: str,
+        call: Callable[[], Awaitable[BaseModel]],
+    ) -> Response:
+        renewal = asyncio.create_task(self._renew(redis_key, claim))
+        try:
+            result = await call()
+        except HTTPException as e:
+            if e.status_code < 500 and e.status_code not in RETRYABLE_STATUSES:
+                body = json.dumps({"detail": e.detail})
+                await self._store(redis_key, claim, request_hash, e.status_code, body)
+            else:
+                await self._release(redis_key, claim)
+            raise
+        except Exception:
+            await self._release(redis_key, claim)
+            raise
+        finally:
+            renewal.cancel()
+            await asyncio.gather(renewal, return_exceptions=True)
+        body = result.model_dump_json()
+        # The request has committed: its response is returned even if it cannot be stored
+        await self._store(redis_key, claim, request_hash, 200, body)
+        return Response(body, media_type="application/json")
+
+    async def _renew(self, redis_key: str, claim: str) -> None:
+        """Keep extending a claim while its request runs, so no duplicate runs meanwhile."""
+        while True:
+            await asyncio.sleep(self._lock_ttl / 3)
+            try:
+                renewed = await self._renew_script(keys=[redis_key], args=[claim, self._lock_ttl])
+            except RedisError as e:
+                logger.warning("Could not renew claim on %s: %s", redis_key, e)
+                continue
+            if not renewed:
+                logger.warning("Lost claim on %s while its request ran", redis_key)
+                return
+
+    async def _store(
+        self, redis_key: str, claim: str, request_hash: str, status: int, body: str
+    ) -> None:
+        record = {"fingerprint": request_hash, "status": status, "body": body}
+        try:
+            stored = await self._store_script(
+                keys=[redis_key], args=[claim, json.dumps(record), self._ttl]
+            )
+        except RedisError as e:
+            logger.error("Could not store response for %s: %s", redis_key, e)
+            return
+        if not stored:
+            logger.warning("Lost claim on %s before storing its response", redis_key)
+
+    async def _release(self, redis_key: str, claim: str) -> None:
+        try:
+            await self._release_script(keys=[redis_key], args=[claim])
+        except RedisError as e:
+            logger.warning("Could not release claim on %s: %s", redis_key, e)
@@ -0,0 +1,341 @@
+"""Stock of hot items held in Redis, reserved atomically and reconciled to the database later."""
+
+import asyncio
+import logging
+import typing as ty
+import uuid
+from collections.abc import Awaitable, Callable, Collection, Iterable, Sequence
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+
+from ..exceptions import InsufficientStockException
+from .metrics import INVENTORY_RESERVATIONS
+
+logger = logging.getLogger(__name__)
+
+# Takes ARGV[2] units of item ARGV[1] from its stock in KEYS[1] and logs the reservation, keyed
+# by ARGV[3], to the stream in KEYS[2]. Returns the stream entry id, 0 when the stock is short
+# or the item is in the set of frozen items in KEYS[3], or -1 when the item's stock is not held
+# in Redis.
+RESERVE_SCRIPT = """
+redis.replicate_commands()
+local stock = redis.call('GET', KEYS[1])
+if not stock then
+    return -1
+end
+if tonumber(stock) < tonumber(ARGV[2]) or redis.call('SISMEMBER', KEYS[3], ARGV[1]) == 1 then
+    return 0
+end
+redis.call('DECRBY', KEYS[1], ARGV[2])
+return redis.call('XADD', KEYS[2], '*', 'key', ARGV[3], 'item', ARGV[1], 'quantity', ARGV[2])
+"""
+
+# Gives the ARGV[2] units of stream entry ARGV[1] back to the stock in KEYS[1], unless the entry
+# was already acknowledged or released. The entry is acknowledged in consumer group ARGV[3] too,
+# since a deleted entry can no longer be claimed by id.
+RELEASE_SCRIPT = """
+if redis.call('XDEL', KEYS[2], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('XACK', KEYS[2], ARGV[3], ARGV[1])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('INCRBY', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+# Holds ARGV[2] units of item ARGV[1] in KEYS[1] unless it is already held, and records the
+# item in the set of held items in KEYS[2]. Returns the stock held.
+HOLD_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[2], 'NX')
+redis.call('SADD', KEYS[2], ARGV[1])
+return tonumber(redis.call('GET', KEYS[1]))
+"""
+
+# Stops holding item ARGV[1]: drops its stock from KEYS[1], and the item from the sets of held
+# and frozen items in KEYS[2] and KEYS[3]. Returns the stock that was held, or -1 when it was
+# not held.
+UNHOLD_SCRIPT = """
+local stock = redis.call('GET', KEYS[1])
+redis.call('DEL', KEYS[1])
+redis.call('SREM', KEYS[2], ARGV[1])
+redis.call('SREM', KEYS[3], ARGV[1])
+return tonumber(stock) or -1
+"""
+
+
+class Reservation(ty.NamedTuple):
+    """Units of an item taken from its stock in Redis, logged as one stream entry."""
+
+    entry_id: str
+    key: str
+    item_id: int
+    quantity: int
+
+    @property
+    def reserved_at(self) -> float:
+        """Epoch seconds at which Redis logged the reservation."""
+        return int(self.entry_id.split("-")[0]) / 1000
+
+
+class InventoryCount(ty.NamedTuple):
+    """Stock of a held item as Redis and the database see it.
+
+    Every unit taken from Redis stays logged in the stream until the database row reflects
+    it, so ``redis_stock + reserved`` matches ``database_stock`` save for the instant between
+    a reconciler commit and its acknowledgement.
+    """
+
+    item_id: int
+    redis_stock: int
+    reserved: int
+    database_stock: int
+
+    @property
+    def drift(self) -> int:
+        """Units the database holds beyond what Redis accounts for; negative when fewer."""
+        return self.database_stock - self.redis_stock - self.reserved
+
+
+class RedisInventory:
+    """Stock of designated items, held in Redis so purchases never lock the item's row.
+
+    Reservations take stock with a script that checks and decrements in one step, and log
+    themselves to a stream consumed by ``InventoryReconciler``. The stream entry is only
+    deleted once the database reflects the reservation, or when the reservation is released
+    and its stock given back.
+    """
+
+    PREFIX = "inventory"
+    GROUP = "reconciler"
+
+    def __init__(self, redis: Redis) -> None:
+        self._redis = redis
+        self._reserve = redis.register_script(RESERVE_SCRIPT)
+        self._release = redis.register_script(RELEASE_SCRIPT)
+        self._hold = redis.register_script(HOLD_SCRIPT)
+        self._unhold = redis.register_script(UNHOLD_SCRIPT)
+        self.stream = f"{self.PREFIX}:reservations"
+        self._held = f"{self.PREFIX}:held"
+        self._frozen = f"{self.PREFIX}:frozen"
+
+    def _stock_key(self, item_id: int) -> str:
+        return f"{self.PREFIX}:stock:{item_id}"
+
+    async def reserve(self, item_id: int, quantity: int) -> Reservation | None:
+        """Take ``quantity`` units of a held item, raising when its stock is short.
+
+        Returns ``None`` when the item's stock is not held in Redis.
+        """
+        key = uuid.uuid4().hex
+        entry_id = await self._reserve(
+            keys=[self._stock_key(item_id), self.stream, self._frozen],
+            args=[item_id, quantity, key],
+        )
+        if entry_id == -1:
+            return None
+        if entry_id == 0:
+            raise InsufficientStockException()
+        return Reservation(entry_id, key, item_id, quantity)
+
+    async def release(self, reservation: Reservation) -> bool:
+        """Give a reservation's stock back, unless it was already applied or released.
+
+        Redis errors are logged and swallowed: the reconciler releases the reservation once
+        its grace period is over.
+        """
+        try:
+            released = await self._release(
+                keys=[self._stock_key(reservation.item_id), self.stream],
+                args=[reservation.entry_id, reservation.quantity, self.GROUP],
+            )
+        except RedisError as e:
+            logger.warning("Could not release reservation %s: %s", reservation.key, e)
+            return False
+        if released:
+            INVENTORY_RESERVATIONS.inc("released")
+        return bool(released)
+
+    async def hold(self, item_id: int, stock: int) -> int:
+        """Start holding an item's stock in Redis; returns the stock held if it already was."""
+        return await self._hold(keys=[self._stock_key(item_id), self._held], args=[item_id, stock])
+
+    async def unhold(self, item_id: int) -> int | None:
+        """Stop holding an item's stock, returning what was left, or ``None`` if not held."""
+        stock = await self._unhold(
+            keys=[self._stock_key(item_id), self._held, self._frozen], args=[item_id]
+        )
+        return None if stock == -1 else stock
+
+    async def freeze(self, item_id: int) -> None:
+        """Refuse reservations of a held item, as if it was sold out, until it is thawed."""
+        await self._redis.sadd(self._frozen, item_id)
+
+    async def thaw(self, item_id: int) -> None:
+        """Accept reservations of a frozen item again."""
+        await self._redis.srem(self._frozen, item_id)
+
+    async def counts(self) -> dict[int, tuple[int, int]]:
+        """Get the stock and the units reserved but not yet reconciled of every held item.
+
+        Both are read in one transaction, so a reservation moving units from one to the other
+        is seen either before or after.
+        """
+        item_ids = sorted(int(item_id) for item_id in await self._redis.smembers(self._held))
+        if not item_ids:
+            return {}
+        async with self._redis.pipeline(transaction=True) as pipeline:
+            pipeline.mget([self._stock_key(item_id) for item_id in item_ids])
+            pipeline.xrange(self.stream)
+            stocks, entries = await pipeline.execute()
+        reserved = dict.fromkeys(item_ids, 0)
+        for reservation in self._parse(entries):
+            if reservation.item_id in reserved:
+                reserved[reservation.item_id] += reservation.quantity
+        return {
+            item_id: (int(stock or 0), reserved[item_id])
+            for item_id, stock in zip(item_ids, stocks, strict=True)
+        }
+
+    async def reserved(self, item_id: int) -> int:
+        """Get the units of an item reserved but not yet reconciled or released."""
+        entries = await self._redis.xrange(self.stream)
+        return sum(r.quantity for r in self._parse(entries) if r.item_id == item_id)
+
+    async def now(self) -> float:
+        """Get the epoch seconds on the Redis clock, the one stamping reservations."""
+        seconds, microseconds = await self._redis.time()
+        return seconds + microseconds / 1_000_000
+
+    async def create_group(self) -> None:
+        """Create the reconcilers' consumer group, reading the stream from its start."""
+        try:
+            await self._redis.xgroup_create(self.stream, self.GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def claim(self, consumer: str, min_idle: float, count: int) -> list[Reservation]:
+        """Take over reservations delivered to some consumer ``min_idle`` seconds ago or more.
+
+        These belong to a reconciler that crashed, or were left pending on purpose.
+        """
+        _, entries, *_ = await self._redis.xautoclaim(
+            self.stream, self.GROUP, consumer, int(min_idle * 1000), count=count
+        )
+        return self._parse(entries)
+
+    async def read(self, consumer: str, count: int) -> list[Reservation]:
+        """Read reservations never delivered to any consumer."""
+        response = await self._redis.xreadgroup(
+            self.GROUP, consumer, {self.stream: ">"}, count=count
+        )
+        return [r for _, entries in response for r in self._parse(entries)]
+
+    async def acknowledge(self, reservations: Sequence[Reservation]) -> None:
+        """Drop reservations the database reflects from the stream."""
+        if not reservations:
+            return
+        entry_ids = [r.entry_id for r in reservations]
+        async with self._redis.pipeline(transaction=True) as pipeline:
+            pipeline.xack(self.stream, self.GROUP, *entry_ids)
+            pipeline.xdel(self.stream, *entry_ids)
+            await pipeline.execute()
+        INVENTORY_RESERVATIONS.inc("applied", amount=len(reservations))
+
+    @staticmethod
+    def _parse(entries: Iterable[tuple[str | None, dict[str, str] | None]]) -> list[Reservation]:
+        # Entries deleted while pending come back without fields, or without an id at all
+        return [
+            Reservation(entry_id, fields["key"], int(fields["item"]), int(fields["quantity"]))
+            for entry_id, fields in entries
+            if entry_id and fields
+        ]
+
+
+ApplyReservations = Callable[[Collection[str]], Awaitable[Collection[str]]]
+
+
+class InventoryReconciler:
+    """Applies reservations logged by ``RedisInventory`` to the database, in the background.
+
+    Each pass hands the reservations it claimed and up to ``batch_size`` new ones to
+    ``apply``, which updates the items and records the trades of those the purchases
+    committed, and returns every key the database knows. Those are acknowledged. The others
+    stay pending: their purchase is still in flight, or failed without releasing its stock,
+    and is released once older than ``grace`` seconds by the Redis clock. Reservations a
+    consumer has held for ``claim_idle`` seconds are claimed by the next pass of any
+    reconciler, so the stream is replayed after a crash.
+    """
+
+    def __init__(
+        self,
+        inventory: RedisInventory,
+        apply: ApplyReservations,
+        *,
+        consumer: str,
+        batch_size: int = 100,
+        interval: float = 0.1,
+        claim_idle: float = 5.0,
+        grace: float = 30.0,
+    ) -> None:
+        self._inventory = inventory
+        self._apply = apply
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.interval = interval
+        self.claim_idle = claim_idle
+        self.grace = grace
+        self._task: asyncio.Task[None] | None = None
+        self._group_created = False
+
+    def start(self) -> None:
+        """Start reconciling in the background."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> int:
+        """Reconcile one batch, returning the number of reservations acknowledged."""
+        if not self._group_created:
+            await self._inventory.create_group()
+            self._group_created = True
+        try:
+            reservations = await self._inventory.claim(
+                self.consumer, self.claim_idle, self.batch_size
+            )
+            reservations += await self._inventory.read(self.consumer, self.batch_size)
+        except ResponseError as e:
+            if "NOGROUP" in str(e):
+                self._group_created = False
+            raise
+        if not reservations:
+            return 0
+
+        known = await self._apply([r.key for r in reservations])
+        await self._inventory.acknowledge([r for r in reservations if r.key in known])
+        unknown = [r for r in reservations if r.key not in known]
+        if unknown:
+            # Aged on the clock that stamped them, so this host's clock may be off
+            expired = await self._inventory.now() - self.grace
+            for reservation in unknown:
+                if reservation.reserved_at < expired:
+                    logger.warning("Releasing reservation %s, never committed", reservation.key)
+                    await self._inventory.release(reservation)
+        return len(known)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                applied = await self.run_once()
+            except Exception as e:
+                logger.warning("Reconciling reservations failed, retrying: %s", e)
+                applied = 0
+            if applied < self.batch_size:
+                await asyncio.sleep(self.interval)
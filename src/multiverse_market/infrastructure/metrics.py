@@ -0,0 +1,351 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Metrics are plain counters and bucket arrays updated from the event loop, cheap enough to
+stay on in production; nothing is computed until ``/metrics`` is scraped. Values that other
+objects already track, such as pool sizes or cache counters, are read at scrape time through
+callbacks instead of being duplicated.
+"""
+
+import abc
+import bisect
+import functools
+import inspect
+import logging
+import time
+import typing as ty
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator
+
+from redis.asyncio import BlockingConnectionPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+Labels = tuple[str, ...]
+Sample = tuple[str, Labels, float]
+
+# Seconds, from a fast cache hit to a slow query
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Labels, values: Labels) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)
+    )
+    return f"{{{pairs}}}"
+
+
+class Metric(abc.ABC):
+    """Base of a named metric family with fixed label names."""
+
+    type: ty.ClassVar[str]
+
+    def __init__(self, name: str, documentation: str, labelnames: Labels = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[Sample]:
+        """Yield the suffix, label values and value of each sample."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            names = self.labelnames + (("le",) if suffix == "_bucket" else ())
+            lines.append(f"{self.name}{suffix}{_format_labels(names, labels)} {value:g}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count per label set."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Labels = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: defaultdict[Labels, float] = defaultdict(float)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] += amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterator[Sample]:
+        for labels, value in sorted(self._values.items()):
+            yield "", labels, value
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets, per label set."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # Per label set: a count per bucket plus one for +Inf, then the sum of observations
+        self._counts: dict[Labels, list[int]] = {}
+        self._sums: defaultdict[Labels, float] = defaultdict(float)
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def count(self, *labels: str) -> int:
+        return sum(self._counts.get(labels, ()))
+
+    def samples(self) -> Iterator[Sample]:
+        bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts, strict=True):
+                cumulative += count
+                yield "_bucket", (*labels, bound), cumulative
+            yield "_sum", labels, self._sums[labels]
+            yield "_count", labels, cumulative
+
+
+class CallbackMetric(Metric):
+    """Metric whose values are read from ``collect`` at scrape time."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels,
+        collect: Callable[[], Iterable[tuple[Labels, float]]],
+        *,
+        type: str = "gauge",
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self._collect = collect
+
+    def samples(self) -> Iterator[Sample]:
+        for labels, value in self._collect():
+            yield "", labels, value
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        """Add a metric, replacing any previous metric of the same name."""
+        self._metrics[metric.name] = metric
+
+    def counter(self, name: str, documentation: str, labelnames: Labels = ()) -> Counter:
+        counter = Counter(name, documentation, labelnames)
+        self.register(counter)
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        histogram = Histogram(name, documentation, labelnames, buckets)
+        self.register(histogram)
+        return histogram
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels,
+        collect: Callable[[], Iterable[tuple[Labels, float]]],
+        *,
+        type: str = "gauge",
+    ) -> None:
+        self.register(CallbackMetric(name, documentation, labelnames, collect, type=type))
+
+    def render(self) -> str:
+        blocks = []
+        for metric in self._metrics.values():
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                logger.warning("Failed to collect metric %s: %s", metric.name, e)
+        return "\n".join(blocks) + "\n"
+
+
+# Shared by the whole process
+registry = MetricsRegistry()
+
+REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests, by route template",
+    ("method", "route", "status"),
+)
+REPOSITORY_CALL_DURATION = registry.histogram(
+    "repository_call_duration_seconds",
+    "Time spent in repository methods, including their queries",
+    ("repository", "method"),
+)
+CACHE_LOOKUPS = registry.counter(
+    "cache_lookups_total",
+    "Keys looked up in a cache backend, by result",
+    ("backend", "result"),
+)
+POOL_CHECKOUT_DURATION = registry.histogram(
+    "pool_checkout_duration_seconds",
+    "Time spent waiting for a connection from a pool, including connecting",
+    ("pool",),
+)
+REQUESTS_SHED = registry.counter(
+    "requests_shed_total",
+    "Requests refused with 429 by admission control, by reason",
+    ("reason",),
+)
+OPTIMISTIC_CONFLICTS = registry.counter(
+    "optimistic_conflicts_total",
+    "Compare-and-swap updates that lost to a concurrent write, by model and outcome",
+    ("model", "outcome"),
+)
+INVENTORY_RESERVATIONS = registry.counter(
+    "inventory_reservations_total",
+    "Reservations of stock held in Redis, by outcome: applied to the database or released",
+    ("outcome",),
+)
+
+
+class DecayingAverage:
+    """Exponentially weighted average of recent observations that fades when none arrive.
+
+    Each observation moves the average by ``weight`` of the difference, and the average halves
+    every ``half_life`` seconds without observations. It therefore recovers once what it
+    measures stops being observed, such as pool waits while requests are being shed.
+    """
+
+    def __init__(self, half_life: float, weight: float = 0.2) -> None:
+        self.half_life = half_life
+        self.weight = weight
+        self._value = 0.0
+        self._updated = time.monotonic()
+
+    def value(self) -> float:
+        elapsed = time.monotonic() - self._updated
+        return self._value * 0.5 ** (elapsed / self.half_life)
+
+    def observe(self, value: float) -> None:
+        current = self.value()
+        self._value = current + self.weight * (value - current)
+        self._updated = time.monotonic()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the duration of each HTTP request.
+
+    Requests are labelled with the template of the route that matched, such as
+    ``/api/v1/users/{user_id}``, so that label values stay bounded.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_DURATION.observe(
+                time.perf_counter() - started, scope["method"], route, str(status)
+            )
+
+
+def timed_repository_method(method: Callable[..., ty.Awaitable[ty.Any]]) -> ty.Any:
+    """Wrap a repository coroutine method to record its duration per repository class."""
+    name = method.__name__
+
+    @functools.wraps(method)
+    async def timed(self: ty.Any, *args: ty.Any, **kwargs: ty.Any) -> ty.Any:
+        started = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            REPOSITORY_CALL_DURATION.observe(
+                time.perf_counter() - started, type(self).__name__, name
+            )
+
+    return timed
+
+
+def time_repository_methods(cls: type) -> None:
+    """Time every public coroutine method defined directly on ``cls``."""
+    for name, attribute in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.iscoroutinefunction(attribute):
+            setattr(cls, name, timed_repository_method(attribute))
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """SQLAlchemy async queue pool recording how long checkouts wait.
+
+    ``recent_wait`` averages the last checkouts, for load shedding to tell a congested pool.
+    """
+
+    def __init__(self, *args: ty.Any, **kwargs: ty.Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.recent_wait = DecayingAverage(half_life=1.0)
+
+    def _do_get(self) -> ty.Any:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - started
+            POOL_CHECKOUT_DURATION.observe(elapsed, "database")
+            self.recent_wait.observe(elapsed)
+
+
+class InstrumentedBlockingConnectionPool(BlockingConnectionPool):
+    """Redis blocking pool recording how long checkouts wait."""
+
+    async def get_connection(self, *args: ty.Any, **kwargs: ty.Any) -> ty.Any:
+        started = time.perf_counter()
+        try:
+            return await super().get_connection(*args, **kwargs)
+        finally:
+            POOL_CHECKOUT_DURATION.observe(time.perf_counter() - started, "redis")
+
+    @property
+    def in_use(self) -> int:
+        return len(self._in_use_connections)
+
+    @property
+    def idle(self) -> int:
+        return len(self._available_connections)
@@ -0,0 +1,40 @@
+"""Generation-numbered cache key namespaces."""
+
+from ..interfaces import CacheBackend
+
+
+class CacheNamespace:
+    """A family of cache keys that can be invalidated as a whole with one ``INCR``.
+
+    Keys are built as ``{name}:v{generation}:{suffix}``, where the generation is a counter
+    stored under ``{name}:generation``. Bumping the counter makes every key of the previous
+    generation unreachable at once; those keys are never read again and age out through
+    their TTL, so no key listing or per-key deletes are needed.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.generation_key = f"{name}:generation"
+
+    async def generation(self, cache: CacheBackend) -> int:
+        """Get the current generation of the namespace."""
+        return int(await cache.get(self.generation_key) or 0)
+
+    def key_for(self, generation: int, suffix: str | int) -> str:
+        """Build a key for a known generation."""
+        return f"{self.name}:v{generation}:{suffix}"
+
+    async def key(self, cache: CacheBackend, suffix: str | int) -> str:
+        """Build a key in the current generation."""
+        return self.key_for(await self.generation(cache), suffix)
+
+    async def invalidate(self, cache: CacheBackend) -> int:
+        """Orphan every key in the namespace, returning the new generation."""
+        return await cache.incr(self.generation_key)
+
+
+USERS = CacheNamespace("user")
+ITEMS = CacheNamespace("item")
+EXCHANGE_RATES = CacheNamespace("exchange_rate")
+# Item listings; bumped whenever any item changes, so its generation is the catalog version
+CATALOG = CacheNamespace("catalog")
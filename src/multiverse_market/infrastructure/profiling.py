@@ -0,0 +1,200 @@
+"""On-demand accounting of SQL statements and Redis commands, and per-request profiling.
+
+``track_queries`` counts the statements and commands issued from the current task and the
+time spent in each. The hooks it relies on are installed the first time it is used and
+cost a context variable lookup per statement when nothing is being tracked.
+"""
+
+import asyncio
+import cProfile
+import hmac
+import logging
+import re
+import time
+import typing as ty
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+
+
+class QueryStats:
+    """SQL statements and Redis commands issued while tracking, with the time spent."""
+
+    def __init__(self) -> None:
+        self.statements: list[str] = []
+        self.statement_time = 0.0
+        self.commands: list[str] = []
+        self.command_time = 0.0
+
+    def server_timing(self) -> str:
+        """Render the totals as a ``Server-Timing`` header value, durations in ms."""
+        return (
+            f'sql;dur={self.statement_time * 1000:.2f};desc="{len(self.statements)} statements", '
+            f'redis;dur={self.command_time * 1000:.2f};desc="{len(self.commands)} commands"'
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"QueryStats({len(self.statements)} statements in {self.statement_time * 1000:.2f}ms, "
+            f"{len(self.commands)} commands in {self.command_time * 1000:.2f}ms)"
+        )
+
+
+_active: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+_installed = False
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Account the SQL statements and Redis commands issued within the block."""
+    _install()
+    stats = QueryStats()
+    token = _active.set(stats)
+    try:
+        yield stats
+    finally:
+        _active.reset(token)
+
+
+def _before_cursor_execute(conn: ty.Any, *_: ty.Any) -> None:
+    if _active.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: ty.Any, cursor: ty.Any, statement: str, *_: ty.Any) -> None:
+    stats = _active.get()
+    started = conn.info.get("query_started")
+    if stats is not None and started:
+        stats.statement_time += time.perf_counter() - started.pop()
+        stats.statements.append(statement)
+
+
+def _handle_error(context: ty.Any) -> None:
+    # A failed statement never reaches after_cursor_execute; account it here instead
+    if context.connection is not None and context.statement is not None:
+        _after_cursor_execute(context.connection, None, context.statement)
+
+
+def _install() -> None:
+    """Hook SQLAlchemy engines and Redis clients, once per process."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+
+    execute_command = Redis.execute_command
+    execute_pipeline = Pipeline.execute
+
+    async def tracked_execute_command(self: Redis, *args: ty.Any, **options: ty.Any) -> ty.Any:
+        stats = _active.get()
+        if stats is None:
+            return await execute_command(self, *args, **options)
+        started = time.perf_counter()
+        try:
+            return await execute_command(self, *args, **options)
+        finally:
+            stats.command_time += time.perf_counter() - started
+            stats.commands.append(str(args[0]))
+
+    async def tracked_execute_pipeline(self: Pipeline, *args: ty.Any, **kwargs: ty.Any) -> ty.Any:
+        stats = _active.get()
+        if stats is None:
+            return await execute_pipeline(self, *args, **kwargs)
+        commands = [str(command_args[0]) for command_args, _ in self.command_stack]
+        started = time.perf_counter()
+        try:
+            return await execute_pipeline(self, *args, **kwargs)
+        finally:
+            stats.command_time += time.perf_counter() - started
+            stats.commands.extend(commands)
+
+    Redis.execute_command = tracked_execute_command  # type: ignore[method-assign]
+    Pipeline.execute = tracked_execute_pipeline  # type: ignore[method-assign]
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests that opt in with the admin token.
+
+    A request sending ``X-Profile: <token>`` has its SQL and Redis work accounted and returned
+    in a ``Server-Timing`` header, next to the total time until the response started. It also
+    runs under ``cProfile``, one request at a time, with the profile written to ``directory``
+    and its file name returned in ``X-Profile-File``; read it with ``python -m pstats``. Other
+    requests served meanwhile on the same event loop show up in the profile too.
+    """
+
+    def __init__(self, app: ASGIApp, *, token: str, directory: str | Path) -> None:
+        self.app = app
+        self.token = token.encode()
+        self.directory = Path(directory)
+        self._profiling = False
+
+    def _requested(self, scope: Scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                if hmac.compare_digest(value, self.token):
+                    return True
+                logger.warning("Ignoring profiling request with an invalid token")
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = None
+        path = None
+        if not self._profiling:
+            self._profiling = True
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_")
+            path = self.directory / f"{time.time_ns()}-{scope['method']}-{slug}.prof"
+            profiler = cProfile.Profile()
+
+        started = time.perf_counter()
+        with track_queries() as stats:
+
+            async def send_with_timing(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    total = (time.perf_counter() - started) * 1000
+                    headers = list(message.get("headers", []))
+                    timing = f"{stats.server_timing()}, app;dur={total:.2f}"
+                    headers.append((b"server-timing", timing.encode()))
+                    if path is not None:
+                        headers.append((b"x-profile-file", path.name.encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                if profiler is None:
+                    await self.app(scope, receive, send_with_timing)
+                else:
+                    profiler.enable()
+                    try:
+                        await self.app(scope, receive, send_with_timing)
+                    finally:
+                        profiler.disable()
+            finally:
+                logger.info("Profiled %s %s: %r", scope["method"], scope["path"], stats)
+                if profiler is not None and path is not None:
+                    try:
+                        await asyncio.to_thread(self._dump, profiler, path)
+                    finally:
+                        self._profiling = False
+
+    def _dump(self, profiler: cProfile.Profile, path: Path) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
@@ -0,0 +1,107 @@
+"""Read-through caching of serialized query results."""
+
+import logging
+import typing as ty
+import uuid
+from collections import Counter
+from collections.abc import Awaitable, Callable
+
+from pydantic import TypeAdapter
+
+from ..interfaces import CacheBackend, CachePipeline
+
+logger = logging.getLogger(__name__)
+
+T = ty.TypeVar("T")
+
+# Invalidated entries hold a unique tombstone instead of being deleted, for longer than any
+# load takes, so a load that started before the invalidation cannot write its value back
+TOMBSTONE_PREFIX = "invalidated:"
+TOMBSTONE_TTL = 60
+
+
+class ReadThroughCache:
+    """Loads values through the cache, with a TTL and hit/miss counters per kind of entry.
+
+    One instance is shared by every request in a process so the counters describe the
+    process as a whole. A kind whose TTL is ``0`` bypasses the cache entirely. A loaded value
+    is only written back if its key still holds what the lookup found, so entries invalidated
+    with ``invalidate`` while they load are not overwritten with the stale value.
+    """
+
+    def __init__(self, ttls: ty.Mapping[str, int] | None = None, default_ttl: int = 3600) -> None:
+        self._ttls = dict(ttls or {})
+        self._default_ttl = default_ttl
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+
+    def ttl(self, kind: str) -> int:
+        return self._ttls.get(kind, self._default_ttl)
+
+    @staticmethod
+    def invalidate(pipeline: CachePipeline, *keys: str) -> None:
+        """Queue replacing entries with tombstones, which lookups treat as misses."""
+        for key in keys:
+            pipeline.setex(key, TOMBSTONE_TTL, f"{TOMBSTONE_PREFIX}{uuid.uuid4().hex}")
+
+    def hit_rate(self, kind: str) -> float:
+        """Get the fraction of lookups of ``kind`` served from the cache."""
+        lookups = self.hits[kind] + self.misses[kind]
+        return self.hits[kind] / lookups if lookups else 0.0
+
+    async def get(
+        self,
+        cache: CacheBackend,
+        kind: str,
+        key: str,
+        adapter: TypeAdapter[T],
+        load: Callable[[], Awaitable[T]],
+    ) -> T:
+        """Get the value cached under ``key``, loading and caching it on a miss.
+
+        Args:
+            cache: Cache holding the serialized value.
+            kind: Kind of entry, selecting the TTL and counters.
+            key: Cache key of the entry.
+            adapter: Adapter (de)serializing the value as JSON.
+            load: Loads the value from the source of truth. Exceptions propagate and
+                nothing is cached.
+        """
+        ttl = self.ttl(kind)
+        if ttl <= 0:
+            return await load()
+
+        cached = await self._lookup(cache, kind, key)
+        if cached is not None and not cached.startswith(TOMBSTONE_PREFIX):
+            return adapter.validate_json(cached)
+
+        value = await load()
+        await cache.compare_and_setex(key, cached, ttl, adapter.dump_json(value).decode())
+        return value
+
+    async def get_raw(
+        self, cache: CacheBackend, kind: str, key: str, load: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        """Get the encoded JSON cached under ``key`` as is, without deserializing it.
+
+        Shares entries with ``get``, so ``load`` must encode the same document.
+        """
+        ttl = self.ttl(kind)
+        if ttl <= 0:
+            return await load()
+
+        cached = await self._lookup(cache, kind, key)
+        if cached is not None and not cached.startswith(TOMBSTONE_PREFIX):
+            return cached.encode()
+
+        value = await load()
+        await cache.compare_and_setex(key, cached, ttl, value.decode())
+        return value
+
+    async def _lookup(self, cache: CacheBackend, kind: str, key: str) -> str | None:
+        cached = await cache.get(key)
+        if cached is None or cached.startswith(TOMBSTONE_PREFIX):
+            self.misses[kind] += 1
+        else:
+            self.hits[kind] += 1
+        return cached
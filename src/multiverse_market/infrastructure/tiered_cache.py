@@ -0,0 +1,231 @@
+"""Two-tier cache: a bounded in-process LRU in front of a shared remote cache."""
+
+import asyncio
+import json
+import logging
+import time
+import typing as ty
+import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from redis.asyncio import Redis
+
+from ..interfaces import CacheBackend, CachePipeline
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    """Bounded, TTL-aware LRU map kept in process memory."""
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 5.0) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        """Store a value for at most the local TTL, evicting the least recently used."""
+        ttl = self._ttl if ttl is None else min(ttl, self._ttl)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class InvalidationBus(ty.Protocol):
+    """Protocol for broadcasting invalidated keys to every process."""
+
+    async def publish(self, keys: ty.Sequence[str]) -> None:
+        """Tell other processes to evict ``keys``."""
+        ...
+
+    def subscribe(self) -> AsyncIterator[list[str]]:
+        """Yield batches of keys invalidated by other processes."""
+        ...
+
+
+class RedisInvalidationBus(InvalidationBus):
+    """Invalidation bus over a Redis pub/sub channel."""
+
+    CHANNEL = "cache:invalidate"
+
+    def __init__(self, redis: Redis, channel: str = CHANNEL) -> None:
+        self._redis = redis
+        self._channel = channel
+        self._origin = uuid.uuid4().hex
+
+    async def publish(self, keys: ty.Sequence[str]) -> None:
+        if keys:
+            message = json.dumps({"origin": self._origin, "keys": list(keys)})
+            await self._redis.publish(self._channel, message)
+
+    async def subscribe(self) -> AsyncIterator[list[str]]:
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self._channel)
+        try:
+            async for message in pubsub.listen():
+                payload = json.loads(message["data"])
+                # Our own writes already updated the local tier
+                if payload["origin"] != self._origin:
+                    yield payload["keys"]
+        finally:
+            await pubsub.unsubscribe(self._channel)
+            await pubsub.aclose()
+
+
+class _TieredCachePipeline(CachePipeline):
+    def __init__(self, remote: CachePipeline) -> None:
+        self._remote = remote
+        self.keys: list[str] = []
+
+    def setex(self, key: str, expires: int, value: str) -> None:
+        self._remote.setex(key, expires, value)
+        self.keys.append(key)
+
+    def delete(self, *keys: str) -> None:
+        self._remote.delete(*keys)
+        self.keys.extend(keys)
+
+    def incr(self, key: str) -> None:
+        self._remote.incr(key)
+        self.keys.append(key)
+
+
+class TieredCache(CacheBackend):
+    """Cache serving repeated reads from process memory.
+
+    Reads try the local LRU first and fall back to ``remote``, keeping what they fetched for
+    at most the local TTL. Every write goes to ``remote`` first and is then broadcast on
+    ``bus`` so that other processes evict their local copy; a process that loses its
+    subscription clears its local tier, since it may have missed invalidations.
+    """
+
+    def __init__(
+        self,
+        remote: CacheBackend,
+        bus: InvalidationBus,
+        *,
+        max_size: int = 10_000,
+        local_ttl: float = 5.0,
+    ) -> None:
+        logger.debug("Initializing TieredCache")
+        self._remote = remote
+        self._bus = bus
+        self.local = LocalCache(max_size=max_size, ttl=local_ttl)
+        self._listener: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        """Start evicting keys invalidated by other processes."""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for keys in self._bus.subscribe():
+                    for key in keys:
+                        self.local.delete(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Cache invalidation subscription lost: %s", e)
+            self.local.clear()
+            await asyncio.sleep(1)
+
+    async def _invalidated(self, keys: ty.Sequence[str]) -> None:
+        for key in keys:
+            self.local.delete(key)
+        await self._bus.publish(keys)
+
+    async def get(self, key: str) -> str | None:
+        self.start()
+        value = self.local.get(key)
+        if value is None:
+            value = await self._remote.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    async def setex(self, key: str, expires: int, value: str) -> None:
+        await self._remote.setex(key, expires, value)
+        await self._bus.publish([key])
+        self.local.set(key, value, expires)
+
+    async def delete(self, key: str) -> None:
+        await self._remote.delete(key)
+        await self._invalidated([key])
+
+    async def compare_and_setex(
+        self, key: str, expected: str | None, expires: int, value: str
+    ) -> bool:
+        if not await self._remote.compare_and_setex(key, expected, expires, value):
+            return False
+        await self._bus.publish([key])
+        self.local.set(key, value, expires)
+        return True
+
+    async def incr(self, key: str) -> int:
+        value = await self._remote.incr(key)
+        await self._invalidated([key])
+        return value
+
+    async def get_many(self, keys: ty.Sequence[str]) -> list[str | None]:
+        self.start()
+        values = [self.local.get(key) for key in keys]
+        missing = [index for index, value in enumerate(values) if value is None]
+        if missing:
+            fetched = await self._remote.get_many([keys[index] for index in missing])
+            for index, value in zip(missing, fetched, strict=True):
+                values[index] = value
+                if value is not None:
+                    self.local.set(keys[index], value)
+        return values
+
+    async def set_many(self, values: ty.Mapping[str, str], expires: int) -> None:
+        await self._remote.set_many(values, expires)
+        await self._bus.publish(list(values))
+        for key, value in values.items():
+            self.local.set(key, value, expires)
+
+    async def delete_many(self, keys: ty.Sequence[str]) -> None:
+        await self._remote.delete_many(keys)
+        await self._invalidated(keys)
+
+    @asynccontextmanager
+    async def pipeline(self) -> AsyncIterator[CachePipeline]:
+        async with self._remote.pipeline() as remote:
+            pipeline = _TieredCachePipeline(remote)
+            yield pipeline
+        await self._invalidated(pipeline.keys)
@@ -1,16 +1,35 @@
 import typing as ty
+from contextlib import AbstractAsyncContextManager
 
 from .models import (
+    BatchItemPurchase,
     CurrencyExchange,
     CurrencyExchangeResponse,
     ItemPurchase,
     ItemSchema,
+    TradeHistoryPage,
     TransactionSchema,
     UniverseSchema,
     UserSchema,
 )
 
 
+class CachePipeline(ty.Protocol):
+    """Protocol for a batch of cache writes sent to the backend in one round trip."""
+
+    def setex(self, key: str, expires: int, value: str) -> None:
+        """Queue setting a value with expiration."""
+        ...
+
+    def delete(self, *keys: str) -> None:
+        """Queue deleting values."""
+        ...
+
+    def incr(self, key: str) -> None:
+        """Queue incrementing an integer counter."""
+        ...
+
+
 class CacheBackend(ty.Protocol):
     """Protocol for cache operations."""
 
@@ -26,6 +45,35 @@ class CacheBackend(ty.Protocol):
         """Delete value from cache."""
         ...
 
+    async def compare_and_setex(
+        self, key: str, expected: str | None, expires: int, value: str
+    ) -> bool:
+        """Set a value with expiration only if the key still holds ``expected``.
+
+        ``None`` expects the key to be absent. Returns whether the value was set.
+        """
+        ...
+
+    async def incr(self, key: str) -> int:
+        """Atomically increment an integer counter, returning the new value."""
+        ...
+
+    async def get_many(self, keys: ty.Sequence[str]) -> list[str | None]:
+        """Get several values in one round trip, in key order."""
+        ...
+
+    async def set_many(self, values: ty.Mapping[str, str], expires: int) -> None:
+        """Set several values with the same expiration in one round trip."""
+        ...
+
+    async def delete_many(self, keys: ty.Sequence[str]) -> None:
+        """Delete several values in one round trip."""
+        ...
+
+    def pipeline(self) -> AbstractAsyncContextManager[CachePipeline]:
+        """Queue writes and send them in one round trip when the context exits cleanly."""
+        ...
+
 
 class DatabaseBackend(ty.Protocol):
     """Protocol for database operations."""
@@ -74,6 +122,10 @@ class MarketBackend(ty.Protocol):
         """Purchase an item."""
         ...
 
+    async def buy_items(self, purchase: BatchItemPurchase) -> ty.Sequence[TransactionSchema]:
+        """Purchase several items in one all-or-nothing transaction."""
+        ...
+
     async def get_user(self, user_id: int) -> UserSchema:
         """Get user details."""
         ...
@@ -82,10 +134,25 @@ class MarketBackend(ty.Protocol):
         """List available items."""
         ...
 
+    async def list_items_json(self, universe_id: int | None = None) -> bytes:
+        """List available items as an encoded JSON array."""
+        ...
+
     async def list_universes(self) -> ty.Sequence[UniverseSchema]:
         """List all universes."""
         ...
 
-    async def get_user_trades(self, user_id: int) -> ty.Sequence[TransactionSchema]:
-        """Get user's trade history."""
+    async def list_universes_json(self) -> bytes:
+        """List all universes as an encoded JSON array."""
+        ...
+
+    async def get_user_trades(
+        self,
+        user_id: int,
+        *,
+        limit: int = 50,
+        before: str | None = None,
+        after: str | None = None,
+    ) -> TradeHistoryPage:
+        """Get one page of a user's trade history, newest first."""
         ...
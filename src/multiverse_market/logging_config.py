@@ -1,8 +1,15 @@
+import atexit
 import logging
 import logging.config
 import os
+import random
 import sys
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from queue import SimpleQueue
+
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -48,6 +55,68 @@ LOGGING_CONFIG = {
 }
 
 
-def setup_logging():
-    """Initialize logging configuration"""
+# Whether the request being handled keeps its info and debug records; True outside requests
+_request_sampled: ContextVar[bool] = ContextVar("request_sampled", default=True)
+
+_listener: QueueListener | None = None
+
+
+class RequestSampler(logging.Filter):
+    """Drops records below WARNING logged while handling a request that was not sampled."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or _request_sampled.get()
+
+
+class LogSamplingMiddleware:
+    """ASGI middleware keeping the info and debug records of a ``rate`` fraction of requests.
+
+    Requests are sampled as a whole, so a kept request has all of its records. Warnings and
+    errors are always kept.
+    """
+
+    def __init__(self, app: ASGIApp, rate: float = 1.0) -> None:
+        self.app = app
+        self.rate = rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.rate >= 1:
+            await self.app(scope, receive, send)
+            return
+        token = _request_sampled.set(random.random() < self.rate)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_sampled.reset(token)
+
+
+def setup_logging() -> None:
+    """Initialize logging so that console and file I/O happen off the event loop.
+
+    The configured handlers are moved behind a ``QueueListener`` thread; loggers only put
+    records on its queue. The listener is stopped, flushing pending records, at exit.
+    """
+    global _listener
+    shutdown_logging()
     logging.config.dictConfig(LOGGING_CONFIG)
+
+    root = logging.getLogger()
+    sinks = list(root.handlers)
+    queue_handler = QueueHandler(SimpleQueue())
+    queue_handler.addFilter(RequestSampler())
+    for logger in (root, logging.getLogger("multiverse_market")):
+        for sink in sinks:
+            logger.removeHandler(sink)
+        logger.addHandler(queue_handler)
+
+    _listener = QueueListener(queue_handler.queue, *sinks, respect_handler_level=True)
+    _listener.start()
+
+
+@atexit.register
+def shutdown_logging() -> None:
+    """Write out queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
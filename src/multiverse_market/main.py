@@ -1,12 +1,15 @@
 import logging
 
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from .api import router
 from .config import settings
+from .dependencies import health_monitor, is_ready, lifespan
 from .exceptions import MultiverseMarketException
-from .logging_config import setup_logging
+from .infrastructure import MetricsMiddleware, ProfilingMiddleware
+from .infrastructure.metrics import registry
+from .logging_config import LogSamplingMiddleware, setup_logging
 
 # Initialize logging
 setup_logging()
@@ -17,14 +20,23 @@ app = FastAPI(
     description="A marketplace system for trading across multiple universes",
     version=settings.VERSION,
     debug=settings.DEBUG,
+    lifespan=lifespan,
 )
+app.add_middleware(LogSamplingMiddleware, rate=settings.LOG_SAMPLE_RATE)
+app.add_middleware(MetricsMiddleware)
+if settings.PROFILING_TOKEN:
+    app.add_middleware(
+        ProfilingMiddleware, token=settings.PROFILING_TOKEN, directory=settings.PROFILE_DIR
+    )
 
 
 @app.exception_handler(MultiverseMarketException)
 async def market_exception_handler(_: Request, exc: MultiverseMarketException):
     """Handle market-specific exceptions."""
-    logger.info(f"Handling market exception: {exc.detail}")
-    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+    logger.info("Handling market exception: %s", exc.detail)
+    return JSONResponse(
+        status_code=exc.status_code, content={"detail": exc.detail}, headers=exc.headers
+    )
 
 
 app.include_router(router, prefix=settings.API_V1_PREFIX)
@@ -42,3 +54,25 @@ async def read_root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+
+@app.get("/health/live")
+async def liveness_check():
+    """Report that the process is up, whether or not it can serve traffic yet."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Report whether the process is warm and its dependencies are healthy."""
+    ready = is_ready()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "ready" if ready else "not ready", "checks": health_monitor.status},
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Expose process metrics in the Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
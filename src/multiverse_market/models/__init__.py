@@ -1,13 +1,27 @@
-from .entities import Base, Item, Transaction, Universe, User
-from .requests import CurrencyExchange, ItemPurchase
-from .responses import CurrencyExchangeResponse
+from .entities import (
+    Base,
+    Item,
+    ItemStockShard,
+    LedgerEntry,
+    LedgerReason,
+    StockReservation,
+    Transaction,
+    Universe,
+    User,
+)
+from .requests import BatchItemPurchase, CurrencyExchange, ItemPurchase, PurchaseLine
+from .responses import CurrencyExchangeResponse, TradeHistoryPage
 from .schemas import ItemSchema, TransactionSchema, UniverseSchema, UserSchema
 
 __all__ = [
     # Entities
     "Base",
     "User",
+    "LedgerEntry",
+    "LedgerReason",
     "Item",
+    "ItemStockShard",
+    "StockReservation",
     "Transaction",
     "Universe",
     # Schemas
@@ -18,6 +32,9 @@ __all__ = [
     # Request Models
     "CurrencyExchange",
     "ItemPurchase",
+    "PurchaseLine",
+    "BatchItemPurchase",
     # Response Models
     "CurrencyExchangeResponse",
+    "TradeHistoryPage",
 ]
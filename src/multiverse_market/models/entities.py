@@ -1,7 +1,9 @@
+import enum
 from datetime import UTC, datetime
+from typing import Any, ClassVar
 
-from sqlalchemy import DateTime, Float, ForeignKey, Integer
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy import DateTime, Float, ForeignKey, Index, Integer, String, false
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
 class Base(DeclarativeBase):
@@ -22,19 +24,103 @@ class User(Base):
     username: Mapped[str]
     universe_id: Mapped[int] = mapped_column(ForeignKey("universes.id"))
     balance: Mapped[float] = mapped_column(default=0.0)
+    # Bumped by every write, for optimistic concurrency control
+    version: Mapped[int] = mapped_column(default=0, server_default="0")
+    # Last LedgerEntry folded into balance, which is then a snapshot the later entries add to
+    balance_entry_id: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    __mapper_args__: ClassVar[dict[str, Any]] = {"version_id_col": version}
+
+
+class LedgerReason(enum.StrEnum):
+    """Why a ledger entry changed a balance."""
+
+    PURCHASE = "purchase"
+    EXCHANGE = "exchange"
+    ADJUSTMENT = "adjustment"
+
+
+class LedgerEntry(Base):
+    """Change to a user's balance, appended and never rewritten.
+
+    Links the transaction it paid for, when it paid for exactly one that is recorded.
+    """
+
+    __tablename__ = "ledger_entries"
+    __table_args__ = (Index("ix_ledger_entries_user_id_id", "user_id", "id"),)
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    universe_id: Mapped[int] = mapped_column(ForeignKey("universes.id"))
+    delta: Mapped[float] = mapped_column(Float)
+    reason: Mapped[str] = mapped_column(String(16))
+    transaction_id: Mapped[int | None] = mapped_column(ForeignKey("transactions.id"))
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(UTC)
+    )
+
+    transaction: Mapped["Transaction | None"] = relationship()
 
 
 class Item(Base):
     __tablename__ = "items"
+    __table_args__ = (Index("ix_items_universe_id", "universe_id"),)
 
     name: Mapped[str]
     universe_id: Mapped[int] = mapped_column(ForeignKey("universes.id"))
     price: Mapped[float]
     stock: Mapped[int]
+    # Bumped by every write, for optimistic concurrency control
+    version: Mapped[int] = mapped_column(default=0, server_default="0")
+    # Number of ItemStockShard rows holding the stock instead of this row; 0 when unsharded
+    stock_shards: Mapped[int] = mapped_column(default=0, server_default="0")
+    # Whether the stock is held in Redis, where purchases reserve it instead of taking it here
+    stock_held: Mapped[bool] = mapped_column(default=False, server_default=false())
+
+    __mapper_args__: ClassVar[dict[str, Any]] = {"version_id_col": version}
+
+
+class ItemStockShard(Base):
+    """Part of the stock of a sharded item, so concurrent purchases lock different rows."""
+
+    __tablename__ = "item_stock_shards"
+    __table_args__ = (
+        Index("ix_item_stock_shards_item_id_shard", "item_id", "shard", unique=True),
+    )
+
+    item_id: Mapped[int] = mapped_column(ForeignKey("items.id"))
+    shard: Mapped[int]
+    stock: Mapped[int]
+
+
+class StockReservation(Base):
+    """Purchase of an item whose stock is held in Redis, recorded when the purchase commits.
+
+    The reconciler takes its quantity from the item's row and inserts its ``Transaction``
+    later, marking it applied; ``key`` matches the reservation logged in Redis.
+    """
+
+    __tablename__ = "stock_reservations"
+    __table_args__ = (Index("ix_stock_reservations_key", "key", unique=True),)
+
+    key: Mapped[str] = mapped_column(String(32))
+    buyer_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    seller_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    item_id: Mapped[int] = mapped_column(ForeignKey("items.id"))
+    amount: Mapped[float] = mapped_column(Float)
+    quantity: Mapped[int]
+    from_universe_id: Mapped[int] = mapped_column(ForeignKey("universes.id"))
+    to_universe_id: Mapped[int] = mapped_column(ForeignKey("universes.id"))
+    transaction_time: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    applied: Mapped[bool] = mapped_column(default=False, server_default=false())
 
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Serve each side of the trade history UNION with a single index range scan
+        Index("ix_transactions_buyer_id_time", "buyer_id", "transaction_time", "id"),
+        Index("ix_transactions_seller_id_time", "seller_id", "transaction_time", "id"),
+    )
 
     buyer_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
     seller_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
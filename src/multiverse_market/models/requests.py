@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 
 
 class CurrencyExchange(BaseModel):
@@ -12,3 +12,20 @@ class ItemPurchase(BaseModel):
     buyer_id: int
     item_id: int
     quantity: int
+
+
+class PurchaseLine(BaseModel):
+    item_id: int
+    quantity: int = Field(gt=0)
+
+
+class BatchItemPurchase(BaseModel):
+    buyer_id: int
+    lines: list[PurchaseLine] = Field(min_length=1)
+
+    @field_validator("lines")
+    @classmethod
+    def _unique_items(cls, lines: list[PurchaseLine]) -> list[PurchaseLine]:
+        if len({line.item_id for line in lines}) != len(lines):
+            raise ValueError("Each item may only appear once per batch")
+        return lines
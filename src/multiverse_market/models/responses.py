@@ -1,5 +1,7 @@
 from pydantic import BaseModel
 
+from .schemas import TransactionSchema
+
 
 class CurrencyExchangeResponse(BaseModel):
     """Response model for currency exchange operations."""
@@ -8,3 +10,11 @@ class CurrencyExchangeResponse(BaseModel):
     from_universe_id: int
     to_universe_id: int
     exchange_rate: float
+
+
+class TradeHistoryPage(BaseModel):
+    """One page of a user's trade history, newest first."""
+
+    trades: list[TransactionSchema]
+    next_cursor: str | None = None  # Pass as ``before`` to get older trades
+    prev_cursor: str | None = None  # Pass as ``after`` to get newer trades
@@ -1,14 +1,21 @@
-from .base import Repository, SQLAlchemyRepository
+from .base import ConcurrencyControl, ConcurrencyStrategy, Repository, SQLAlchemyRepository
 from .item import ItemRepository
-from .transaction import TransactionRepository
+from .transaction import TradeKey, TransactionRepository
+from .unit_of_work import SQLAlchemyUnitOfWork, UnitOfWork
 from .universe import UniverseRepository
-from .user import UserRepository
+from .user import BalanceLedger, UserRepository
 
 __all__ = [
     "UserRepository",
+    "BalanceLedger",
     "ItemRepository",
     "TransactionRepository",
+    "TradeKey",
     "UniverseRepository",
     "Repository",
     "SQLAlchemyRepository",
+    "ConcurrencyControl",
+    "ConcurrencyStrategy",
+    "UnitOfWork",
+    "SQLAlchemyUnitOfWork",
 ]
@@ -1,10 +1,15 @@
+import asyncio
+import enum
 import logging
+import random
 import typing as ty
 from collections.abc import Sequence
 
-from sqlalchemy import select
+from sqlalchemy import ColumnElement, Select, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from multiverse_market.exceptions import ConcurrentUpdateException
+from multiverse_market.infrastructure.metrics import OPTIMISTIC_CONFLICTS, time_repository_methods
 from multiverse_market.models.entities import Base
 
 logger = logging.getLogger(__name__)
@@ -12,6 +17,26 @@ logger = logging.getLogger(__name__)
 T = ty.TypeVar("T", bound=Base)
 
 
+class ConcurrencyStrategy(enum.StrEnum):
+    """How a conditional update guards against concurrent writers of the same row."""
+
+    ATOMIC = "atomic"  # check and write in one UPDATE ... WHERE ... RETURNING
+    PESSIMISTIC = "pessimistic"  # SELECT ... FOR UPDATE, then write
+    OPTIMISTIC = "optimistic"  # read, then compare-and-swap on the row version
+
+
+class ConcurrencyControl(ty.NamedTuple):
+    """Conditional update strategy, with the retry policy of the optimistic one.
+
+    A compare-and-swap that loses to a concurrent write is retried up to ``max_retries``
+    times, after sleeping a random delay of up to ``backoff`` seconds, doubled per retry.
+    """
+
+    strategy: ConcurrencyStrategy = ConcurrencyStrategy.ATOMIC
+    max_retries: int = 5
+    backoff: float = 0.005
+
+
 class Repository(ty.Protocol[T]):
     """Base repository protocol."""
 
@@ -19,16 +44,24 @@ class Repository(ty.Protocol[T]):
         """Get entity by ID."""
         ...
 
+    async def get_many(self, ids: ty.Iterable[int]) -> Sequence[T]:
+        """Get several entities by ID in one query."""
+        ...
+
     async def list(self, **filters) -> Sequence[T]:
         """List entities with optional filters."""
         ...
 
-    async def add(self, entity: T) -> T:
-        """Add new entity."""
+    async def list_rows(self, fields: ty.Iterable[str], **filters) -> Sequence[dict[str, ty.Any]]:
+        """List plain column values, with optional filters."""
+        ...
+
+    async def add(self, entity: T, *, refresh: bool = False) -> T:
+        """Add new entity, flushing it without committing."""
         ...
 
-    async def update(self, entity: T) -> T:
-        """Update existing entity."""
+    async def update(self, entity: T, *, refresh: bool = False) -> T:
+        """Flush changes to an existing entity without committing."""
         ...
 
     async def delete(self, id: int) -> None:
@@ -37,53 +70,181 @@ class Repository(ty.Protocol[T]):
 
 
 class SQLAlchemyRepository(ty.Generic[T]):
-    """Base SQLAlchemy repository implementation."""
-
-    def __init__(self, session: AsyncSession, model: type[T]):
-        logger.debug(f"Initializing {self.__class__.__name__}")
+    """Base SQLAlchemy repository implementation.
+
+    Writes are flushed, never committed; committing is left to the unit of work. Pass
+    ``refresh=True`` to reload server-generated state after a write. The duration of every
+    public method, in subclasses too, is recorded in the repository metrics. Conditional
+    updates of versioned models follow the repository's ``ConcurrencyControl``.
+    """
+
+    def __init_subclass__(cls, **kwargs: ty.Any) -> None:
+        super().__init_subclass__(**kwargs)
+        time_repository_methods(cls)
+
+    def __init__(
+        self,
+        session: AsyncSession,
+        model: type[T],
+        concurrency: ConcurrencyControl = ConcurrencyControl(),
+    ):
+        logger.debug("Initializing %s", self.__class__.__name__)
         self._session = session
         self._model = model
+        self._concurrency = concurrency
 
     async def get(self, id: int) -> T | None:
-        logger.debug(f"Getting {self._model.__name__} with id {id}")
+        logger.debug("Getting %s with id %s", self._model.__name__, id)
         result = await self._session.execute(select(self._model).where(self._model.id == id))
         entity = result.scalar_one_or_none()
         if entity is None:
-            logger.debug(f"{self._model.__name__} with id {id} not found")
+            logger.debug("%s with id %s not found", self._model.__name__, id)
         return entity
 
+    async def get_many(self, ids: ty.Iterable[int]) -> Sequence[T]:
+        ids = set(ids)
+        logger.debug("Getting %s %s records by id", len(ids), self._model.__name__)
+        result = await self._session.execute(select(self._model).where(self._model.id.in_(ids)))
+        return result.scalars().all()
+
     async def list(self, **filters) -> Sequence[T]:
-        logger.debug(f"Listing {self._model.__name__} with filters: {filters}")
+        logger.debug("Listing %s with filters: %s", self._model.__name__, filters)
         query = select(self._model)
         for key, value in filters.items():
             if value is not None:
                 query = query.where(getattr(self._model, key) == value)
         result = await self._session.execute(query)
         entities = result.scalars().all()
-        logger.debug(f"Found {len(entities)} {self._model.__name__} records")
+        logger.debug("Found %s %s records", len(entities), self._model.__name__)
         return entities
 
-    async def add(self, entity: T) -> T:
-        logger.debug(f"Adding new {self._model.__name__}")
+    async def list_rows(self, fields: ty.Iterable[str], **filters) -> Sequence[dict[str, ty.Any]]:
+        """List the given columns as plain dicts, skipping ORM instance construction."""
+        logger.debug("Listing %s rows with filters: %s", self._model.__name__, filters)
+        result = await self._session.execute(self._list_rows_query(fields, **filters))
+        return [dict(row) for row in result.mappings()]
+
+    def _list_rows_query(self, fields: ty.Iterable[str], **filters) -> Select:
+        query = select(*(getattr(self._model, field) for field in fields))
+        for key, value in filters.items():
+            if value is not None:
+                query = query.where(getattr(self._model, key) == value)
+        return query
+
+    async def add(self, entity: T, *, refresh: bool = False) -> T:
+        logger.debug("Adding new %s", self._model.__name__)
         self._session.add(entity)
-        await self._session.commit()
-        await self._session.refresh(entity)
-        logger.debug(f"Added {self._model.__name__} with id {entity.id}")
+        await self._session.flush()
+        if refresh:
+            await self._session.refresh(entity)
+        logger.debug("Added %s with id %s", self._model.__name__, entity.id)
         return entity
 
-    async def update(self, entity: T) -> T:
-        logger.debug(f"Updating {self._model.__name__} with id {entity.id}")
-        await self._session.commit()
-        await self._session.refresh(entity)
-        logger.debug(f"Updated {self._model.__name__} with id {entity.id}")
+    async def update(self, entity: T, *, refresh: bool = False) -> T:
+        logger.debug("Updating %s with id %s", self._model.__name__, entity.id)
+        await self._session.flush()
+        if refresh:
+            await self._session.refresh(entity)
+        logger.debug("Updated %s with id %s", self._model.__name__, entity.id)
         return entity
 
     async def delete(self, id: int) -> None:
-        logger.debug(f"Deleting {self._model.__name__} with id {id}")
+        logger.debug("Deleting %s with id %s", self._model.__name__, id)
         entity = await self.get(id)
         if entity:
             await self._session.delete(entity)
-            await self._session.commit()
-            logger.debug(f"Deleted {self._model.__name__} with id {id}")
+            await self._session.flush()
+            logger.debug("Deleted %s with id %s", self._model.__name__, id)
         else:
-            logger.warning(f"{self._model.__name__} with id {id} not found for deletion")
+            logger.warning("%s with id %s not found for deletion", self._model.__name__, id)
+
+    async def _take(
+        self, id: int, field: str, amount: float, *criteria: ColumnElement[bool]
+    ) -> T | None:
+        """Subtract ``amount`` from a column of a versioned row, if the column covers it.
+
+        Returns the updated entity, or ``None`` when the row does not exist, does not match
+        ``criteria`` or holds less than ``amount``; rows that do not match are never locked.
+        Every strategy bumps the row version, so processes running different strategies
+        against the same rows stay correct.
+        """
+        strategy = self._concurrency.strategy
+        if strategy is ConcurrencyStrategy.PESSIMISTIC:
+            return await self._take_locked(id, field, amount, *criteria)
+        if strategy is ConcurrencyStrategy.OPTIMISTIC:
+            return await self._take_optimistic(id, field, amount, *criteria)
+
+        model: ty.Any = self._model
+        column = getattr(model, field)
+        result = await self._session.execute(
+            update(model)
+            .where(model.id == id, column >= amount, *criteria)
+            .values({field: column - amount, "version": model.version + 1})
+            .returning(model)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one_or_none()
+
+    async def _take_locked(
+        self, id: int, field: str, amount: float, *criteria: ColumnElement[bool]
+    ) -> T | None:
+        result = await self._session.execute(
+            select(self._model)
+            .where(self._model.id == id, *criteria)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        entity = result.scalar_one_or_none()
+        if entity is None or getattr(entity, field) < amount:
+            return None
+        # The row lock holds off other writers; the flush still checks and bumps the version
+        setattr(entity, field, getattr(entity, field) - amount)
+        await self._session.flush()
+        return entity
+
+    async def _take_optimistic(
+        self, id: int, field: str, amount: float, *criteria: ColumnElement[bool]
+    ) -> T | None:
+        model: ty.Any = self._model
+        control = self._concurrency
+        for attempt in range(control.max_retries + 1):
+            result = await self._session.execute(
+                select(getattr(model, field), model.version).where(model.id == id, *criteria)
+            )
+            row = result.one_or_none()
+            if row is None or row[0] < amount:
+                return None
+            value, version = row
+            entity = await self._swap(id, field, value - amount, version)
+            if entity is not None:
+                return entity
+
+            if attempt == control.max_retries:
+                break
+            OPTIMISTIC_CONFLICTS.inc(model.__name__, "retried")
+            logger.debug("%s %s changed concurrently, retrying", model.__name__, id)
+            await asyncio.sleep(random.uniform(0, control.backoff * 2**attempt))
+
+        OPTIMISTIC_CONFLICTS.inc(model.__name__, "aborted")
+        logger.warning(
+            "Giving up on %s %s after %s conflicting updates",
+            model.__name__,
+            id,
+            control.max_retries + 1,
+        )
+        raise ConcurrentUpdateException()
+
+    async def _swap(self, id: int, field: str, value: float, version: int) -> T | None:
+        """Set a column of a row still at ``version``, bumping it; ``None`` if it moved on."""
+        model: ty.Any = self._model
+        result = await self._session.execute(
+            update(model)
+            .where(model.id == id, model.version == version)
+            .values({field: value, "version": version + 1})
+            .returning(model)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one_or_none()
+
+
+time_repository_methods(SQLAlchemyRepository)
@@ -1,23 +1,387 @@
 import logging
+import random
+import typing as ty
 
+from sqlalchemy import Integer, Select, case, column, delete, func, insert, select, update, values
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
-from ..models.entities import Item
-from .base import SQLAlchemyRepository
+from ..models.entities import Item, ItemStockShard, StockReservation
+from .base import ConcurrencyControl, SQLAlchemyRepository
 
 logger = logging.getLogger(__name__)
 
+# Stock of an item as reported: its own row, plus the sum of its shards when it is sharded
+TOTAL_STOCK = case(
+    (
+        Item.stock_shards > 0,
+        Item.stock
+        + select(func.coalesce(func.sum(ItemStockShard.stock), 0))
+        .where(ItemStockShard.item_id == Item.id)
+        .scalar_subquery(),
+    ),
+    else_=Item.stock,
+)
+
 
 class ItemRepository(SQLAlchemyRepository[Item]):
-    def __init__(self, session: AsyncSession):
-        super().__init__(session, Item)
+    """Items, whose stock may be sharded to spread purchases of a hot item over several rows.
+
+    The stock of a sharded item lives in its ``ItemStockShard`` rows, and its own ``stock``
+    column stays at 0. Items loaded through the repository and listed rows report the total.
+    Purchases of items whose stock is held in Redis are recorded as ``StockReservation`` rows,
+    and taken from the item's stock when they are applied.
+    """
+
+    def __init__(
+        self, session: AsyncSession, concurrency: ConcurrencyControl = ConcurrencyControl()
+    ):
+        super().__init__(session, Item, concurrency)
+
+    async def get(self, id: int) -> Item | None:
+        item = await super().get(id)
+        if item is not None:
+            await self._load_total_stock([item])
+        return item
+
+    async def get_many(self, ids: ty.Iterable[int]) -> ty.Sequence[Item]:
+        items = await super().get_many(ids)
+        await self._load_total_stock(items)
+        return items
+
+    async def list(self, **filters) -> ty.Sequence[Item]:
+        items = await super().list(**filters)
+        await self._load_total_stock(items)
+        return items
+
+    def _list_rows_query(self, fields: ty.Iterable[str], **filters) -> Select:
+        fields = list(fields)
+        query = super()._list_rows_query(fields, **filters)
+        if "stock" not in fields:
+            return query
+        columns = [
+            TOTAL_STOCK.label("stock") if field == "stock" else getattr(Item, field)
+            for field in fields
+        ]
+        return query.with_only_columns(*columns)
+
+    async def _load_total_stock(self, items: ty.Iterable[Item]) -> None:
+        """Report the total stock of sharded items, without marking them as modified."""
+        sharded = {item.id: item for item in items if item.stock_shards}
+        if not sharded:
+            return
+        result = await self._session.execute(
+            select(Item.id, TOTAL_STOCK).where(Item.id.in_(sharded))
+        )
+        for item_id, stock in result.all():
+            set_committed_value(sharded[item_id], "stock", stock)
 
     async def update_stock(self, item_id: int, new_stock: int) -> None:
         item = await self.get(item_id)
         if item:
-            logger.debug(f"Updating stock for item {item_id} from {item.stock} to {new_stock}")
+            logger.debug("Updating stock for item %s from %s to %s", item_id, item.stock, new_stock)
+            if item.stock_shards:
+                # Gather the new stock in the item's row, then spread it over the shards again
+                await self._session.execute(
+                    update(ItemStockShard)
+                    .where(ItemStockShard.item_id == item_id)
+                    .values(stock=0)
+                    .execution_options(synchronize_session=False)
+                )
             item.stock = new_stock
             await self.update(item)
-            logger.debug(f"Stock updated for item {item_id}")
+            if item.stock_shards:
+                await self.shard_stock(item_id)
+            logger.debug("Stock updated for item %s", item_id)
         else:
-            logger.warning(f"Item {item_id} not found for stock update")
+            logger.warning("Item %s not found for stock update", item_id)
+
+    async def decrement_stock(self, item_id: int, quantity: int) -> Item | None:
+        """Take ``quantity`` units from an item's stock, unless it would go negative.
+
+        The check and the write cannot race with concurrent purchases, whichever concurrency
+        strategy the repository uses. Sharded items are decremented through their shards
+        without touching, or locking, the item's row. Returns the updated item, or ``None``
+        when the item does not exist, does not have enough stock or has its stock held in Redis.
+        """
+        logger.debug("Decrementing stock for item %s by %s", item_id, quantity)
+        item = await self._take(
+            item_id, "stock", quantity, Item.stock_shards == 0, Item.stock_held.is_(False)
+        )
+        if item is None:
+            # The item is missing, short, held, or sharded; only in the last case is there
+            # more to try
+            result = await self._session.execute(
+                select(Item).where(
+                    Item.id == item_id, Item.stock_shards > 0, Item.stock_held.is_(False)
+                )
+            )
+            item = result.scalar_one_or_none()
+            if item is not None and not await self._take_from_shards(
+                item_id, item.stock_shards, quantity
+            ):
+                item = None
+        if item is None:
+            logger.debug("Stock decrement rejected for item %s", item_id)
+        return item
+
+    async def mark_stock_held(self, item_id: int, held: bool) -> Item | None:
+        """Mark whether an item's stock is held in Redis, where purchases must reserve it.
+
+        Returns the item, or ``None`` when it does not exist.
+        """
+        logger.debug("Marking stock of item %s as %s", item_id, "held" if held else "not held")
+        result = await self._session.execute(
+            update(Item)
+            .where(Item.id == item_id)
+            .values(stock_held=held, version=Item.version + 1)
+            .returning(Item)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one_or_none()
+
+    async def restock(self, item_id: int, quantity: int) -> None:
+        """Put ``quantity`` units taken with ``decrement_stock`` back into an item's stock.
+
+        The units of a sharded item go to its first shard.
+        """
+        logger.debug("Restocking item %s with %s units", item_id, quantity)
+        result = await self._session.execute(
+            update(Item)
+            .where(Item.id == item_id, Item.stock_shards == 0)
+            .values(stock=Item.stock + quantity, version=Item.version + 1)
+            .returning(Item.id)
+            .execution_options(synchronize_session=False)
+        )
+        if result.scalar_one_or_none() is None:
+            await self._session.execute(
+                update(ItemStockShard)
+                .where(ItemStockShard.item_id == item_id, ItemStockShard.shard == 0)
+                .values(stock=ItemStockShard.stock + quantity)
+                .execution_options(synchronize_session=False)
+            )
+
+    async def _take_from_shards(self, item_id: int, shards: int, quantity: int) -> bool:
+        """Take stock from a random shard, spilling over to the others if none can cover it.
+
+        The common case is a single conditional ``UPDATE`` of one shard picked among those that
+        looked able to cover the quantity, so concurrent buyers mostly lock different rows.
+        Otherwise all the item's shards are locked, in order, to take it from several of them.
+        """
+        candidate = (
+            select(ItemStockShard.id)
+            .where(ItemStockShard.item_id == item_id, ItemStockShard.stock >= quantity)
+            .order_by(func.random())
+            .limit(1)
+            .scalar_subquery()
+        )
+        # An UPDATE whose row turns out short after waiting for it keeps the row locked. The
+        # savepoint releases it on a miss, so spilling over starts without holding any shard
+        # and cannot deadlock with another buyer locking them in order.
+        savepoint = await self._session.begin_nested()
+        result = await self._session.execute(
+            update(ItemStockShard)
+            .where(ItemStockShard.id == candidate, ItemStockShard.stock >= quantity)
+            .values(stock=ItemStockShard.stock - quantity)
+            .returning(ItemStockShard.shard)
+            .execution_options(synchronize_session=False)
+        )
+        first = result.scalar_one_or_none()
+        if first is not None:
+            await savepoint.commit()
+            return True
+        await savepoint.rollback()
+
+        result = await self._session.execute(
+            select(ItemStockShard.shard, ItemStockShard.stock)
+            .where(ItemStockShard.item_id == item_id)
+            .order_by(ItemStockShard.shard)
+            .with_for_update()
+        )
+        stocks: dict[int, int] = dict(result.tuples().all())
+        if sum(stocks.values()) < quantity:
+            return False
+        logger.debug("Spilling purchase of %s units of item %s over shards", quantity, item_id)
+        takes: dict[int, int] = {}
+        remaining = quantity
+        first = random.randrange(shards)
+        for shard in sorted(stocks, key=lambda shard: (shard - first) % shards):
+            take = min(stocks[shard], remaining)
+            if take:
+                takes[shard] = take
+                remaining -= take
+            if not remaining:
+                break
+        lines = (
+            values(column("shard", Integer), column("quantity", Integer), name="takes")
+            .data(sorted(takes.items()))
+            .cte("takes")
+        )
+        await self._session.execute(
+            update(ItemStockShard)
+            .where(ItemStockShard.item_id == item_id, ItemStockShard.shard == lines.c.shard)
+            .values(stock=ItemStockShard.stock - lines.c.quantity)
+            .execution_options(synchronize_session=False)
+        )
+        return True
+
+    async def shard_stock(self, item_id: int, shards: int | None = None) -> Item | None:
+        """Spread an item's total stock evenly over ``shards`` shards; ``0`` unshards it.
+
+        Without ``shards``, the item keeps its number of shards and their stock is rebalanced.
+        The item and its shards are locked first, so purchases in flight finish before the
+        stock is counted. Returns the item, or ``None`` when it does not exist.
+        """
+        result = await self._session.execute(
+            select(Item)
+            .where(Item.id == item_id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        item = result.scalar_one_or_none()
+        if item is None:
+            return None
+        if shards is None:
+            shards = item.stock_shards
+        logger.info("Spreading stock of item %s over %s shards", item_id, shards)
+        result = await self._session.execute(
+            select(ItemStockShard.stock)
+            .where(ItemStockShard.item_id == item_id)
+            .order_by(ItemStockShard.shard)
+            .with_for_update()
+        )
+        total = item.stock + sum(result.scalars().all())
+
+        await self._session.execute(delete(ItemStockShard).where(ItemStockShard.item_id == item_id))
+        if shards:
+            share, extra = divmod(total, shards)
+            await self._session.execute(
+                insert(ItemStockShard),
+                [
+                    {"item_id": item_id, "shard": shard, "stock": share + (shard < extra)}
+                    for shard in range(shards)
+                ],
+            )
+        item.stock = 0 if shards else total
+        item.stock_shards = shards
+        await self.update(item)
+        set_committed_value(item, "stock", total)
+        return item
+
+    async def get_many_for_update(self, item_ids: ty.Iterable[int]) -> ty.Sequence[Item]:
+        """Load and row-lock several items in one query.
+
+        Rows are locked in ascending id order, so concurrent callers locking overlapping sets
+        of items always acquire them in the same order and cannot deadlock.
+        """
+        ids = sorted(set(item_ids))
+        logger.debug("Locking %s items for update", len(ids))
+        result = await self._session.execute(
+            select(Item)
+            .where(Item.id.in_(ids))
+            .order_by(Item.id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        items = result.scalars().all()
+        await self._load_total_stock(items)
+        return items
+
+    async def decrement_stocks(self, quantities: ty.Mapping[int, int]) -> int:
+        """Take stock from several items with a single ``UPDATE ... FROM (VALUES ...)``.
+
+        Each item is only decremented if it can cover its quantity and its stock is not held
+        in Redis; sharded items are then decremented one by one through their shards. Returns
+        the number of items updated; a result smaller than ``len(quantities)`` means some line
+        was short.
+        """
+        logger.debug("Decrementing stock for %s items", len(quantities))
+        lines = (
+            values(column("id", Integer), column("quantity", Integer), name="lines")
+            .data(sorted(quantities.items()))
+            .cte("lines")
+        )
+        result = await self._session.execute(
+            update(Item)
+            .where(
+                Item.id == lines.c.id,
+                Item.stock >= lines.c.quantity,
+                Item.stock_shards == 0,
+                Item.stock_held.is_(False),
+            )
+            .values(stock=Item.stock - lines.c.quantity, version=Item.version + 1)
+            .returning(Item.id)
+            .execution_options(synchronize_session=False)
+        )
+        updated = len(result.scalars().all())
+        if updated == len(quantities):
+            return updated
+
+        result = await self._session.execute(
+            select(Item.id, Item.stock_shards)
+            .where(Item.id.in_(quantities), Item.stock_shards > 0, Item.stock_held.is_(False))
+            .order_by(Item.id)
+        )
+        for item_id, shards in result.tuples().all():
+            if await self._take_from_shards(item_id, shards, quantities[item_id]):
+                updated += 1
+        return updated
+
+    async def get_stocks(self, item_ids: ty.Iterable[int]) -> dict[int, int]:
+        """Get the current total stock of several items, bypassing loaded instances."""
+        result = await self._session.execute(
+            select(Item.id, TOTAL_STOCK).where(Item.id.in_(set(item_ids)))
+        )
+        return dict(result.tuples().all())
+
+    async def add_reservations(self, reservations: ty.Sequence[StockReservation]) -> None:
+        """Record purchases of stock reserved in Redis, without taking it from the items."""
+        logger.debug("Adding %s stock reservations", len(reservations))
+        self._session.add_all(reservations)
+        await self._session.flush()
+
+    async def apply_reservations(
+        self, keys: ty.Collection[str]
+    ) -> tuple[ty.Sequence[StockReservation], set[str]]:
+        """Take the stock of the reservations not yet applied from their items' rows.
+
+        The reservations are locked first, so concurrent reconcilers apply each one once.
+        Stock is taken unconditionally: Redis already checked it. Returns the reservations
+        applied now, and the keys of all those recorded, applied now or before.
+        """
+        result = await self._session.execute(
+            select(StockReservation)
+            .where(StockReservation.key.in_(keys))
+            .order_by(StockReservation.id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        reservations = result.scalars().all()
+        pending = [r for r in reservations if not r.applied]
+        if pending:
+            logger.debug("Applying %s stock reservations", len(pending))
+            quantities: dict[int, int] = {}
+            for reservation in pending:
+                quantities[reservation.item_id] = (
+                    quantities.get(reservation.item_id, 0) + reservation.quantity
+                )
+            lines = (
+                values(column("id", Integer), column("quantity", Integer), name="lines")
+                .data(sorted(quantities.items()))
+                .cte("lines")
+            )
+            await self._session.execute(
+                update(Item)
+                .where(Item.id == lines.c.id)
+                .values(stock=Item.stock - lines.c.quantity, version=Item.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            await self._session.execute(
+                update(StockReservation)
+                .where(StockReservation.id.in_([r.id for r in pending]))
+                .values(applied=True)
+                .execution_options(synchronize_session=False)
+            )
+            for reservation in pending:
+                set_committed_value(reservation, "applied", True)
+        return pending, {r.key for r in reservations}
@@ -1,26 +1,117 @@
 import logging
 import typing as ty
+from collections.abc import AsyncIterator
+from datetime import datetime
 
-from sqlalchemy import select
+from sqlalchemy import ColumnElement, Select, func, select, tuple_, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from ..models.entities import Transaction
 from .base import SQLAlchemyRepository
 
 logger = logging.getLogger(__name__)
 
+# Position of a trade in a user's history: (transaction_time, id)
+TradeKey = tuple[datetime, int]
+
 
 class TransactionRepository(SQLAlchemyRepository[Transaction]):
     def __init__(self, session: AsyncSession):
         super().__init__(session, Transaction)
 
-    async def get_user_trades(self, user_id: int) -> ty.Sequence[Transaction]:
-        logger.debug(f"Fetching trades for user {user_id}")
+    async def get_user_trades(
+        self,
+        user_id: int,
+        *,
+        limit: int = 50,
+        before: TradeKey | None = None,
+        after: TradeKey | None = None,
+    ) -> ty.Sequence[Transaction]:
+        """Get one page of a user's trades, newest first.
+
+        Pages are delimited by ``(transaction_time, id)`` keys rather than offsets, so the cost
+        of a page does not grow with the depth of the history.
+
+        Args:
+            user_id: User who bought or sold.
+            limit: Maximum number of trades to return.
+            before: Only return trades older than this key.
+            after: Only return trades newer than this key; the ``limit`` trades closest to
+                the key are returned.
+        """
+        logger.debug("Fetching up to %s trades for user %s", limit, user_id)
         result = await self._session.execute(
-            select(Transaction)
-            .where((Transaction.buyer_id == user_id) | (Transaction.seller_id == user_id))
-            .order_by(Transaction.transaction_time.desc())
+            self._user_trades_query(user_id, limit=limit, before=before, after=after)
         )
-        trades = result.scalars().all()
-        logger.debug(f"Retrieved {len(trades)} trades for user {user_id}")
+        trades = list(result.scalars().all())
+        if after is not None:
+            trades.reverse()
+        logger.debug("Retrieved %s trades for user %s", len(trades), user_id)
         return trades
+
+    async def stream_user_trades(
+        self, user_id: int, *, batch_size: int = 1000
+    ) -> AsyncIterator[ty.Sequence[Transaction]]:
+        """Stream a user's whole trade history, newest first, in batches.
+
+        Rows are read through a server-side cursor ``batch_size`` at a time, so memory use
+        does not depend on the length of the history.
+        """
+        logger.debug("Streaming trades for user %s", user_id)
+        query = self._user_trades_query(user_id, limit=None, before=None, after=None)
+        result = await self._session.stream(query.execution_options(yield_per=batch_size))
+        async for batch in result.scalars().partitions():
+            yield batch
+
+    @staticmethod
+    def _user_trades_query(
+        user_id: int, *, limit: int | None, before: TradeKey | None, after: TradeKey | None
+    ) -> Select[tuple[Transaction]]:
+        """Build the trade page query as a ``UNION ALL`` of a buyer side and a seller side.
+
+        ``buyer_id = :user OR seller_id = :user`` cannot use either index on its own, so each
+        side is a separate limited scan of its ``(party, transaction_time, id)`` index and
+        only the two short results are merged and sorted. Trades where the user is both buyer
+        and seller come from the buyer side only.
+        """
+
+        def ordered(entity: ty.Any) -> tuple[ty.Any, ...]:
+            if after is not None:
+                return entity.transaction_time.asc(), entity.id.asc()
+            return entity.transaction_time.desc(), entity.id.desc()
+
+        def side(condition: ColumnElement[bool]) -> Select[tuple[Transaction]]:
+            query = select(Transaction).where(condition)
+            key = tuple_(Transaction.transaction_time, Transaction.id)
+            if before is not None:
+                query = query.where(key < tuple_(*before))
+            if after is not None:
+                query = query.where(key > tuple_(*after))
+            return select(query.order_by(*ordered(Transaction)).limit(limit).subquery())
+
+        trades = aliased(
+            Transaction,
+            union_all(
+                side(Transaction.buyer_id == user_id),
+                side((Transaction.seller_id == user_id) & (Transaction.buyer_id != user_id)),
+            ).subquery("trades"),
+        )
+        return select(trades).order_by(*ordered(trades)).limit(limit)
+
+    async def most_traded_items(self, limit: int) -> ty.Sequence[int]:
+        """Get the ids of the ``limit`` items bought most often, most traded first."""
+        result = await self._session.execute(
+            select(Transaction.item_id)
+            .group_by(Transaction.item_id)
+            .order_by(func.count().desc(), Transaction.item_id)
+            .limit(limit)
+        )
+        return result.scalars().all()
+
+    async def add_many(self, transactions: ty.Sequence[Transaction]) -> ty.Sequence[Transaction]:
+        """Insert several transactions in one batched ``INSERT`` without committing."""
+        logger.debug("Adding %s transactions", len(transactions))
+        self._session.add_all(transactions)
+        await self._session.flush()
+        return transactions
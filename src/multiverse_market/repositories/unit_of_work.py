@@ -0,0 +1,42 @@
+import logging
+import typing as ty
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork(ty.Protocol):
+    """Unit of work protocol.
+
+    Repositories only stage and flush changes; the unit of work is the single place that
+    commits or rolls back, once per business operation.
+    """
+
+    async def commit(self) -> None:
+        """Commit all changes staged by the repositories."""
+        ...
+
+    async def rollback(self) -> None:
+        """Discard all changes staged by the repositories."""
+        ...
+
+
+class SQLAlchemyUnitOfWork:
+    """Unit of work owning the session shared by the repositories of one request."""
+
+    def __init__(self, session: AsyncSession):
+        logger.debug("Initializing SQLAlchemyUnitOfWork")
+        self._session = session
+
+    @property
+    def session(self) -> AsyncSession:
+        return self._session
+
+    async def commit(self) -> None:
+        logger.debug("Committing unit of work")
+        await self._session.commit()
+
+    async def rollback(self) -> None:
+        logger.debug("Rolling back unit of work")
+        await self._session.rollback()
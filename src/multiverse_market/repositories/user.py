@@ -1,26 +1,289 @@
 import logging
+import typing as ty
 
+from sqlalchemy import Float, Integer, Select, column, func, select, update, values
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
-from ..models.entities import User
-from .base import SQLAlchemyRepository
+from ..models.entities import LedgerEntry, LedgerReason, Transaction, User
+from .base import ConcurrencyControl, SQLAlchemyRepository
 
 logger = logging.getLogger(__name__)
 
+# Ledger entries of a user appended since the last one folded into their balance snapshot
+_UNFOLDED = (LedgerEntry.user_id == User.id, LedgerEntry.id > User.balance_entry_id)
+
+# Balance of a user as reported with the ledger enabled: the snapshot plus the later entries
+CURRENT_BALANCE = (
+    User.balance
+    + select(func.coalesce(func.sum(LedgerEntry.delta), 0.0)).where(*_UNFOLDED).scalar_subquery()
+)
+UNFOLDED_ENTRIES = select(func.count(LedgerEntry.id)).where(*_UNFOLDED).scalar_subquery()
+
+
+class BalanceLedger(ty.NamedTuple):
+    """Balances kept as an append-only ledger, with a snapshot on each user's row.
+
+    Every change appends a ``LedgerEntry`` instead of rewriting the row; the balance is the
+    snapshot plus the entries appended since. A write folds the entries into the snapshot
+    once ``snapshot_every`` have piled up, so reading a balance never sums more than that.
+
+    The ledger is for auditability, not throughput: an append still locks the user's row to
+    check the balance, so writes to a hot user take turns as they would on the row, with two
+    more statements each. See ``tests/benchmarks/bench_balance_ledger.py`` for the cost.
+    """
+
+    snapshot_every: int = 32
+
 
 class UserRepository(SQLAlchemyRepository[User]):
-    def __init__(self, session: AsyncSession):
-        super().__init__(session, User)
+    """Users, whose balance may be kept as an append-only ledger.
+
+    With a ``BalanceLedger``, users loaded through the repository report the snapshot on their
+    row plus the ledger entries appended since, and the concurrency strategy no longer
+    applies to balances: writers of a user's entries take turns on a row lock that leaves the
+    row itself unchanged.
+    """
+
+    def __init__(
+        self,
+        session: AsyncSession,
+        concurrency: ConcurrencyControl = ConcurrencyControl(),
+        ledger: BalanceLedger | None = None,
+    ):
+        super().__init__(session, User, concurrency)
+        self._ledger = ledger
         logger.debug("Initialized UserRepository")
 
+    async def get(self, id: int) -> User | None:
+        if self._ledger is None:
+            return await super().get(id)
+        users = await self._load_with_balance(select(User).where(User.id == id))
+        return users[0] if users else None
+
+    async def get_many(self, ids: ty.Iterable[int]) -> ty.Sequence[User]:
+        if self._ledger is None:
+            return await super().get_many(ids)
+        return await self._load_with_balance(select(User).where(User.id.in_(set(ids))))
+
+    async def list(self, **filters) -> ty.Sequence[User]:
+        if self._ledger is None:
+            return await super().list(**filters)
+        query = select(User)
+        for key, value in filters.items():
+            if value is not None:
+                query = query.where(getattr(User, key) == value)
+        return await self._load_with_balance(query)
+
+    def _list_rows_query(self, fields: ty.Iterable[str], **filters) -> Select:
+        fields = list(fields)
+        query = super()._list_rows_query(fields, **filters)
+        if self._ledger is None or "balance" not in fields:
+            return query
+        columns = [
+            CURRENT_BALANCE.label("balance") if field == "balance" else getattr(User, field)
+            for field in fields
+        ]
+        return query.with_only_columns(*columns)
+
+    async def _load_with_balance(self, query: Select) -> ty.Sequence[User]:
+        """Load users along with their ledger balance, without marking them as modified."""
+        result = await self._session.execute(query.add_columns(CURRENT_BALANCE))
+        users = []
+        for user, balance in result.tuples():
+            set_committed_value(user, "balance", balance)
+            users.append(user)
+        return users
+
     async def update_balance(self, user_id: int, new_balance: float) -> None:
+        if self._ledger is not None:
+            entries = {user_id: new_balance}
+            if not await self._append_entries(entries, LedgerReason.ADJUSTMENT, {}, absolute=True):
+                logger.warning("User %s not found for balance update", user_id)
+            return
         user = await self.get(user_id)
         if user:
             logger.debug(
-                f"Updating balance for user {user_id} from {user.balance} to {new_balance}"
+                "Updating balance for user %s from %s to %s", user_id, user.balance, new_balance
             )
             user.balance = new_balance
             await self.update(user)
-            logger.debug(f"Balance updated for user {user_id}")
+            logger.debug("Balance updated for user %s", user_id)
+        else:
+            logger.warning("User %s not found for balance update", user_id)
+
+    async def debit_balance(
+        self,
+        user_id: int,
+        amount: float,
+        *,
+        reason: LedgerReason = LedgerReason.ADJUSTMENT,
+        transaction: Transaction | None = None,
+    ) -> User | None:
+        """Subtract ``amount`` from a user's balance, unless it would go negative.
+
+        The check and the write cannot race with concurrent debits, whichever concurrency
+        strategy the repository uses. Returns the updated user, or ``None`` when the user does
+        not exist or cannot cover the amount. With the ledger enabled, the debit is appended
+        as an entry for ``reason``, linking ``transaction``, which is inserted along with it.
+        """
+        logger.debug("Debiting %s from user %s", amount, user_id)
+        if self._ledger is not None:
+            transactions = {user_id: transaction} if transaction is not None else {}
+            users = await self._append_entries({user_id: -amount}, reason, transactions)
+            user = users[0] if users else None
         else:
-            logger.warning(f"User {user_id} not found for balance update")
+            user = await self._take(user_id, "balance", amount)
+        if user is None:
+            logger.debug("Debit rejected for user %s", user_id)
+        return user
+
+    async def debit_balances(
+        self,
+        amounts: ty.Mapping[int, float],
+        *,
+        reason: LedgerReason = LedgerReason.ADJUSTMENT,
+        transactions: ty.Mapping[int, Transaction] | None = None,
+    ) -> set[int]:
+        """Debit several users with a single ``UPDATE ... FROM (VALUES ...)``.
+
+        Each user is only debited if their balance covers their amount. Returns the ids of
+        the users that were debited. With the ledger enabled, each debit is appended as an
+        entry for ``reason``, linking the user's transaction in ``transactions`` if any.
+        """
+        logger.debug("Debiting balances of %s users", len(amounts))
+        if self._ledger is not None:
+            deltas = {user_id: -amount for user_id, amount in amounts.items()}
+            users = await self._append_entries(deltas, reason, transactions or {})
+            return {user.id for user in users}
+        debits = (
+            values(column("id", Integer), column("amount", Float), name="debits")
+            .data(sorted(amounts.items()))
+            .cte("debits")
+        )
+        result = await self._session.execute(
+            update(User)
+            .where(User.id == debits.c.id, User.balance >= debits.c.amount)
+            .values(balance=User.balance - debits.c.amount, version=User.version + 1)
+            .returning(User.id)
+            .execution_options(synchronize_session=False)
+        )
+        return set(result.scalars().all())
+
+    async def _append_entries(
+        self,
+        deltas: ty.Mapping[int, float],
+        reason: LedgerReason,
+        transactions: ty.Mapping[int, Transaction],
+        *,
+        absolute: bool = False,
+    ) -> ty.Sequence[User]:
+        """Append a ledger entry per user, unless it would take their balance below zero.
+
+        Users are row-locked in id order first, so their balance cannot change between the
+        check and the append; the lock conflicts with other writers of the user's entries but
+        not with inserts referencing the row, and leaves the row itself unchanged. With
+        ``absolute``, ``deltas`` holds the balances to set instead. Returns the users written
+        to, reporting their new balance.
+        """
+        assert self._ledger is not None
+        result = await self._session.execute(
+            select(User)
+            .where(User.id.in_(deltas))
+            .order_by(User.id)
+            .with_for_update(key_share=True)
+            .execution_options(populate_existing=True)
+        )
+        users = {user.id: user for user in result.scalars().all()}
+        # Summed by a statement of its own: one that waited for the lock would still sum the
+        # entries as they were before the writer it waited for committed
+        result = await self._session.execute(
+            select(User.id, CURRENT_BALANCE, UNFOLDED_ENTRIES).where(User.id.in_(users))
+        )
+        written: list[tuple[User, float, int, LedgerEntry]] = []
+        for user_id, balance, unfolded in sorted(result.tuples().all()):
+            user = users[user_id]
+            delta = deltas[user_id] - balance if absolute else deltas[user_id]
+            if balance + delta < 0:
+                set_committed_value(user, "balance", balance)
+                continue
+            entry = LedgerEntry(
+                user_id=user_id,
+                universe_id=user.universe_id,
+                delta=delta,
+                reason=reason,
+                transaction=transactions.get(user_id),
+            )
+            written.append((user, balance + delta, unfolded + 1, entry))
+        if not written:
+            return []
+
+        self._session.add_all([entry for *_, entry in written])
+        await self._session.flush()
+        for user, balance, unfolded, entry in written:
+            if unfolded >= self._ledger.snapshot_every:
+                # Still holding the lock, so no entry of the user can be missed by the fold
+                user.balance = balance
+                user.balance_entry_id = entry.id
+        await self._session.flush()
+        for user, balance, *_ in written:
+            set_committed_value(user, "balance", balance)
+        return [user for user, *_ in written]
+
+    async def unfolded_users(self, limit: int, *, up_to: int | None = None) -> ty.Sequence[int]:
+        """Get up to ``limit`` users with ledger entries not yet folded into their snapshot.
+
+        Only entries with ids up to ``up_to`` are considered, when given.
+        """
+        query = (
+            select(LedgerEntry.user_id)
+            .join(User, User.id == LedgerEntry.user_id)
+            .where(LedgerEntry.id > User.balance_entry_id)
+            .distinct()
+            .order_by(LedgerEntry.user_id)
+            .limit(limit)
+        )
+        if up_to is not None:
+            query = query.where(LedgerEntry.id <= up_to)
+        result = await self._session.execute(query)
+        return result.scalars().all()
+
+    async def last_entry_id(self) -> int:
+        """Get the id of the latest ledger entry, or 0 when there is none."""
+        result = await self._session.execute(select(func.coalesce(func.max(LedgerEntry.id), 0)))
+        return result.scalar_one()
+
+    async def snapshot_balances(self, user_ids: ty.Collection[int]) -> None:
+        """Fold the ledger entries of several users into the balance snapshot on their rows.
+
+        The rows are locked before the entries are summed, so entries appended by writers
+        still in flight are committed first, and included.
+        """
+        logger.debug("Snapshotting balances of %s users", len(user_ids))
+        await self._session.execute(
+            select(User.id)
+            .where(User.id.in_(user_ids))
+            .order_by(User.id)
+            .with_for_update(key_share=True)
+        )
+        unfolded = (
+            select(
+                LedgerEntry.user_id,
+                func.sum(LedgerEntry.delta).label("delta"),
+                func.max(LedgerEntry.id).label("last_id"),
+            )
+            .join(User, User.id == LedgerEntry.user_id)
+            .where(LedgerEntry.user_id.in_(user_ids), LedgerEntry.id > User.balance_entry_id)
+            .group_by(LedgerEntry.user_id)
+            .cte("unfolded")
+        )
+        await self._session.execute(
+            update(User)
+            .where(User.id == unfolded.c.user_id)
+            .values(
+                balance=User.balance + unfolded.c.delta,
+                balance_entry_id=unfolded.c.last_id,
+                version=User.version + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
@@ -0,0 +1,236 @@
+"""Synthesize a production-scale data set and bulk load it with PostgreSQL ``COPY``."""
+
+import itertools
+import logging
+import random
+import time
+import typing as ty
+from collections.abc import AsyncIterator, Iterator, Sequence
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from .seed_data import reset_sequences
+
+logger = logging.getLogger(__name__)
+
+Row = tuple[ty.Any, ...]
+
+
+class ZipfSampler:
+    """Draws from ``values`` with Zipf-distributed popularity.
+
+    The value of popularity rank ``k`` (starting at 1) is drawn with probability proportional
+    to ``1 / k ** skew``: ``0`` is uniform, and around ``1`` a few values dominate. Ranks are
+    assigned to values in random order, so popular values are spread over the id range.
+    """
+
+    def __init__(self, values: Sequence[int], skew: float, rng: random.Random) -> None:
+        self._values = list(values)
+        rng.shuffle(self._values)
+        self._cum_weights = list(
+            itertools.accumulate(1 / rank**skew for rank in range(1, len(self._values) + 1))
+        )
+        self._rng = rng
+
+    def sample(self, k: int) -> list[int]:
+        return self._rng.choices(self._values, cum_weights=self._cum_weights, k=k)
+
+    def share_of_top(self, fraction: float) -> float:
+        """Get the probability mass held by the most popular ``fraction`` of values."""
+        top = max(1, int(len(self._values) * fraction))
+        return self._cum_weights[top - 1] / self._cum_weights[-1]
+
+
+class DataGenerator:
+    """Generates rows for every table, in chunks, from a reproducible random seed.
+
+    Sellers are set to the item's universe, as ``MarketService`` records them, and amounts
+    are converted with the universes' exchange rates.
+    """
+
+    def __init__(
+        self,
+        *,
+        universes: int,
+        users: int,
+        items: int,
+        transactions: int,
+        item_skew: float = 1.1,
+        buyer_skew: float = 0.8,
+        history_days: int = 365,
+        seed: int | None = None,
+    ) -> None:
+        self.counts = {
+            "universes": universes,
+            "users": users,
+            "items": items,
+            "transactions": transactions,
+        }
+        self._rng = random.Random(seed)
+        self._rates = [round(self._rng.uniform(0.1, 10), 4) for _ in range(universes)]
+        self._user_universes = [self._rng.randrange(universes) + 1 for _ in range(users)]
+        self._item_universes = [self._rng.randrange(universes) + 1 for _ in range(items)]
+        self._prices = [round(self._rng.uniform(1, 500), 2) for _ in range(items)]
+        self._items = ZipfSampler(range(1, items + 1), item_skew, self._rng)
+        self._buyers = ZipfSampler(range(1, users + 1), buyer_skew, self._rng)
+        self._history = timedelta(days=history_days)
+
+    def universes(self) -> Iterator[Row]:
+        for id, rate in enumerate(self._rates, start=1):
+            yield id, f"Universe {id}", f"C{id:04d}", rate
+
+    def users(self) -> Iterator[Row]:
+        for id, universe_id in enumerate(self._user_universes, start=1):
+            yield id, f"user_{id}", universe_id, round(self._rng.uniform(100, 1_000_000), 2)
+
+    def items(self) -> Iterator[Row]:
+        for id, (universe_id, price) in enumerate(
+            zip(self._item_universes, self._prices, strict=True), start=1
+        ):
+            yield id, f"Item {id}", universe_id, price, self._rng.randrange(0, 10_000)
+
+    def transaction_chunks(self, chunk_size: int) -> Iterator[list[Row]]:
+        """Yield transaction rows ``chunk_size`` at a time, oldest first."""
+        total = self.counts["transactions"]
+        start = datetime.now(UTC) - self._history
+        step = self._history / max(total, 1)
+        for offset in range(0, total, chunk_size):
+            size = min(chunk_size, total - offset)
+            buyers = self._buyers.sample(size)
+            items = self._items.sample(size)
+            chunk = []
+            for index, (buyer_id, item_id) in enumerate(zip(buyers, items, strict=True)):
+                from_universe = self._user_universes[buyer_id - 1]
+                to_universe = self._item_universes[item_id - 1]
+                quantity = self._rng.randint(1, 3)
+                amount = self._prices[item_id - 1] * quantity
+                if from_universe != to_universe:
+                    amount *= self._rates[to_universe - 1] / self._rates[from_universe - 1]
+                chunk.append(
+                    (
+                        buyer_id,
+                        to_universe,
+                        item_id,
+                        round(amount, 2),
+                        quantity,
+                        from_universe,
+                        to_universe,
+                        start + step * (offset + index),
+                    )
+                )
+            yield chunk
+
+
+COLUMNS = {
+    "universes": ("id", "name", "currency_type", "exchange_rate"),
+    "users": ("id", "username", "universe_id", "balance"),
+    "items": ("id", "name", "universe_id", "price", "stock"),
+    # Ids come from the sequence, so the application keeps inserting after the generated rows
+    "transactions": (
+        "buyer_id",
+        "seller_id",
+        "item_id",
+        "amount",
+        "quantity",
+        "from_universe_id",
+        "to_universe_id",
+        "transaction_time",
+    ),
+}
+
+
+def _chunked(rows: Iterator[Row], size: int) -> Iterator[list[Row]]:
+    while chunk := list(itertools.islice(rows, size)):
+        yield chunk
+
+
+@asynccontextmanager
+async def _without_constraints(connection: AsyncConnection, table: str) -> AsyncIterator[None]:
+    """Drop a table's foreign keys and secondary indexes, restoring them on exit.
+
+    Checking foreign keys row by row and maintaining indexes entry by entry dominate a bulk
+    load; building each index once and validating each key with one join afterwards is far
+    cheaper. Being transactional, the DDL is rolled back with the load on failure.
+    """
+    foreign_keys = (
+        await connection.execute(
+            text(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'"
+            ),
+            {"table": table},
+        )
+    ).all()
+    indexes = (
+        await connection.execute(
+            text(
+                "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = :table "
+                "AND indexname NOT IN (SELECT conname FROM pg_constraint "
+                "WHERE conrelid = CAST(:table AS regclass))"
+            ),
+            {"table": table},
+        )
+    ).all()
+    for name, _ in foreign_keys:
+        await connection.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+    for name, _ in indexes:
+        await connection.execute(text(f'DROP INDEX "{name}"'))
+
+    yield
+
+    for _, definition in indexes:
+        await connection.execute(text(definition))
+    for name, definition in foreign_keys:
+        await connection.execute(text(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}'))
+
+
+async def load(
+    engine: AsyncEngine,
+    generator: DataGenerator,
+    *,
+    chunk_size: int = 50_000,
+    truncate: bool = False,
+) -> dict[str, int]:
+    """Bulk load generated rows with ``COPY`` in one transaction, chunk by chunk.
+
+    Only one chunk of rows is held in memory at a time, and each table is loaded without its
+    foreign keys and secondary indexes, which are restored before committing. Returns the
+    rows loaded per table.
+
+    Raises:
+        RuntimeError: If the engine is not backed by asyncpg.
+    """
+    if engine.dialect.driver != "asyncpg":
+        raise RuntimeError("Generating data requires PostgreSQL with the asyncpg driver")
+
+    sources: dict[str, ty.Iterable[list[Row]]] = {
+        "universes": _chunked(generator.universes(), chunk_size),
+        "users": _chunked(generator.users(), chunk_size),
+        "items": _chunked(generator.items(), chunk_size),
+        "transactions": generator.transaction_chunks(chunk_size),
+    }
+    loaded = dict.fromkeys(sources, 0)
+    async with engine.begin() as connection:
+        if truncate:
+            logger.info("Truncating market tables")
+            await connection.execute(
+                text("TRUNCATE transactions, items, users, universes RESTART IDENTITY CASCADE")
+            )
+        raw = (await connection.get_raw_connection()).driver_connection
+        for table, chunks in sources.items():
+            started = time.perf_counter()
+            async with _without_constraints(connection, table):
+                for chunk in chunks:
+                    await raw.copy_records_to_table(table, records=chunk, columns=COLUMNS[table])
+                    loaded[table] += len(chunk)
+            logger.info(
+                "Loaded %s %s in %.1fs", loaded[table], table, time.perf_counter() - started
+            )
+        await reset_sequences(connection, ("universes", "users", "items"))
+    async with engine.connect() as connection:
+        await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text("ANALYZE universes, users, items, transactions"))
+    return loaded
@@ -1,56 +1,121 @@
 """Script to seed test data into the database."""
 
 import asyncio
+import csv
+import json
 import logging
+import typing as ty
+from pathlib import Path
 
-from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 
 from ..dependencies import async_session
-from ..models.entities import Item, Universe, User
+from ..models.entities import Base, Item, Transaction, Universe, User
+from ..models.schemas import ItemSchema, TransactionSchema, UniverseSchema, UserSchema
 
 logger = logging.getLogger(__name__)
 
+SeedData = dict[str, list[dict[str, ty.Any]]]
 
-async def seed_data(session: AsyncSession) -> None:
-    """Seed the database with initial data."""
-    logger.info("Starting database seeding")
-    try:
-        # Create universes
-        logger.debug("Creating initial universes")
-        universes = [
-            Universe(id=1, name="Earth", currency_type="USD", exchange_rate=1.0),
-            Universe(id=2, name="Mars", currency_type="MRC", exchange_rate=2.5),
-            Universe(id=3, name="Venus", currency_type="VNC", exchange_rate=0.75),
-        ]
-        for universe in universes:
-            session.add(universe)
-        await session.commit()
+# Tables in foreign key order, with the schema each seed row is validated against
+TABLES: dict[str, tuple[type[Base], type[BaseModel]]] = {
+    "universes": (Universe, UniverseSchema),
+    "users": (User, UserSchema),
+    "items": (Item, ItemSchema),
+    "transactions": (Transaction, TransactionSchema),
+}
 
-        # Create users
-        logger.debug("Creating initial users")
-        users = [
-            User(id=1, username="john_earth", universe_id=1, balance=1000.0),
-            User(id=2, username="mary_mars", universe_id=2, balance=2500.0),
-            User(id=3, username="venus_trader", universe_id=3, balance=750.0),
-        ]
-        for user in users:
-            session.add(user)
-        await session.commit()
+DEFAULT_SEED_DATA: SeedData = {
+    "universes": [
+        {"id": 1, "name": "Earth", "currency_type": "USD", "exchange_rate": 1.0},
+        {"id": 2, "name": "Mars", "currency_type": "MRC", "exchange_rate": 2.5},
+        {"id": 3, "name": "Venus", "currency_type": "VNC", "exchange_rate": 0.75},
+    ],
+    "users": [
+        {"id": 1, "username": "john_earth", "universe_id": 1, "balance": 1000.0},
+        {"id": 2, "username": "mary_mars", "universe_id": 2, "balance": 2500.0},
+        {"id": 3, "username": "venus_trader", "universe_id": 3, "balance": 750.0},
+    ],
+    "items": [
+        {"id": 1, "name": "Earth Coffee", "universe_id": 1, "price": 5.0, "stock": 100},
+        {"id": 2, "name": "Mars Rocks", "universe_id": 2, "price": 10.0, "stock": 50},
+        {"id": 3, "name": "Venus Crystals", "universe_id": 3, "price": 15.0, "stock": 25},
+    ],
+}
 
-        # Create items
-        logger.debug("Creating initial items")
-        items = [
-            Item(id=1, name="Earth Coffee", universe_id=1, price=5.0, stock=100),
-            Item(id=2, name="Mars Rocks", universe_id=2, price=10.0, stock=50),
-            Item(id=3, name="Venus Crystals", universe_id=3, price=15.0, stock=25),
-        ]
-        for item in items:
-            session.add(item)
-        await session.commit()
 
+def load_seed_file(path: Path) -> SeedData:
+    """Load seed rows from a file.
+
+    Accepted layouts are a JSON object mapping table names to lists of rows, a CSV file named
+    after its table (``items.csv``), or a directory of such CSV files. Rows are validated and
+    coerced with the table's schema, so CSV values can be plain strings.
+
+    Raises:
+        ValueError: If the file names an unknown table or a row is invalid.
+    """
+    if path.is_dir():
+        raw = {file.stem: _read_csv(file) for file in sorted(path.glob("*.csv"))}
+    elif path.suffix == ".csv":
+        raw = {path.stem: _read_csv(path)}
+    else:
+        raw = json.loads(path.read_text())
+
+    unknown = set(raw) - set(TABLES)
+    if unknown:
+        raise ValueError(f"Unknown tables in {path}: {', '.join(sorted(unknown))}")
+
+    data: SeedData = {}
+    for table, rows in raw.items():
+        schema = TABLES[table][1]
+        validated = TypeAdapter(list[schema]).validate_python(rows)
+        data[table] = [row.model_dump(exclude_none=True) for row in validated]
+    return data
+
+
+def _read_csv(path: Path) -> list[dict[str, str]]:
+    with path.open(newline="") as file:
+        return list(csv.DictReader(file))
+
+
+async def reset_sequences(connection: AsyncConnection, tables: ty.Iterable[str]) -> None:
+    """Move PostgreSQL id sequences past explicitly inserted ids."""
+    if connection.dialect.name != "postgresql":
+        return
+    for table in tables:
+        await connection.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"COALESCE((SELECT max(id) FROM {table}), 0) + 1, false)"
+            )
+        )
+
+
+async def seed_data(session: AsyncSession, data: SeedData | None = None) -> None:
+    """Seed the database in a single transaction, one multi-row insert per table.
+
+    Args:
+        session: Session to seed through.
+        data: Rows per table; defaults to a small fixed data set.
+    """
+    data = DEFAULT_SEED_DATA if data is None else data
+    logger.info("Starting database seeding")
+    try:
+        for table, (model, _) in TABLES.items():
+            rows = data.get(table)
+            if rows:
+                logger.debug("Inserting %s rows into %s", len(rows), table)
+                await session.execute(insert(model), rows)
+        await reset_sequences(
+            await session.connection(), (table for table in TABLES if data.get(table))
+        )
+        await session.commit()
         logger.info("Database seeding completed successfully")
     except Exception as e:
-        logger.error(f"Error during database seeding: {e!s}")
+        logger.error("Error during database seeding: %s", e)
+        await session.rollback()
         raise
 
 
@@ -1,4 +1,16 @@
 """Service layer implementations."""
+from .batcher import PurchaseBatcher
+from .exchange_rates import ExchangeRateMatrix, ExchangeRateTable
+from .exports import ExportFormat, encode_trades
 from .market import MarketService
+from .warmup import warm_up
 
-__all__ = ["MarketService"]
+__all__ = [
+    "ExchangeRateMatrix",
+    "ExchangeRateTable",
+    "ExportFormat",
+    "MarketService",
+    "PurchaseBatcher",
+    "encode_trades",
+    "warm_up",
+]
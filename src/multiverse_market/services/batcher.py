@@ -0,0 +1,106 @@
+"""In-process coalescing of concurrent purchases of the same item."""
+
+import asyncio
+import logging
+import typing as ty
+
+from ..exceptions import MultiverseMarketException
+from ..models.requests import ItemPurchase
+from ..models.schemas import TransactionSchema
+
+logger = logging.getLogger(__name__)
+
+PurchaseResult = TransactionSchema | MultiverseMarketException
+ApplyPurchaseGroup = ty.Callable[
+    [int, ty.Sequence[ItemPurchase]], ty.Awaitable[ty.Sequence[PurchaseResult]]
+]
+_PendingPurchase = tuple[ItemPurchase, asyncio.Future[TransactionSchema]]
+
+
+class PurchaseBatcher:
+    """Group commit for hot items.
+
+    Purchases of the same item that arrive within ``window`` seconds of each other (or until
+    ``max_batch_size`` are queued) are handed to ``apply`` as one group, which takes the stock
+    with a single decrement and commits once. Only one group per item is in flight at a time;
+    purchases arriving meanwhile form the next group, so under contention each lock hold
+    serves a whole group instead of one buyer.
+
+    ``apply`` returns one result per purchase, in order: either the transaction or the
+    exception to raise for that caller. A cancelled caller does not cancel its purchase.
+    """
+
+    def __init__(
+        self,
+        apply: ApplyPurchaseGroup,
+        *,
+        window: float = 0.002,
+        max_batch_size: int = 64,
+    ) -> None:
+        logger.debug("Initializing PurchaseBatcher")
+        self._apply = apply
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._pending: dict[int, list[_PendingPurchase]] = {}
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        self._in_flight: set[int] = set()
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def submit(self, purchase: ItemPurchase) -> TransactionSchema:
+        """Queue a purchase and wait for the group it lands in to be applied."""
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[TransactionSchema] = loop.create_future()
+        item_id = purchase.item_id
+        batch = self._pending.setdefault(item_id, [])
+        batch.append((purchase, future))
+
+        # While a group for this item is in flight, new purchases simply queue up behind it
+        if item_id not in self._in_flight:
+            if len(batch) >= self._max_batch_size:
+                self._flush(item_id)
+            elif item_id not in self._timers:
+                self._timers[item_id] = loop.call_later(self._window, self._flush, item_id)
+
+        return await future
+
+    async def drain(self) -> None:
+        """Flush all queued purchases and wait for every group to finish."""
+        for item_id in list(self._pending):
+            if item_id not in self._in_flight:
+                self._flush(item_id)
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _flush(self, item_id: int) -> None:
+        timer = self._timers.pop(item_id, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(item_id, None)
+        if not batch:
+            return
+        self._in_flight.add(item_id)
+        task = asyncio.create_task(self._run(item_id, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, item_id: int, batch: list[_PendingPurchase]) -> None:
+        logger.debug("Applying group of %s purchases for item %s", len(batch), item_id)
+        try:
+            results = await self._apply(item_id, [purchase for purchase, _ in batch])
+        except Exception as e:
+            logger.error("Purchase group for item %s failed: %s", item_id, e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results, strict=True):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            self._in_flight.discard(item_id)
+            if item_id in self._pending:
+                self._flush(item_id)
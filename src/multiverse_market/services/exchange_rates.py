@@ -0,0 +1,110 @@
+"""Process-wide exchange rate matrix."""
+
+import asyncio
+import logging
+import time
+import typing as ty
+from decimal import Decimal
+
+from ..infrastructure import EXCHANGE_RATES
+from ..interfaces import CacheBackend
+from ..models.entities import Universe
+from ..repositories import UniverseRepository
+
+logger = logging.getLogger(__name__)
+
+
+class ExchangeRateMatrix:
+    """Immutable N x N table of exchange rates between all universes.
+
+    Rates are precomputed once into a flat, row-major tuple indexed by universe position, so a
+    lookup is two dict hits and an index with no I/O.
+    """
+
+    def __init__(self, universes: ty.Iterable[Universe], version: int) -> None:
+        ordered = sorted(universes, key=lambda u: u.id)
+        self.version = version
+        self._index = {universe.id: position for position, universe in enumerate(ordered)}
+        self._size = len(ordered)
+        self._rates = tuple(
+            Decimal(str(to_universe.exchange_rate / from_universe.exchange_rate))
+            for from_universe in ordered
+            for to_universe in ordered
+        )
+
+    def __contains__(self, universe_id: int) -> bool:
+        return universe_id in self._index
+
+    def rate(self, from_universe_id: int, to_universe_id: int) -> Decimal:
+        """Get the rate converting ``from_universe_id`` currency into ``to_universe_id``.
+
+        Raises:
+            KeyError: If either universe is not part of the matrix.
+        """
+        return self._rates[self._index[from_universe_id] * self._size + self._index[to_universe_id]]
+
+
+class ExchangeRateTable:
+    """Holder of the current ``ExchangeRateMatrix``, shared by every request in a process.
+
+    The matrix is rebuilt from the ``universes`` table only when the generation of the
+    ``EXCHANGE_RATES`` cache namespace changes. That counter is read at most once every
+    ``check_interval`` seconds, so steady-state lookups touch neither Redis nor Postgres. A
+    rebuilt matrix replaces the old one with a single assignment, so readers never observe a
+    half-built table.
+    """
+
+    def __init__(self, check_interval: float = 1.0) -> None:
+        self._check_interval = check_interval
+        self._matrix: ExchangeRateMatrix | None = None
+        self._next_check = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        """Re-check the version on the next lookup instead of waiting for the interval."""
+        self._next_check = 0.0
+
+    async def bump_version(self, cache: CacheBackend) -> None:
+        """Announce a rate change to every process sharing the cache."""
+        await EXCHANGE_RATES.invalidate(cache)
+        self.invalidate()
+
+    async def current(
+        self,
+        cache: CacheBackend,
+        universes: UniverseRepository,
+        *,
+        reload: bool = False,
+        require: ty.Collection[int] = (),
+    ) -> ExchangeRateMatrix:
+        """Get the current matrix, rebuilding it if its version is stale.
+
+        Args:
+            cache: Cache holding the shared version counter.
+            universes: Repository used to rebuild the matrix.
+            reload: Rebuild from the database even if the version is unchanged.
+            require: Rebuild unless the matrix already holds these universes, so callers
+                waiting for the same new universe rebuild it once.
+        """
+        matrix = self._matrix
+        if (
+            matrix is not None
+            and not reload
+            and not require
+            and time.monotonic() < self._next_check
+        ):
+            return matrix
+
+        async with self._lock:
+            matrix = self._matrix
+            rebuild = reload or matrix is None or any(u not in matrix for u in require)
+            if matrix is not None and not rebuild and time.monotonic() < self._next_check:
+                return matrix
+
+            version = await EXCHANGE_RATES.generation(cache)
+            if matrix is None or rebuild or version != matrix.version:
+                logger.info("Building exchange rate matrix at version %s", version)
+                matrix = ExchangeRateMatrix(await universes.list(), version)
+                self._matrix = matrix
+            self._next_check = time.monotonic() + self._check_interval
+            return matrix
@@ -0,0 +1,55 @@
+"""Streaming encoders for trade history exports."""
+
+import csv
+import enum
+import io
+import typing as ty
+from collections.abc import AsyncIterator
+
+from pydantic_core import to_json
+
+from ..models.entities import Transaction
+from ..models.schemas import TransactionSchema
+
+_FIELDS = tuple(TransactionSchema.model_fields)
+
+
+class ExportFormat(enum.StrEnum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+    @property
+    def media_type(self) -> str:
+        return "application/x-ndjson" if self is ExportFormat.NDJSON else "text/csv"
+
+
+def _row(trade: Transaction) -> dict[str, ty.Any]:
+    return {field: getattr(trade, field) for field in _FIELDS}
+
+
+async def encode_trades(
+    batches: AsyncIterator[ty.Sequence[Transaction]], export_format: ExportFormat
+) -> AsyncIterator[bytes]:
+    """Encode batches of trades into one chunk each, in the given format.
+
+    Rows are encoded directly from column values, without validating each one, and every
+    chunk is built from a single batch, so memory stays bounded by the batch size.
+    """
+    if export_format is ExportFormat.NDJSON:
+        async for batch in batches:
+            yield b"".join(to_json(_row(trade)) + b"\n" for trade in batch)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    async for batch in batches:
+        for trade in batch:
+            row = _row(trade)
+            row["transaction_time"] = trade.transaction_time.isoformat()
+            writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
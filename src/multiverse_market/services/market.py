@@ -1,31 +1,108 @@
-import json
+import asyncio
 import logging
 import typing as ty
 from contextlib import asynccontextmanager
 from datetime import UTC, datetime
 from decimal import Decimal
 
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+
 from ..exceptions import (
     InsufficientBalanceException,
     InsufficientStockException,
+    InvalidCursorException,
     ItemNotFoundException,
+    StockHeldException,
     UniverseNotFoundException,
     UserNotFoundException,
 )
+from ..infrastructure import (
+    CATALOG,
+    EXCHANGE_RATES,
+    ITEMS,
+    USERS,
+    CacheNamespace,
+    InventoryCount,
+    ReadThroughCache,
+    RedisInventory,
+    Reservation,
+)
 from ..interfaces import CacheBackend, MarketBackend
-from ..models import CurrencyExchangeResponse
-from ..models.entities import Item, Transaction, Universe, User
-from ..models.requests import CurrencyExchange, ItemPurchase
+from ..models import CurrencyExchangeResponse, TradeHistoryPage
+from ..models.entities import Item, LedgerReason, StockReservation, Transaction, User
+from ..models.requests import BatchItemPurchase, CurrencyExchange, ItemPurchase
 from ..models.schemas import ItemSchema, TransactionSchema, UniverseSchema, UserSchema
-from ..repositories import ItemRepository, TransactionRepository, UniverseRepository, UserRepository
+from ..repositories import (
+    ItemRepository,
+    TransactionRepository,
+    UnitOfWork,
+    UniverseRepository,
+    UserRepository,
+)
+from .batcher import PurchaseBatcher, PurchaseResult
+from .exchange_rates import ExchangeRateTable
+from .pagination import decode_cursor, encode_cursor
 
 logger = logging.getLogger(__name__)
 
+_USER = TypeAdapter(UserSchema)
+_ITEMS = TypeAdapter(list[ItemSchema])
+_UNIVERSES = TypeAdapter(list[UniverseSchema])
+_ITEM_FIELDS = tuple(ItemSchema.model_fields)
+_UNIVERSE_FIELDS = tuple(UniverseSchema.model_fields)
+# Columns a stock reservation shares with the transaction it becomes once applied
+_TRADE_FIELDS = (
+    "buyer_id",
+    "seller_id",
+    "item_id",
+    "amount",
+    "quantity",
+    "from_universe_id",
+    "to_universe_id",
+    "transaction_time",
+)
+
 
-class ItemCache(ty.TypedDict):
-    id: int
-    stock: int
-    price: float
+def _record_reservation(reservation: Reservation, trade: Transaction) -> StockReservation:
+    return StockReservation(
+        key=reservation.key, **{field: getattr(trade, field) for field in _TRADE_FIELDS}
+    )
+
+
+def _reserved_trade(reservation: StockReservation) -> Transaction:
+    return Transaction(**{field: getattr(reservation, field) for field in _TRADE_FIELDS})
+
+
+def _admit_group(
+    purchases: ty.Sequence[ItemPurchase],
+    costs: ty.Mapping[int, Decimal],
+    balances: ty.Mapping[int, Decimal],
+    stock: int,
+    results: dict[int, PurchaseResult],
+    skip: ty.Collection[int] = (),
+) -> list[int]:
+    """Admit the purchases of a group in order, while the stock and their buyer's balance last.
+
+    ``costs`` holds the cost of each purchase whose buyer exists, by index. Purchases in
+    ``skip`` are left out; the others that do not fit get their exception in ``results``.
+    Returns the indexes of the purchases admitted.
+    """
+    balances = dict(balances)
+    admitted = []
+    for index, cost in costs.items():
+        if index in skip:
+            continue
+        purchase = purchases[index]
+        if purchase.quantity > stock:
+            results[index] = InsufficientStockException()
+        elif balances[purchase.buyer_id] < cost:
+            results[index] = InsufficientBalanceException()
+        else:
+            stock -= purchase.quantity
+            balances[purchase.buyer_id] -= cost
+            admitted.append(index)
+    return admitted
 
 
 class MarketService(MarketBackend):
@@ -36,6 +113,11 @@ class MarketService(MarketBackend):
         transaction_repo: TransactionRepository,
         universe_repo: UniverseRepository,
         cache: CacheBackend,
+        unit_of_work: UnitOfWork,
+        purchase_batcher: PurchaseBatcher | None = None,
+        exchange_rates: ExchangeRateTable | None = None,
+        read_through: ReadThroughCache | None = None,
+        inventory: RedisInventory | None = None,
     ):
         logger.debug("Initializing MarketService")
         self._users = user_repo
@@ -43,34 +125,86 @@ class MarketService(MarketBackend):
         self._transactions = transaction_repo
         self._universes = universe_repo
         self._cache = cache
+        self._uow = unit_of_work
+        self._purchase_batcher = purchase_batcher
+        self._exchange_rates = exchange_rates or ExchangeRateTable()
+        self._read_through = read_through or ReadThroughCache()
+        self._inventory = inventory
+        self._generations: dict[str, int] | None = None
 
     @asynccontextmanager
     async def _transaction(self):
-        """Context manager for handling database transactions."""
+        """Run a business operation as one unit of work, committing exactly once."""
         try:
             yield
-            await self._users._session.commit()
+            await self._uow.commit()
         except Exception:
-            await self._users._session.rollback()
+            await self._uow.rollback()
             raise
 
     async def _invalidate_exchange_rate_cache(self, universe_id: int) -> None:
-        """Invalidate all exchange rate caches involving a universe."""
-        universes = await self._universes.list()
-        for universe in universes:
-            if universe.id != universe_id:
-                key1 = f"exchange_rate:{universe_id}:{universe.id}"
-                key2 = f"exchange_rate:{universe.id}:{universe_id}"
-                await self._cache.delete(key1)
-                await self._cache.delete(key2)
+        """Invalidate all exchange rates involving a universe.
+
+        Rates live in a per-process matrix, so this bumps its shared version and every process
+        rebuilds on its next version check.
+        """
+        logger.info("Invalidating exchange rates for universe %s", universe_id)
+        await self._exchange_rates.bump_version(self._cache)
+        self._generations = None
+
+    async def _generation(self, namespace: CacheNamespace) -> int:
+        """Get a namespace generation, resolving all of them once per service instance."""
+        if self._generations is None:
+            namespaces = (USERS, ITEMS, CATALOG, EXCHANGE_RATES)
+            values = await self._cache.get_many([ns.generation_key for ns in namespaces])
+            self._generations = {
+                ns.name: int(value or 0) for ns, value in zip(namespaces, values, strict=True)
+            }
+        return self._generations[namespace.name]
+
+    async def _invalidate_caches(
+        self, user_ids: ty.Iterable[int] = (), item_ids: ty.Iterable[int] = ()
+    ) -> None:
+        """Invalidate user and item caches with a single pipelined round trip.
+
+        Changing any item also moves the catalog to a new version, orphaning cached listings.
+        """
+        item_ids = list(item_ids)
+        user_generation = await self._generation(USERS)
+        item_generation = await self._generation(ITEMS)
+        async with self._cache.pipeline() as pipeline:
+            self._read_through.invalidate(
+                pipeline,
+                *(USERS.key_for(user_generation, user_id) for user_id in user_ids),
+                *(ITEMS.key_for(item_generation, item_id) for item_id in item_ids),
+            )
+            if item_ids:
+                pipeline.incr(CATALOG.generation_key)
+        if item_ids:
+            self._generations = None
 
     async def _invalidate_user_cache(self, user_id: int) -> None:
         """Invalidate user-related caches."""
-        await self._cache.delete(f"user:{user_id}")
+        await self._invalidate_caches(user_ids=[user_id])
 
     async def _invalidate_item_cache(self, item_id: int) -> None:
         """Invalidate item-related caches."""
-        await self._cache.delete(f"item:{item_id}")
+        await self._invalidate_caches(item_ids=[item_id])
+
+    async def _invalidate_all_user_caches(self) -> None:
+        """Invalidate every cached user with a single generation bump."""
+        generation = await USERS.invalidate(self._cache)
+        if self._generations is not None:
+            self._generations[USERS.name] = generation
+
+    async def _invalidate_all_item_caches(self) -> None:
+        """Invalidate every cached item with a single generation bump."""
+        generation = await ITEMS.invalidate(self._cache)
+        if self._generations is not None:
+            self._generations[ITEMS.name] = generation
+        generation = await CATALOG.invalidate(self._cache)
+        if self._generations is not None:
+            self._generations[CATALOG.name] = generation
 
     async def _get_cached_exchange_rate(
         self, from_universe_id: int, to_universe_id: int
@@ -78,32 +212,27 @@ class MarketService(MarketBackend):
         if from_universe_id == to_universe_id:
             raise ValueError("Cannot exchange currency within the same universe")
 
-        cache_key = f"exchange_rate:{from_universe_id}:{to_universe_id}"
-        cached_rate = await self._cache.get(cache_key)
-
-        if cached_rate:
-            return Decimal(cached_rate)
-
-        from_universe = await self._universes.get(from_universe_id)
-        to_universe = await self._universes.get(to_universe_id)
-
-        if (
-            not from_universe
-            or not isinstance(from_universe, Universe)
-            or not to_universe
-            or not isinstance(to_universe, Universe)
-        ):
-            raise UniverseNotFoundException()
-
-        rate = Decimal(str(to_universe.exchange_rate / from_universe.exchange_rate))
-        await self._cache.setex(cache_key, 3600, str(rate))
-        return rate
+        rates = await self._exchange_rates.current(self._cache, self._universes)
+        missing = {u for u in (from_universe_id, to_universe_id) if u not in rates}
+        if missing:
+            # The universe may have been created after the matrix was built. Only rebuild for
+            # universes that exist, so unknown ids cost a lookup rather than a rebuild each
+            if len(await self._universes.get_many(missing)) < len(missing):
+                raise UniverseNotFoundException()
+            rates = await self._exchange_rates.current(
+                self._cache, self._universes, require=missing
+            )
+            if any(u not in rates for u in missing):
+                raise UniverseNotFoundException()
+        return rates.rate(from_universe_id, to_universe_id)
 
     async def exchange_currency(self, exchange: CurrencyExchange) -> CurrencyExchangeResponse:
-        logger.info(f"Processing currency exchange for user {exchange.user_id}")
+        logger.info("Processing currency exchange for user %s", exchange.user_id)
         logger.debug(
-            f"Exchange details: {exchange.amount} from universe {exchange.from_universe_id} "
-            f"to {exchange.to_universe_id}"
+            "Exchange details: %s from universe %s to %s",
+            exchange.amount,
+            exchange.from_universe_id,
+            exchange.to_universe_id,
         )
         async with self._transaction():
             user = await self._users.get(exchange.user_id)
@@ -114,59 +243,89 @@ class MarketService(MarketBackend):
                 exchange.from_universe_id, exchange.to_universe_id
             )
 
-            # Check balance after getting exchange rate
-            if user.balance < exchange.amount:
+            # Check and debit in one conditional update, after getting the exchange rate, so
+            # concurrent exchanges cannot overwrite each other's debit
+            debited = await self._users.debit_balance(
+                user.id, exchange.amount, reason=LedgerReason.EXCHANGE
+            )
+            if debited is None:
                 raise InsufficientBalanceException()
 
             converted_amount = Decimal(str(exchange.amount)) * exchange_rate
-            new_balance = float(Decimal(str(user.balance)) - Decimal(str(exchange.amount)))
-            await self._users.update_balance(user.id, new_balance)
 
-            # Invalidate user cache after balance update
-            await self._invalidate_user_cache(user.id)
+        # Invalidate user cache once the balance update is committed
+        await self._invalidate_user_cache(user.id)
 
-            return CurrencyExchangeResponse(
-                converted_amount=float(converted_amount),
-                from_universe_id=exchange.from_universe_id,
-                to_universe_id=exchange.to_universe_id,
-                exchange_rate=float(exchange_rate),
-            )
+        return CurrencyExchangeResponse(
+            converted_amount=float(converted_amount),
+            from_universe_id=exchange.from_universe_id,
+            to_universe_id=exchange.to_universe_id,
+            exchange_rate=float(exchange_rate),
+        )
 
-    async def buy_item(self, purchase: ItemPurchase) -> TransactionSchema:
-        logger.info(f"Processing item purchase for user {purchase.buyer_id}")
-        logger.debug(f"Purchase details: {purchase.quantity} of item {purchase.item_id}")
-        async with self._transaction():
-            cache_key = f"item:{purchase.item_id}"
-            cached_item = await self._cache.get(cache_key)
+    async def _purchase_cost(self, buyer: User, item: Item, quantity: int) -> Decimal:
+        """Price ``quantity`` units of an item in the buyer's currency."""
+        cost = Decimal(str(item.price)) * Decimal(str(quantity))
+        if buyer.universe_id != item.universe_id:
+            cost *= await self._get_cached_exchange_rate(buyer.universe_id, item.universe_id)
+        return cost
+
+    async def _reserve_stock(self, quantities: ty.Mapping[int, int]) -> dict[int, Reservation]:
+        """Reserve the stock of the items held in Redis, for every item or for none.
+
+        Returns the reservations by item; items whose stock is not held are left out.
+        """
+        reserved: dict[int, Reservation] = {}
+        if self._inventory is None:
+            return reserved
+        try:
+            for item_id, quantity in quantities.items():
+                reservation = await self._inventory.reserve(item_id, quantity)
+                if reservation is not None:
+                    reserved[item_id] = reservation
+        except Exception:
+            await self._release_stock(reserved.values())
+            raise
+        return reserved
 
-            if cached_item:
-                item_data: ItemCache = json.loads(cached_item)
-                item = await self._items.get(purchase.item_id)
-                if item and (item.stock != item_data["stock"] or item.price != item_data["price"]):
-                    # Invalidate cache if either stock or price has changed
-                    await self._cache.delete(cache_key)
+    async def _release_stock(self, reservations: ty.Iterable[Reservation]) -> None:
+        if self._inventory is not None:
+            for reservation in reservations:
+                await self._inventory.release(reservation)
 
-            item = await self._items.get(purchase.item_id)
-            if not item or not isinstance(item, Item):
-                raise ItemNotFoundException()
+    async def buy_item(self, purchase: ItemPurchase) -> TransactionSchema:
+        try:
+            return await self._buy_item(purchase)
+        except StockHeldException:
+            # The item's stock moved to Redis while the purchase waited for its row
+            return await self._buy_item(purchase)
+
+    async def _buy_item(self, purchase: ItemPurchase) -> TransactionSchema:
+        logger.info("Processing item purchase for user %s", purchase.buyer_id)
+        logger.debug("Purchase details: %s of item %s", purchase.quantity, purchase.item_id)
+        reserved = await self._reserve_stock({purchase.item_id: purchase.quantity})
+        if reserved:
+            return await self._buy_reserved(purchase, reserved[purchase.item_id])
+        if self._purchase_batcher is not None:
+            return await self._purchase_batcher.submit(purchase)
 
+        async with self._transaction():
             buyer = await self._users.get(purchase.buyer_id)
             if not buyer or not isinstance(buyer, User):
                 raise UserNotFoundException()
 
-            if item.stock < purchase.quantity:
+            # Check and take stock in one conditional UPDATE; a miss means the item does not
+            # exist, cannot cover the quantity, or has its stock held in Redis.
+            item = await self._items.decrement_stock(purchase.item_id, purchase.quantity)
+            if item is None:
+                item = await self._items.get(purchase.item_id)
+                if item is None:
+                    raise ItemNotFoundException()
+                if item.stock_held:
+                    raise StockHeldException()
                 raise InsufficientStockException()
 
-            total_cost = Decimal(str(item.price)) * Decimal(str(purchase.quantity))
-            if buyer.universe_id != item.universe_id:
-                exchange_rate = await self._get_cached_exchange_rate(
-                    buyer.universe_id, item.universe_id
-                )
-                total_cost *= exchange_rate
-
-            if buyer.balance < float(total_cost):
-                raise InsufficientBalanceException()
-
+            total_cost = await self._purchase_cost(buyer, item, purchase.quantity)
             transaction = Transaction(
                 buyer_id=buyer.id,
                 seller_id=item.universe_id,
@@ -178,44 +337,511 @@ class MarketService(MarketBackend):
                 transaction_time=datetime.now(UTC),
             )
 
-            await self._users.update_balance(
-                buyer.id, float(Decimal(str(buyer.balance)) - total_cost)
+            # Rolling back on failure also restores the stock taken above.
+            debited = await self._users.debit_balance(
+                buyer.id, float(total_cost), reason=LedgerReason.PURCHASE, transaction=transaction
             )
-            await self._items.update_stock(item.id, item.stock - purchase.quantity)
+            if debited is None:
+                raise InsufficientBalanceException()
             transaction = await self._transactions.add(transaction)
 
-            # Invalidate affected caches
-            await self._invalidate_user_cache(buyer.id)
-            await self._invalidate_item_cache(item.id)
+        # Invalidate affected caches once the purchase is committed
+        await self._invalidate_caches(user_ids=[buyer.id], item_ids=[item.id])
+
+        return TransactionSchema.model_validate(transaction)
+
+    async def _buy_reserved(
+        self, purchase: ItemPurchase, reservation: Reservation
+    ) -> TransactionSchema:
+        """Buy stock reserved in Redis, recording the purchase for the reconciler to apply.
+
+        The item's row is neither locked nor updated, and the transaction is only inserted
+        once the reconciler applies the purchase, so the one returned has no id yet. The
+        stock goes back to Redis if the purchase fails.
+        """
+        try:
+            async with self._transaction():
+                buyer = await self._users.get(purchase.buyer_id)
+                if not buyer or not isinstance(buyer, User):
+                    raise UserNotFoundException()
+                item = await self._items.get(purchase.item_id)
+                if item is None:
+                    raise ItemNotFoundException()
+
+                total_cost = await self._purchase_cost(buyer, item, purchase.quantity)
+                # The transaction is not inserted yet, so the ledger entry cannot link it
+                debited = await self._users.debit_balance(
+                    buyer.id, float(total_cost), reason=LedgerReason.PURCHASE
+                )
+                if debited is None:
+                    raise InsufficientBalanceException()
+
+                transaction = Transaction(
+                    buyer_id=buyer.id,
+                    seller_id=item.universe_id,
+                    item_id=item.id,
+                    amount=float(total_cost),
+                    quantity=purchase.quantity,
+                    from_universe_id=buyer.universe_id,
+                    to_universe_id=item.universe_id,
+                    transaction_time=datetime.now(UTC),
+                )
+                await self._items.add_reservations([_record_reservation(reservation, transaction)])
+        except Exception:
+            await self._release_stock([reservation])
+            raise
+
+        await self._invalidate_user_cache(buyer.id)
+
+        return TransactionSchema.model_validate(transaction)
+
+    async def buy_item_group(
+        self, item_id: int, purchases: ty.Sequence[ItemPurchase]
+    ) -> list[PurchaseResult]:
+        """Apply several purchases of one item as a single group commit.
+
+        The item row is locked once, stock is taken with one decrement, buyers are debited
+        with one statement and all transactions are inserted together. Purchases are
+        admitted in order; each gets either its transaction or the exception explaining why
+        it was rejected, without failing the rest of the group. Stock that ran short or a
+        debit that was refused only turns away the purchases that no longer fit, and takes
+        another round trip.
+        """
+        logger.info("Processing group of %s purchases of item %s", len(purchases), item_id)
+        results: dict[int, PurchaseResult] = {}
+        accepted: dict[int, Transaction] = {}
+        async with self._transaction():
+            locked = await self._items.get_many_for_update([item_id])
+            if not locked:
+                return [ItemNotFoundException() for _ in purchases]
+            item = locked[0]
+            if item.stock_held:
+                return [StockHeldException() for _ in purchases]
+
+            buyers = {u.id: u for u in await self._users.get_many(p.buyer_id for p in purchases)}
+            balances = {user_id: Decimal(str(u.balance)) for user_id, u in buyers.items()}
+            rates: dict[int, Decimal] = {}
+            costs: dict[int, Decimal] = {}
+            for index, purchase in enumerate(purchases):
+                buyer = buyers.get(purchase.buyer_id)
+                if buyer is None:
+                    results[index] = UserNotFoundException()
+                    continue
+                cost = Decimal(str(item.price)) * Decimal(str(purchase.quantity))
+                if buyer.universe_id != item.universe_id:
+                    if buyer.universe_id not in rates:
+                        rates[buyer.universe_id] = await self._get_cached_exchange_rate(
+                            buyer.universe_id, item.universe_id
+                        )
+                    cost *= rates[buyer.universe_id]
+                costs[index] = cost
+
+            transaction_time = datetime.now(UTC)
+
+            # The lock only holds off other groups; single purchases of a sharded item take its
+            # stock from the shards, so it may have run short since it was read. The purchases
+            # are then admitted again against the stock left, turning away those that no
+            # longer fit.
+            taken = 0
+            admitted = _admit_group(purchases, costs, balances, item.stock, results)
+            while admitted:
+                quantity = sum(purchases[index].quantity for index in admitted)
+                if await self._items.decrement_stock(item.id, quantity) is not None:
+                    taken = quantity
+                    break
+                stock = (await self._items.get_stocks([item.id])).get(item.id, 0)
+                admitted = _admit_group(purchases, costs, balances, stock, results)
+
+            # Balances were read without a lock, so a concurrent debit may have drained a
+            # buyer. Their last purchase is then turned away and its units offered to the
+            # purchases still waiting, until every admitted purchase is paid for.
+            refused: set[int] = set()
+            while admitted:
+                transactions: dict[int, Transaction] = {}
+                by_buyer: dict[int, list[int]] = {}
+                for index in admitted:
+                    purchase = purchases[index]
+                    buyer = buyers[purchase.buyer_id]
+                    by_buyer.setdefault(buyer.id, []).append(index)
+                    transactions[index] = Transaction(
+                        buyer_id=buyer.id,
+                        seller_id=item.universe_id,
+                        item_id=item.id,
+                        amount=float(costs[index]),
+                        quantity=purchase.quantity,
+                        from_universe_id=buyer.universe_id,
+                        to_universe_id=item.universe_id,
+                        transaction_time=transaction_time,
+                    )
+                debited = await self._users.debit_balances(
+                    {
+                        user_id: float(sum(costs[index] for index in indexes))
+                        for user_id, indexes in by_buyer.items()
+                    },
+                    reason=LedgerReason.PURCHASE,
+                    transactions={
+                        user_id: transactions[indexes[0]]
+                        for user_id, indexes in by_buyer.items()
+                        if len(indexes) == 1
+                    },
+                )
+                for user_id, indexes in by_buyer.items():
+                    if user_id not in debited:
+                        results[indexes[-1]] = InsufficientBalanceException()
+                        refused.add(indexes[-1])
+                        continue
+                    for index in indexes:
+                        accepted[index] = transactions[index]
+                        taken -= purchases[index].quantity
+                        balances[user_id] -= costs[index]
+                if not taken:
+                    break
+                admitted = _admit_group(
+                    purchases, costs, balances, taken, results, skip=accepted.keys() | refused
+                )
 
-            return TransactionSchema.model_validate(transaction)
+            if taken:
+                await self._items.restock(item.id, taken)
+            if accepted:
+                await self._transactions.add_many(list(accepted.values()))
+
+        await self._invalidate_caches(
+            user_ids={t.buyer_id for t in accepted.values()}, item_ids=[item_id]
+        )
+
+        for index, transaction in accepted.items():
+            results[index] = TransactionSchema.model_validate(transaction)
+        return [results[index] for index in range(len(purchases))]
+
+    async def buy_items(self, purchase: BatchItemPurchase) -> ty.Sequence[TransactionSchema]:
+        try:
+            return await self._buy_items(purchase)
+        except StockHeldException:
+            # An item's stock moved to Redis while the cart waited for its row
+            return await self._buy_items(purchase)
+
+    async def _buy_items(self, purchase: BatchItemPurchase) -> ty.Sequence[TransactionSchema]:
+        logger.info("Processing batch purchase for user %s", purchase.buyer_id)
+        logger.debug("Batch purchase details: %s lines", len(purchase.lines))
+        quantities = {line.item_id: line.quantity for line in purchase.lines}
+        # Lines of items held in Redis are reserved there, and recorded for the reconciler
+        reserved = await self._reserve_stock(quantities)
+        unreserved = {i: q for i, q in quantities.items() if i not in reserved}
+        try:
+            async with self._transaction():
+                buyer = await self._users.get(purchase.buyer_id)
+                if not buyer or not isinstance(buyer, User):
+                    raise UserNotFoundException()
+
+                # Lock every item up front, in id order, so overlapping carts cannot deadlock
+                items = {i.id: i for i in await self._items.get_many_for_update(quantities)}
+                if len(items) != len(quantities):
+                    raise ItemNotFoundException()
+                if any(items[item_id].stock_held for item_id in unreserved):
+                    raise StockHeldException()
+                if any(items[item_id].stock < q for item_id, q in unreserved.items()):
+                    raise InsufficientStockException()
+
+                rates: dict[int, Decimal] = {}
+                total_cost = Decimal(0)
+                transaction_time = datetime.now(UTC)
+                transactions: list[Transaction] = []
+                for line in purchase.lines:
+                    item = items[line.item_id]
+                    cost = Decimal(str(item.price)) * Decimal(str(line.quantity))
+                    if buyer.universe_id != item.universe_id:
+                        if item.universe_id not in rates:
+                            rates[item.universe_id] = await self._get_cached_exchange_rate(
+                                buyer.universe_id, item.universe_id
+                            )
+                        cost *= rates[item.universe_id]
+                    total_cost += cost
+                    transactions.append(
+                        Transaction(
+                            buyer_id=buyer.id,
+                            seller_id=item.universe_id,
+                            item_id=item.id,
+                            amount=float(cost),
+                            quantity=line.quantity,
+                            from_universe_id=buyer.universe_id,
+                            to_universe_id=item.universe_id,
+                            transaction_time=transaction_time,
+                        )
+                    )
+
+                if unreserved and await self._items.decrement_stocks(unreserved) < len(unreserved):
+                    raise InsufficientStockException()
+                # A ledger entry only links a transaction it paid for alone, once inserted
+                single = transactions[0] if len(transactions) == 1 and not reserved else None
+                debited = await self._users.debit_balance(
+                    buyer.id, float(total_cost), reason=LedgerReason.PURCHASE, transaction=single
+                )
+                if debited is None:
+                    raise InsufficientBalanceException()
+                await self._transactions.add_many(
+                    [t for t in transactions if t.item_id not in reserved]
+                )
+                if reserved:
+                    await self._items.add_reservations(
+                        [
+                            _record_reservation(reserved[t.item_id], t)
+                            for t in transactions
+                            if t.item_id in reserved
+                        ]
+                    )
+        except Exception:
+            await self._release_stock(reserved.values())
+            raise
+
+        await self._invalidate_caches(user_ids=[buyer.id], item_ids=unreserved)
+
+        return [TransactionSchema.model_validate(t) for t in transactions]
+
+    async def shard_item_stock(self, item_id: int, shards: int | None = None) -> ItemSchema:
+        """Spread an item's stock over ``shards`` rows, or gather it back into one with ``0``.
+
+        Without ``shards``, the stock is rebalanced between the item's current shards.
+        """
+        logger.info("Resharding stock of item %s", item_id)
+        async with self._transaction():
+            item = await self._items.shard_stock(item_id, shards)
+            if item is None:
+                raise ItemNotFoundException()
+
+        await self._invalidate_item_cache(item_id)
+
+        return ItemSchema.model_validate(item)
+
+    async def snapshot_balances(self, batch_size: int = 1000) -> int:
+        """Fold every user's ledger entries into the balance snapshot on their row.
+
+        Users are folded ``batch_size`` at a time, each batch in a transaction of its own;
+        entries appended meanwhile are left for later. Reported balances stay the same.
+        Returns the number of users folded.
+        """
+        logger.info("Snapshotting balances")
+        async with self._transaction():
+            last_entry_id = await self._users.last_entry_id()
+        folded = 0
+        while True:
+            async with self._transaction():
+                user_ids = await self._users.unfolded_users(batch_size, up_to=last_entry_id)
+                if user_ids:
+                    await self._users.snapshot_balances(user_ids)
+            if not user_ids:
+                return folded
+            folded += len(user_ids)
+
+    async def apply_reservations(self, keys: ty.Collection[str]) -> set[str]:
+        """Take purchases of stock held in Redis from their items, and record their trades.
+
+        Returns the keys of the reservations recorded in the database, applied now or before;
+        the purchases of the others have not committed, or never will.
+        """
+        logger.debug("Applying up to %s stock reservations", len(keys))
+        async with self._transaction():
+            applied, recorded = await self._items.apply_reservations(keys)
+            if applied:
+                await self._transactions.add_many([_reserved_trade(r) for r in applied])
+
+        if applied:
+            await self._invalidate_caches(item_ids={r.item_id for r in applied})
+
+        return recorded
+
+    def _held_inventory(self) -> RedisInventory:
+        if self._inventory is None:
+            raise RuntimeError("Stock is only held in Redis with REDIS_INVENTORY enabled")
+        return self._inventory
+
+    async def hold_item_stock(self, item_id: int) -> ItemSchema:
+        """Hold an item's stock in Redis, so purchases reserve it without locking its row.
+
+        A sharded item is unsharded first. The item's row stays locked while its stock is
+        counted, less what earlier reservations still have to take from it, and is marked as
+        held, so purchases waiting for the row no longer take stock from it once it is.
+        """
+        logger.info("Holding stock of item %s in Redis", item_id)
+        inventory = self._held_inventory()
+        async with self._transaction():
+            item = await self._items.shard_stock(item_id, 0)
+            if item is None:
+                raise ItemNotFoundException()
+            stock = await inventory.hold(item_id, item.stock - await inventory.reserved(item_id))
+            await self._items.mark_stock_held(item_id, True)
+
+        await self._invalidate_item_cache(item_id)
+
+        return ItemSchema.model_validate(item).model_copy(update={"stock": stock})
+
+    async def release_item_stock(
+        self, item_id: int, *, timeout: float, poll: float = 0.1
+    ) -> ItemSchema:
+        """Stop holding an item's stock in Redis, once its row reflects every reservation.
+
+        Reservations of the item are refused meanwhile, as if it was sold out, so purchases
+        never take stock from a row that has yet to give up reserved units. If reservations
+        are still pending after ``timeout`` seconds, the item is held as before and
+        ``TimeoutError`` is raised.
+        """
+        logger.info("Releasing stock of item %s from Redis", item_id)
+        inventory = self._held_inventory()
+        await inventory.freeze(item_id)
+        try:
+            async with asyncio.timeout(timeout):
+                while await inventory.reserved(item_id):
+                    await asyncio.sleep(poll)
+        except TimeoutError:
+            await inventory.thaw(item_id)
+            raise
+        # Redis keeps refusing reservations until the row takes purchases again
+        async with self._transaction():
+            item = await self._items.mark_stock_held(item_id, False)
+            if item is None:
+                raise ItemNotFoundException()
+        await inventory.unhold(item_id)
+
+        await self._invalidate_item_cache(item_id)
+
+        return ItemSchema.model_validate(item)
+
+    async def check_inventory(
+        self, *, rechecks: int = 2, pause: float = 1.0
+    ) -> list[InventoryCount]:
+        """Compare the stock of every item held in Redis with its row in the database.
+
+        Items whose counts disagree are counted again up to ``rechecks`` times, ``pause``
+        seconds apart, since a reconciler may be between its commit and its acknowledgement.
+        """
+        inventory = self._held_inventory()
+        counts: dict[int, InventoryCount] = {}
+        item_ids: list[int] | None = None
+        for attempt in range(rechecks + 1):
+            if attempt:
+                await asyncio.sleep(pause)
+            held = await inventory.counts()
+            if item_ids is None:
+                item_ids = list(held)
+            for item_id in [i for i in item_ids if i not in held]:
+                del counts[item_id]
+                item_ids.remove(item_id)
+            stocks = await self._items.get_stocks(item_ids)
+            for item_id in item_ids:
+                counts[item_id] = InventoryCount(item_id, *held[item_id], stocks.get(item_id, 0))
+            item_ids = [item_id for item_id in item_ids if counts[item_id].drift]
+            if not item_ids:
+                break
+        return [counts[item_id] for item_id in sorted(counts)]
 
     async def get_user(self, user_id: int) -> UserSchema:
-        user = await self._users.get(user_id)
-        if not user or not isinstance(user, User):
-            raise UserNotFoundException()
-        return UserSchema.model_validate(user)
+        async def load() -> UserSchema:
+            user = await self._users.get(user_id)
+            if not user or not isinstance(user, User):
+                raise UserNotFoundException()
+            return UserSchema.model_validate(user)
+
+        key = USERS.key_for(await self._generation(USERS), user_id)
+        return await self._read_through.get(self._cache, "user", key, _USER, load)
 
     async def list_items(self, universe_id: int | None = None) -> ty.Sequence[ItemSchema]:
-        logger.debug(f"Listing items with universe_id filter: {universe_id}")
-        if universe_id is not None:
-            universe = await self._universes.get(universe_id)
-            if not universe:
-                raise UniverseNotFoundException()
-        items = await self._items.list(universe_id=universe_id)
-        logger.debug(f"Raw items from repository: {items}")
-        result = [ItemSchema.model_validate(item) for item in items if isinstance(item, Item)]
-        logger.debug(f"Validated items: {result}")
-        return result
+        return _ITEMS.validate_json(await self.list_items_json(universe_id))
+
+    async def list_items_json(self, universe_id: int | None = None) -> bytes:
+        """List items as an encoded JSON array, served from the cache as is on a hit.
+
+        Listings are cached per universe filter under the current catalog version. On a miss,
+        rows are read as plain column values and encoded directly, without building ORM
+        objects or validating each row.
+        """
+        logger.debug("Listing items with universe_id filter: %s", universe_id)
+
+        async def load() -> bytes:
+            if universe_id is not None:
+                universe = await self._universes.get(universe_id)
+                if not universe:
+                    raise UniverseNotFoundException()
+            rows = await self._items.list_rows(_ITEM_FIELDS, universe_id=universe_id)
+            logger.debug("Encoding %s items", len(rows))
+            return to_json(rows)
+
+        suffix = "items:all" if universe_id is None else f"items:{universe_id}"
+        key = CATALOG.key_for(await self._generation(CATALOG), suffix)
+        return await self._read_through.get_raw(self._cache, "items", key, load)
 
     async def list_universes(self) -> ty.Sequence[UniverseSchema]:
-        universes = await self._universes.list()
-        return [UniverseSchema.model_validate(u) for u in universes if isinstance(u, Universe)]
+        return _UNIVERSES.validate_json(await self.list_universes_json())
+
+    async def list_universes_json(self) -> bytes:
+        """List universes as an encoded JSON array, served from the cache as is on a hit."""
+
+        async def load() -> bytes:
+            return to_json(await self._universes.list_rows(_UNIVERSE_FIELDS))
+
+        # Universes change together with their rates, so they share the rate version
+        key = EXCHANGE_RATES.key_for(await self._generation(EXCHANGE_RATES), "universes")
+        return await self._read_through.get_raw(self._cache, "universes", key, load)
+
+    async def warm_caches(self, top_items: int = 0) -> None:
+        """Load the exchange rate matrix and the universe listing ahead of traffic.
+
+        Args:
+            top_items: Also cache the item listings of the universes holding this many of the
+                most traded items, along with the full listing.
+        """
+        matrix = await self._exchange_rates.current(self._cache, self._universes, reload=True)
+        await self.list_universes_json()
+        logger.info("Warmed exchange rates at version %s", matrix.version)
+        if top_items <= 0:
+            return
+
+        item_ids = await self._transactions.most_traded_items(top_items)
+        universe_ids = sorted({item.universe_id for item in await self._items.get_many(item_ids)})
+        await self.list_items_json()
+        for universe_id in universe_ids:
+            await self.list_items_json(universe_id)
+        logger.info("Warmed item listings of %s universes", len(universe_ids))
+
+    async def get_user_trades(
+        self,
+        user_id: int,
+        *,
+        limit: int = 50,
+        before: str | None = None,
+        after: str | None = None,
+    ) -> TradeHistoryPage:
+        """Get one page of a user's trade history, newest first.
+
+        Args:
+            user_id: User whose trades to list.
+            limit: Maximum number of trades on the page.
+            before: Cursor of a previous page's ``next_cursor``, to page towards older trades.
+            after: Cursor of a previous page's ``prev_cursor``, to page towards newer trades.
+        """
+        if before is not None and after is not None:
+            raise InvalidCursorException("Only one of before and after may be given")
+        before_key = decode_cursor(before) if before is not None else None
+        after_key = decode_cursor(after) if after is not None else None
 
-    async def get_user_trades(self, user_id: int) -> ty.Sequence[TransactionSchema]:
-        """Get user's trade history."""
         user = await self._users.get(user_id)
         if not user or not isinstance(user, User):
             raise UserNotFoundException()
-        trades = await self._transactions.get_user_trades(user_id)
-        return [TransactionSchema.model_validate(t) for t in trades if isinstance(t, Transaction)]
+
+        # One extra row tells whether another page follows in the paging direction
+        trades = list(
+            await self._transactions.get_user_trades(
+                user_id, limit=limit + 1, before=before_key, after=after_key
+            )
+        )
+        has_more = len(trades) > limit
+        if after_key is not None:
+            trades = trades[len(trades) - limit :] if has_more else trades
+            newer, older = has_more, bool(trades)
+        else:
+            trades = trades[:limit]
+            newer, older = before_key is not None and bool(trades), has_more
+
+        return TradeHistoryPage(
+            trades=[TransactionSchema.model_validate(t) for t in trades],
+            next_cursor=encode_cursor(trades[-1]) if older else None,
+            prev_cursor=encode_cursor(trades[0]) if newer else None,
+        )
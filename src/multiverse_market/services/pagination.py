@@ -0,0 +1,32 @@
+"""Opaque keyset pagination cursors."""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from ..exceptions import InvalidCursorException
+from ..models.entities import Transaction
+from ..repositories import TradeKey
+
+
+def encode_cursor(transaction: Transaction) -> str:
+    """Encode the position of a trade as a URL-safe token."""
+    payload = json.dumps([transaction.transaction_time.isoformat(), transaction.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> TradeKey:
+    """Decode a token produced by ``encode_cursor``.
+
+    Raises:
+        InvalidCursorException: If the token was not produced by ``encode_cursor``.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        transaction_time, transaction_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(transaction_id, int):
+            raise TypeError(transaction_id)
+        return datetime.fromisoformat(transaction_time), transaction_id
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise InvalidCursorException() from e
@@ -0,0 +1,191 @@
+"""Warm-up of connection pools, compiled statements and caches before taking traffic."""
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import AsyncExitStack
+from datetime import UTC, datetime
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.exc import StaleDataError
+
+from ..models.entities import (
+    Base,
+    Item,
+    LedgerEntry,
+    LedgerReason,
+    StockReservation,
+    Transaction,
+    User,
+)
+from ..models.schemas import ItemSchema, UniverseSchema
+from ..repositories import (
+    BalanceLedger,
+    ConcurrencyControl,
+    ConcurrencyStrategy,
+    ItemRepository,
+    TransactionRepository,
+    UniverseRepository,
+    UserRepository,
+)
+from .market import MarketService
+
+logger = logging.getLogger(__name__)
+
+# Serial ids start at 1, so priming queries for this id match no rows
+_NO_ROW = 0
+
+
+async def fill_pool(engine: AsyncEngine, size: int) -> None:
+    """Open ``size`` connections at once and return them to the engine's pool."""
+    async with AsyncExitStack() as stack:
+        results = await asyncio.gather(
+            *(stack.enter_async_context(engine.connect()) for _ in range(size)),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+
+async def _prime_write(session: AsyncSession, write: Callable[[], Awaitable[object]]) -> None:
+    """Run a write referring to rows that do not exist, in a savepoint rolled back after.
+
+    Databases enforcing foreign keys or row versions refuse the write once its statement is
+    compiled and prepared, which is all priming needs.
+    """
+    savepoint = await session.begin_nested()
+    try:
+        await write()
+    except (IntegrityError, StaleDataError):
+        pass
+    finally:
+        await savepoint.rollback()
+
+
+async def _flush_update(session: AsyncSession, model: type[Base], **values: object) -> None:
+    """Flush a versioned update of the row ``_NO_ROW``, as updates of loaded rows are flushed."""
+    entity = model(id=_NO_ROW, version=0)
+    make_transient_to_detached(entity)
+    session.add(entity)
+    for field, value in values.items():
+        setattr(entity, field, value)
+    await session.flush()
+
+
+async def _flush_insert(session: AsyncSession, entity: Base) -> None:
+    """Flush the insert of a new row, as repositories adding entities do."""
+    session.add(entity)
+    await session.flush()
+
+
+async def prime_statements(
+    session: AsyncSession,
+    concurrency: ConcurrencyControl = ConcurrencyControl(),
+    ledger: BalanceLedger | None = None,
+) -> None:
+    """Run every repository query once, so SQLAlchemy has compiled and cached each of them.
+
+    The repositories use the ``concurrency`` and ``ledger`` of the process, so the queries
+    primed are those its requests run. Queries target an id that matches no rows, and the
+    transaction is rolled back, so the conditional updates change nothing. Inserts and
+    flushed updates run in savepoints, where they may be refused once prepared.
+    """
+    users = UserRepository(session, concurrency, ledger)
+    items = ItemRepository(session, concurrency)
+    transactions = TransactionRepository(session)
+    universes = UniverseRepository(session)
+    key = (datetime.now(UTC), _NO_ROW)
+    trade = {
+        "buyer_id": _NO_ROW,
+        "seller_id": _NO_ROW,
+        "item_id": _NO_ROW,
+        "amount": 0.0,
+        "quantity": 1,
+        "from_universe_id": _NO_ROW,
+        "to_universe_id": _NO_ROW,
+        "transaction_time": key[0],
+    }
+    try:
+        for repository in (users, items, transactions, universes):
+            await repository.get(_NO_ROW)
+            await repository.get_many([_NO_ROW])
+        await items.list_rows(ItemSchema.model_fields, universe_id=_NO_ROW)
+        await universes.list_rows(UniverseSchema.model_fields)
+        await universes.list()
+        await items.get_many_for_update([_NO_ROW])
+        await items.decrement_stock(_NO_ROW, 1)
+        # Only reached for sharded items, which no row of the priming queries is
+        await items._take_from_shards(_NO_ROW, 1, 1)
+        await items.decrement_stocks({_NO_ROW: 1})
+        await items.get_stocks([_NO_ROW])
+        await items.restock(_NO_ROW, 1)
+        await items.apply_reservations([""])
+        await users.debit_balance(_NO_ROW, 0)
+        await users.debit_balances({_NO_ROW: 0})
+        await users.last_entry_id()
+        await users.unfolded_users(1, up_to=_NO_ROW)
+        await users.snapshot_balances([_NO_ROW])
+        await transactions.get_user_trades(_NO_ROW, limit=1)
+        await transactions.get_user_trades(_NO_ROW, limit=1, before=key)
+        await transactions.get_user_trades(_NO_ROW, limit=1, after=key)
+        await transactions.most_traded_items(1)
+
+        await _prime_write(session, lambda: transactions.add_many([Transaction(**trade)]))
+        await _prime_write(
+            session, lambda: items.add_reservations([StockReservation(key="", **trade)])
+        )
+        if concurrency.strategy is ConcurrencyStrategy.OPTIMISTIC:
+            # Compare-and-swaps only run once a row has been read
+            await items._swap(_NO_ROW, "stock", 0, 0)
+            if ledger is None:
+                await users._swap(_NO_ROW, "balance", 0.0, 0)
+        if concurrency.strategy is ConcurrencyStrategy.PESSIMISTIC:
+            # Takes under a row lock flush the row, checking and bumping its version
+            await _prime_write(session, lambda: _flush_update(session, Item, stock=0))
+            if ledger is None:
+                await _prime_write(session, lambda: _flush_update(session, User, balance=0.0))
+        if ledger is not None:
+            entry = LedgerEntry(
+                user_id=_NO_ROW, universe_id=_NO_ROW, delta=0.0, reason=LedgerReason.PURCHASE
+            )
+            await _prime_write(session, lambda: _flush_insert(session, entry))
+            await _prime_write(
+                session,
+                lambda: _flush_update(session, User, balance=0.0, balance_entry_id=_NO_ROW),
+            )
+    finally:
+        await session.rollback()
+
+
+async def warm_up(
+    engine: AsyncEngine,
+    session_factory: async_sessionmaker[AsyncSession],
+    make_service: Callable[[AsyncSession], MarketService],
+    *,
+    pool_size: int,
+    top_items: int = 0,
+    concurrency: ConcurrencyControl = ConcurrencyControl(),
+    ledger: BalanceLedger | None = None,
+) -> None:
+    """Warm a process up so its first requests are served as fast as later ones.
+
+    Args:
+        engine: Engine whose pool to fill.
+        session_factory: Factory of sessions bound to ``engine``.
+        make_service: Builds the market service used to warm the caches.
+        pool_size: Number of connections to open.
+        top_items: Number of most traded items whose listings are cached; 0 skips them.
+        concurrency: Conditional update strategy of the process's repositories.
+        ledger: Balance ledger of the process's user repositories, if enabled.
+    """
+    started = time.perf_counter()
+    await fill_pool(engine, pool_size)
+    async with session_factory() as session:
+        await prime_statements(session, concurrency, ledger)
+    async with session_factory() as session:
+        await make_service(session).warm_caches(top_items)
+    logger.info("Warm-up completed in %.2fs", time.perf_counter() - started)
@@ -0,0 +1,72 @@
+"""Benchmark encoding of the ``/items`` listing.
+
+Compares, for catalogs of increasing size, the per-row path the endpoint used to take (ORM
+objects validated into ``ItemSchema``, re-validated by ``response_model`` and encoded through
+``jsonable_encoder``) with the encoding done by ``list_items_json`` on a cache miss and the
+bytes it returns on a cache hit. No database or Redis is needed::
+
+    python -m tests.benchmarks.bench_list_serialization --sizes 10000 100000
+"""
+
+import argparse
+import json
+import logging
+import time
+from collections.abc import Callable
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+
+from multiverse_market.models.entities import Item
+from multiverse_market.models.schemas import ItemSchema
+
+logger = logging.getLogger(__name__)
+
+ITEMS = TypeAdapter(list[ItemSchema])
+FIELDS = tuple(ItemSchema.model_fields)
+
+
+def make_items(size: int) -> list[Item]:
+    return [
+        Item(id=i, name=f"Item {i}", universe_id=i % 5 + 1, price=i * 0.25 + 1, stock=i % 100)
+        for i in range(1, size + 1)
+    ]
+
+
+def per_row_validation(items: list[Item]) -> bytes:
+    validated = [ItemSchema.model_validate(item) for item in items]
+    response = ITEMS.validate_python(validated)
+    return json.dumps(jsonable_encoder(response)).encode()
+
+
+def best_of(repeats: int, run: Callable[[], bytes]) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'items':>8} {'per-row (ms)':>13} {'miss (ms)':>10} {'hit (ms)':>9}")
+    for size in args.sizes:
+        items = make_items(size)
+        rows = [{field: getattr(item, field) for field in FIELDS} for item in items]
+        cached = to_json(rows).decode()
+        assert json.loads(cached) == json.loads(per_row_validation(items))
+
+        per_row = best_of(args.repeats, lambda: per_row_validation(items))
+        miss = best_of(args.repeats, lambda: to_json(rows))
+        hit = best_of(args.repeats, lambda: cached.encode())
+        print(f"{size:>8} {per_row * 1000:>13.1f} {miss * 1000:>10.1f} {hit * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Benchmark ``buy_item`` with logging at INFO under different logging pipelines.
+
+Purchases run against in-memory repositories, so logging is a large share of their cost.
+Each one is dispatched as an HTTP request through ``LogSamplingMiddleware``, and compared:
+
+- ``off``: logging at WARNING, the floor;
+- ``inline``: console and file handlers called from the event loop, as before;
+- ``queue``: the same handlers behind a ``QueueListener`` thread, as ``setup_logging`` does;
+- ``queue, sampled``: the queue with only ``--sample-rate`` of requests keeping INFO records.
+
+Handlers write to a temporary directory, so nothing reaches the terminal::
+
+    python -m tests.benchmarks.bench_logging --purchases 20000
+"""
+
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+from collections.abc import Callable
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from queue import SimpleQueue
+
+from starlette.types import Receive, Scope, Send
+
+from multiverse_market.logging_config import LOG_FORMAT, LogSamplingMiddleware, RequestSampler
+from multiverse_market.models.entities import Item, Universe, User
+from multiverse_market.models.requests import ItemPurchase
+from multiverse_market.services import MarketService
+from tests.unit.mocks import (
+    InMemoryCacheService,
+    MockItemRepository,
+    MockTransactionRepository,
+    MockUnitOfWork,
+    MockUniverseRepository,
+    MockUserRepository,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def make_service() -> MarketService:
+    users, items, universes = MockUserRepository(), MockItemRepository(), MockUniverseRepository()
+    universes._universes[1] = Universe(id=1, name="Earth", currency_type="USD", exchange_rate=1)
+    users._users[1] = User(id=1, username="buyer", universe_id=1, balance=1e12)
+    items._items[1] = Item(id=1, name="Coffee", universe_id=1, price=1.0, stock=10**9)
+    return MarketService(
+        users,
+        items,
+        MockTransactionRepository(),
+        universes,
+        InMemoryCacheService(),
+        MockUnitOfWork(),
+    )
+
+
+def sinks(directory: Path) -> list[logging.Handler]:
+    console = logging.StreamHandler((directory / "console.log").open("a"))
+    file = RotatingFileHandler(directory / "market.log", maxBytes=10485760, backupCount=5)
+    for handler in (console, file):
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return [console, file]
+
+
+def configure(level: int, handlers: list[logging.Handler]) -> None:
+    app_logger = logging.getLogger("multiverse_market")
+    for handler in list(app_logger.handlers):
+        app_logger.removeHandler(handler)
+        handler.close()
+    app_logger.propagate = False
+    app_logger.setLevel(level)
+    for handler in handlers:
+        app_logger.addHandler(handler)
+
+
+async def run(purchases: int, sample_rate: float) -> float:
+    service = make_service()
+    purchase = ItemPurchase(buyer_id=1, item_id=1, quantity=1)
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        await service.buy_item(purchase)
+
+    async def receive() -> dict:
+        return {"type": "http.request"}
+
+    async def send(_: dict) -> None:
+        pass
+
+    middleware = LogSamplingMiddleware(app, rate=sample_rate)
+    await middleware({"type": "http"}, receive, send)  # warm up
+    started = time.perf_counter()
+    for _ in range(purchases):
+        await middleware({"type": "http"}, receive, send)
+    return time.perf_counter() - started
+
+
+async def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory)
+
+        def inline() -> tuple[list[logging.Handler], Callable[[], None]]:
+            return sinks(path), lambda: None
+
+        def queued() -> tuple[list[logging.Handler], Callable[[], None]]:
+            handler = QueueHandler(SimpleQueue())
+            handler.addFilter(RequestSampler())
+            listener = QueueListener(handler.queue, *sinks(path))
+            listener.start()
+            return [handler], listener.stop
+
+        modes = [
+            ("off", logging.WARNING, inline, 1.0),
+            ("inline", logging.INFO, inline, 1.0),
+            ("queue", logging.INFO, queued, 1.0),
+            (f"queue, {args.sample_rate:.0%} sampled", logging.INFO, queued, args.sample_rate),
+        ]
+        print(f"{args.purchases} purchases, logging at INFO")
+        print(f"{'pipeline':<20} {'us/purchase':>12} {'purchases/s':>12}")
+        for name, level, pipeline, rate in modes:
+            handlers, stop = pipeline()
+            configure(level, handlers)
+            elapsed = await run(args.purchases, rate)
+            stop()
+            per_purchase = elapsed / args.purchases * 1e6
+            print(f"{name:<20} {per_purchase:>12.1f} {args.purchases / elapsed:>12.0f}")
+        configure(logging.WARNING, [])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--purchases", type=int, default=20_000)
+    parser.add_argument("--sample-rate", type=float, default=0.1)
+    asyncio.run(main(parser.parse_args()))
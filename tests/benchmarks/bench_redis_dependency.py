@@ -0,0 +1,114 @@
+"""Benchmark the per-request Redis handshake against the application-lifetime client.
+
+Each simulated request resolves the Redis dependency and then does the cache reads of a
+``/universes`` hit (one MGET of the generation counters, one GET of the listing). It runs
+once with the dependency that used to ping Redis and close the client on every request, and
+once with the application-lifetime client that requests borrow pooled connections from::
+
+    python -m tests.benchmarks.bench_redis_dependency --redis-url redis://localhost:6379/15
+
+The Redis database is flushed; point it at a scratch database.
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from collections.abc import AsyncGenerator, Callable
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+
+from redis.asyncio import BlockingConnectionPool, Redis
+
+from multiverse_market.infrastructure import CATALOG, EXCHANGE_RATES, ITEMS, USERS, RedisCache
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEYS = [ns.generation_key for ns in (USERS, ITEMS, CATALOG, EXCHANGE_RATES)]
+LISTING_KEY = EXCHANGE_RATES.key_for(0, "universes")
+
+Dependency = Callable[[], AbstractAsyncContextManager[Redis]]
+
+
+def ping_and_close(redis: Redis) -> Dependency:
+    """Recreate the dependency that pinged Redis and closed the client on every request."""
+
+    @asynccontextmanager
+    async def get_redis() -> AsyncGenerator[Redis, None]:
+        for attempt in range(3):
+            try:
+                await redis.ping()
+                try:
+                    yield redis
+                finally:
+                    await redis.aclose()
+                return
+            except Exception:
+                if attempt == 2:
+                    raise
+                await asyncio.sleep(0.1 * (attempt + 1))
+
+    return get_redis
+
+
+def lifetime_client(redis: Redis) -> Dependency:
+    @asynccontextmanager
+    async def get_redis() -> AsyncGenerator[Redis, None]:
+        yield redis
+
+    return get_redis
+
+
+async def measure(
+    dependency: Dependency, requests: int, concurrency: int
+) -> tuple[list[float], float]:
+    latencies: list[float] = []
+
+    async def worker(count: int) -> None:
+        for _ in range(count):
+            started = time.perf_counter()
+            async with dependency() as redis:
+                cache = RedisCache(redis)
+                await cache.get_many(GENERATION_KEYS)
+                assert await cache.get(LISTING_KEY) is not None
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+async def main(args: argparse.Namespace) -> None:
+    pool = BlockingConnectionPool.from_url(
+        args.redis_url, decode_responses=True, max_connections=args.max_connections
+    )
+    redis = Redis(connection_pool=pool)
+    await redis.flushdb()
+    await redis.set(LISTING_KEY, '[{"id": 1, "name": "Earth"}]')
+
+    modes = {"ping + close": ping_and_close(redis), "lifetime client": lifetime_client(redis)}
+    print(f"{args.requests} requests, {args.concurrency} at a time")
+    print(f"{'dependency':<16} {'mean (ms)':>10} {'p50 (ms)':>9} {'p99 (ms)':>9} {'req/s':>8}")
+    try:
+        for name, dependency in modes.items():
+            await measure(dependency, args.concurrency * 10, args.concurrency)  # warm up
+            latencies, elapsed = await measure(dependency, args.requests, args.concurrency)
+            percentiles = statistics.quantiles(latencies, n=100)
+            print(
+                f"{name:<16} {statistics.mean(latencies) * 1000:>10.3f} "
+                f"{percentiles[49] * 1000:>9.3f} {percentiles[98] * 1000:>9.3f} "
+                f"{len(latencies) / elapsed:>8.0f}"
+            )
+    finally:
+        await redis.flushdb()
+        await redis.aclose()
+        await pool.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--redis-url", required=True, help="Scratch Redis database (flushed)")
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--max-connections", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
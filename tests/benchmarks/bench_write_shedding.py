@@ -0,0 +1,106 @@
+"""Benchmark read latency during a spike of purchases, with and without write shedding.
+
+Readers fetch users in a loop while a spike of writers buys items, honouring ``Retry-After``
+when shed as well-behaved clients do. The spike runs once with the write limiter disabled
+and once as configured by the ``WRITE_*`` settings. Requests go through the whole
+application in-process, against the database and Redis the settings point at::
+
+    python -m tests.benchmarks.bench_write_shedding --writers 300 --readers 10
+
+Purchases change the data; run it against a database seeded with ``multiverse-market
+generate``, whose user and item counts ``--users`` and ``--items`` should match.
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import Counter
+
+import httpx
+
+from multiverse_market import dependencies
+from multiverse_market.infrastructure import WriteLimiter
+from multiverse_market.main import app
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(latencies: list[float], q: float) -> float:
+    return sorted(latencies)[max(0, math.ceil(len(latencies) * q) - 1)] * 1000
+
+
+async def spike(client: httpx.AsyncClient, args: argparse.Namespace) -> None:
+    reads: list[float] = []
+    writes: list[float] = []
+    statuses: Counter[int] = Counter()
+    done = asyncio.Event()
+
+    async def reader() -> None:
+        while not done.is_set():
+            started = time.perf_counter()
+            await client.get(f"/api/v1/users/{random.randint(1, args.users)}")
+            reads.append(time.perf_counter() - started)
+
+    async def writer() -> None:
+        for _ in range(args.writes):
+            purchase = {
+                "buyer_id": random.randint(1, args.users),
+                "item_id": random.randint(1, args.items),
+                "quantity": 1,
+            }
+            started = time.perf_counter()
+            while True:
+                response = await client.post("/api/v1/buy", json=purchase)
+                statuses[response.status_code] += 1
+                if response.status_code != 429:
+                    break
+                retry_after = float(response.headers["Retry-After"])
+                await asyncio.sleep(retry_after * random.uniform(0.5, 1.5))
+            writes.append(time.perf_counter() - started)
+
+    readers = [asyncio.create_task(reader()) for _ in range(args.readers)]
+    started = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(args.writers)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await asyncio.gather(*readers)
+
+    print(
+        f"{elapsed:>7.1f}s {len(reads) / elapsed:>8.0f} {percentile(reads, 0.5):>8.0f}"
+        f" {percentile(reads, 0.99):>8.0f} {percentile(writes, 0.99):>9.0f}"
+        f" {statuses[429]:>7}"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    logging.disable(logging.CRITICAL)
+    configured = dependencies.write_limiter
+    unlimited = WriteLimiter(10**6, math.inf, lambda: 0.0, queue_timeout=math.inf)
+
+    async with app.router.lifespan_context(app):
+        await dependencies.warmed_up.wait()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"{args.writers} writers x {args.writes} purchases, {args.readers} readers")
+            print(
+                f"{'limiter':<10} {'elapsed':>8} {'reads/s':>8} {'read p50':>8}"
+                f" {'read p99':>8} {'write p99':>9} {'shed':>7}  (ms)"
+            )
+            for name, limiter in (("off", unlimited), ("on", configured)):
+                dependencies.write_limiter = limiter
+                print(f"{name:<10}", end=" ", flush=True)
+                await spike(client, args)
+    dependencies.write_limiter = configured
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=300)
+    parser.add_argument("--writes", type=int, default=5, help="purchases per writer")
+    parser.add_argument("--readers", type=int, default=10)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=50_000)
+    asyncio.run(main(parser.parse_args()))
@@ -1,8 +1,9 @@
 """Integration test fixtures and configuration."""
 import logging
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Iterator
 
 import httpx
+import pytest
 import pytest_asyncio
 from httpx import AsyncClient
 from redis.asyncio import Redis
@@ -14,7 +15,8 @@ from sqlalchemy.ext.asyncio import (
 )
 
 from multiverse_market.config import Settings
-from multiverse_market.dependencies import get_db, get_redis
+from multiverse_market.dependencies import get_db, get_redis, get_session_factory
+from multiverse_market.infrastructure import QueryStats, track_queries
 from multiverse_market.main import app
 from multiverse_market.models.entities import Base, Item, Universe, User
 
@@ -78,6 +80,9 @@ async def test_app(test_db: AsyncSession, test_redis: Redis) -> AsyncGenerator[A
 
     app.dependency_overrides[get_db] = _override_get_db
     app.dependency_overrides[get_redis] = _override_get_redis
+    app.dependency_overrides[get_session_factory] = lambda: async_sessionmaker(
+        test_db.bind, expire_on_commit=False
+    )
 
     async with AsyncClient(
         transport=httpx.ASGITransport(app=app),
@@ -87,6 +92,15 @@ async def test_app(test_db: AsyncSession, test_redis: Redis) -> AsyncGenerator[A
 
     app.dependency_overrides.clear()
 
+@pytest.fixture
+def query_stats() -> Iterator[QueryStats]:
+    """Account the SQL statements and Redis commands issued by the rest of the test.
+
+    Request it after the fixtures whose setup should not count, such as ``setup_test_data``.
+    """
+    with track_queries() as stats:
+        yield stats
+
 @pytest_asyncio.fixture(scope="function")
 async def setup_test_data(test_db: AsyncSession) -> None:
     """Initialize test data in a single transaction."""
@@ -123,6 +137,6 @@ async def setup_test_data(test_db: AsyncSession) -> None:
 
             logger.info("Test data initialized successfully")
         except Exception as e:
-            logger.error(f"Error initializing test data: {e}")
+            logger.error("Error initializing test data: %s", e)
             await test_db.rollback()
             raise 
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""Integration tests for rate limiting and load shedding."""
+
+import httpx
+import pytest
+from httpx import AsyncClient
+
+from multiverse_market import dependencies
+from multiverse_market.exceptions import TooManyRequestsException
+from multiverse_market.main import app
+
+PURCHASE = {"buyer_id": 1, "item_id": 1, "quantity": 1}
+
+
+@pytest.mark.integration
+class TestAdmission:
+    @pytest.mark.asyncio
+    async def test_client_token_bucket(
+        self, test_app: AsyncClient, setup_test_data: None, monkeypatch: pytest.MonkeyPatch
+    ):
+        """Test that a client beyond its burst gets 429, whichever user it names."""
+        monkeypatch.setattr(dependencies.settings, "RATE_LIMITING", True)
+        monkeypatch.setattr(dependencies.settings, "RATE_LIMIT_CLIENT_BURST", 2)
+        monkeypatch.setattr(dependencies.settings, "RATE_LIMIT_CLIENT_RATE", 0.5)
+
+        statuses = [(await test_app.get("/api/v1/users/1")).status_code for _ in range(2)]
+        response = await test_app.post("/api/v1/buy", json={**PURCHASE, "buyer_id": 2})
+
+        assert statuses == [200, 200]
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "2"
+
+        # Another client naming the same user has a bucket of its own
+        transport = httpx.ASGITransport(app=app, client=("10.0.0.2", 123))
+        async with AsyncClient(transport=transport, base_url="http://test") as other:
+            assert (await other.get("/api/v1/users/1")).status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_clients_behind_trusted_proxies_have_buckets_of_their_own(
+        self, test_app: AsyncClient, setup_test_data: None, monkeypatch: pytest.MonkeyPatch
+    ):
+        """Test that clients are told apart by X-Forwarded-For only behind trusted proxies."""
+        monkeypatch.setattr(dependencies.settings, "RATE_LIMITING", True)
+        monkeypatch.setattr(dependencies.settings, "RATE_LIMIT_CLIENT_BURST", 1)
+        monkeypatch.setattr(dependencies.settings, "RATE_LIMIT_CLIENT_RATE", 0.5)
+        monkeypatch.setattr(dependencies.settings, "RATE_LIMIT_TRUSTED_PROXIES", ["127.0.0.0/8"])
+
+        async def status(client: AsyncClient, forwarded: str) -> int:
+            response = await client.get("/api/v1/users/1", headers={"X-Forwarded-For": forwarded})
+            return response.status_code
+
+        assert await status(test_app, "203.0.113.1") == 200
+        assert await status(test_app, "203.0.113.1") == 429
+        # An entry forged by the client is skipped for the one the proxy added
+        assert await status(test_app, "203.0.113.1, 203.0.113.2") == 200
+
+        # Other clients cannot escape their bucket by sending the header themselves
+        transport = httpx.ASGITransport(app=app, client=("10.0.0.2", 123))
+        async with AsyncClient(transport=transport, base_url="http://test") as other:
+            assert await status(other, "203.0.113.3") == 200
+            assert await status(other, "203.0.113.4") == 429
+
+    @pytest.mark.asyncio
+    async def test_malformed_bodies_are_rejected_before_admission(
+        self, test_app: AsyncClient, setup_test_data: None, monkeypatch: pytest.MonkeyPatch
+    ):
+        """Test that a body that is not JSON gets 422 with rate limiting on."""
+        monkeypatch.setattr(dependencies.settings, "RATE_LIMITING", True)
+
+        response = await test_app.post(
+            "/api/v1/buy", content="{not json", headers={"Content-Type": "application/json"}
+        )
+
+        assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    async def test_writes_are_shed_while_the_pool_is_congested(
+        self, test_app: AsyncClient, setup_test_data: None, monkeypatch: pytest.MonkeyPatch
+    ):
+        """Test that writes get 429 when checkouts wait too long, and reads still pass."""
+        monkeypatch.setattr(dependencies.write_limiter, "_checkout_wait", lambda: 1.0)
+
+        response = await test_app.post("/api/v1/buy", json=PURCHASE)
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+        assert (await test_app.get("/api/v1/items")).status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_shedding_follows_the_pool_after_dispose(self):
+        """Test that the write limiter reads the wait of the pool replacing a disposed one."""
+        await dependencies.engine.dispose()
+        dependencies.engine.pool.recent_wait.observe(10.0)
+        try:
+            with pytest.raises(TooManyRequestsException):
+                async with dependencies.write_limiter.admit():
+                    pass
+        finally:
+            # A fresh pool, so later tests are not shed
+            await dependencies.engine.dispose()
@@ -1,9 +1,14 @@
 """Integration tests for the API endpoints."""
+import asyncio
+import csv
+import io
+import json
 import logging
 
 import pytest
 from httpx import AsyncClient
 
+from multiverse_market import dependencies
 from multiverse_market.models.requests import CurrencyExchange, ItemPurchase
 
 logger = logging.getLogger(__name__)
@@ -18,6 +23,44 @@ class TestAPI:
         assert response.status_code == 200
         assert response.json() == {"status": "healthy"}
 
+    @pytest.mark.asyncio
+    async def test_readiness_follows_warm_up(
+        self, test_app: AsyncClient, monkeypatch: pytest.MonkeyPatch
+    ):
+        """Test that a live process only reports ready once warm and healthy."""
+        monkeypatch.setattr(dependencies, "warmed_up", asyncio.Event())
+        monkeypatch.setattr(
+            dependencies.health_monitor, "status", {"database": True, "redis": True}
+        )
+
+        assert (await test_app.get("/health/live")).status_code == 200
+        response = await test_app.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "not ready"
+
+        dependencies.warmed_up.set()
+        response = await test_app.get("/health/ready")
+        assert response.status_code == 200
+        assert response.json() == {
+            "status": "ready",
+            "checks": {"database": True, "redis": True},
+        }
+
+        dependencies.health_monitor.status["redis"] = False
+        assert (await test_app.get("/health/ready")).status_code == 503
+
+    @pytest.mark.asyncio
+    async def test_metrics(self, test_app: AsyncClient, setup_test_data: None):
+        """Test that requests show up in the Prometheus metrics by route template."""
+        await test_app.get("/api/v1/users/1")
+
+        response = await test_app.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert '/users/{user_id}",status="200"}' in response.text
+        assert 'repository_call_duration_seconds_count{repository="UserRepository"' in response.text
+        assert 'pool_saturation_ratio{pool="redis"}' in response.text
+
     @pytest.mark.asyncio
     async def test_list_universes(self, test_app: AsyncClient, setup_test_data: None):
         """Test listing universes."""
@@ -96,6 +139,29 @@ class TestAPI:
         assert result["to_universe_id"] == 1
         assert result["transaction_time"] is not None
 
+    @pytest.mark.asyncio
+    async def test_buy_items_batch(self, test_app: AsyncClient, setup_test_data: None):
+        """Test buying several items in one all-or-nothing request."""
+        purchase_data = {
+            "buyer_id": 1,
+            "lines": [{"item_id": 1, "quantity": 2}, {"item_id": 2, "quantity": 1}],
+        }
+        response = await test_app.post("/api/v1/buy/batch", json=purchase_data)
+        assert response.status_code == 200
+        results = response.json()
+        assert [r["item_id"] for r in results] == [1, 2]
+        assert [r["amount"] for r in results] == [200.0, 500.0]  # Mars item at rate 2.5
+
+        # A short line fails the whole batch and leaves stock untouched
+        purchase_data["lines"][1]["quantity"] = 10
+        response = await test_app.post("/api/v1/buy/batch", json=purchase_data)
+        assert response.status_code == 400
+        assert "Insufficient stock" in response.json()["detail"]
+
+        response = await test_app.get("/api/v1/items")
+        stocks = {item["id"]: item["stock"] for item in response.json()}
+        assert stocks == {1: 8, 2: 4}
+
     @pytest.mark.asyncio
     async def test_get_user_trades(self, test_app: AsyncClient, setup_test_data: None):
         """Test getting user trades."""
@@ -111,7 +177,9 @@ class TestAPI:
         # Test getting trades
         response = await test_app.get("/api/v1/users/1/trades")
         assert response.status_code == 200
-        trades = response.json()
+        page = response.json()
+        assert page["next_cursor"] is None
+        trades = page["trades"]
         assert len(trades) == 1
         trade = trades[0]
         assert trade["buyer_id"] == 1
@@ -119,6 +187,55 @@ class TestAPI:
         assert trade["quantity"] == 1
         assert trade["amount"] == 100.0
 
+    @pytest.mark.asyncio
+    async def test_get_user_trades_pagination(self, test_app: AsyncClient, setup_test_data: None):
+        """Test paging through trades with keyset cursors."""
+        for quantity in (1, 2, 3):
+            purchase_data = ItemPurchase(buyer_id=1, item_id=1, quantity=quantity).model_dump()
+            response = await test_app.post("/api/v1/buy", json=purchase_data)
+            assert response.status_code == 200
+
+        quantities = []
+        params: dict = {"limit": 2}
+        while True:
+            response = await test_app.get("/api/v1/users/1/trades", params=params)
+            assert response.status_code == 200
+            page = response.json()
+            quantities += [trade["quantity"] for trade in page["trades"]]
+            if page["next_cursor"] is None:
+                break
+            params = {"limit": 2, "before": page["next_cursor"]}
+        assert quantities == [3, 2, 1]
+
+        params = {"after": page["prev_cursor"]}
+        response = await test_app.get("/api/v1/users/1/trades", params=params)
+        assert [trade["quantity"] for trade in response.json()["trades"]] == [3, 2]
+
+        response = await test_app.get("/api/v1/users/1/trades", params={"before": "garbage"})
+        assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_export_user_trades(self, test_app: AsyncClient, setup_test_data: None):
+        """Test streaming the whole trade history as NDJSON and CSV."""
+        for quantity in (1, 2):
+            purchase_data = ItemPurchase(buyer_id=1, item_id=1, quantity=quantity).model_dump()
+            response = await test_app.post("/api/v1/buy", json=purchase_data)
+            assert response.status_code == 200
+
+        response = await test_app.get("/api/v1/users/1/trades/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["quantity"] for row in rows] == [2, 1]
+
+        response = await test_app.get("/api/v1/users/1/trades/export", params={"format": "csv"})
+        assert response.status_code == 200
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row["quantity"] for row in rows] == ["2", "1"]
+
+        response = await test_app.get("/api/v1/users/999/trades/export")
+        assert response.status_code == 404
+
     @pytest.mark.asyncio
     async def test_error_responses(self, test_app: AsyncClient, setup_test_data: None):
         """Test error responses."""
@@ -0,0 +1,143 @@
+"""Integration tests for balances kept as an append-only ledger with snapshots."""
+
+import pytest
+from httpx import AsyncClient
+from redis.asyncio import Redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from multiverse_market import dependencies
+from multiverse_market.infrastructure import RedisCache
+from multiverse_market.models.entities import LedgerEntry, Transaction, User
+from multiverse_market.repositories import (
+    BalanceLedger,
+    ItemRepository,
+    SQLAlchemyUnitOfWork,
+    TransactionRepository,
+    UniverseRepository,
+    UserRepository,
+)
+from multiverse_market.services import MarketService
+
+
+async def snapshot(session: AsyncSession, user_id: int) -> tuple[float, int]:
+    result = await session.execute(
+        select(User.balance, User.balance_entry_id).where(User.id == user_id)
+    )
+    return result.one()
+
+
+async def entries(session: AsyncSession, user_id: int) -> list[tuple[float, str, int | None]]:
+    result = await session.execute(
+        select(LedgerEntry.delta, LedgerEntry.reason, LedgerEntry.transaction_id)
+        .where(LedgerEntry.user_id == user_id)
+        .order_by(LedgerEntry.id)
+    )
+    return list(result.tuples().all())
+
+
+async def reported_balance(test_app: AsyncClient, user_id: int) -> float:
+    return (await test_app.get(f"/api/v1/users/{user_id}")).json()["balance"]
+
+
+@pytest.fixture
+def balance_ledger(monkeypatch: pytest.MonkeyPatch) -> BalanceLedger:
+    ledger = BalanceLedger(snapshot_every=3)
+    monkeypatch.setattr(dependencies, "ledger", ledger)
+    return ledger
+
+
+@pytest.mark.integration
+class TestBalanceLedger:
+    @pytest.mark.asyncio
+    async def test_debits_append_entries(
+        self,
+        test_app: AsyncClient,
+        test_db: AsyncSession,
+        setup_test_data: None,
+        balance_ledger: BalanceLedger,
+    ):
+        """Test that debits are appended, leaving the snapshot alone until they are folded."""
+        purchase = {"buyer_id": 1, "item_id": 1, "quantity": 2}
+        response = await test_app.post("/api/v1/buy", json=purchase)
+        assert response.status_code == 200
+        trade_id = response.json()["id"]
+        exchange = {"user_id": 1, "from_universe_id": 1, "to_universe_id": 2, "amount": 50.0}
+        assert (await test_app.post("/api/v1/exchange", json=exchange)).status_code == 200
+
+        assert await reported_balance(test_app, 1) == 750.0
+        assert await snapshot(test_db, 1) == (1000.0, 0)
+        assert await entries(test_db, 1) == [
+            (-200.0, "purchase", trade_id),
+            (-50.0, "exchange", None),
+        ]
+
+        # The third entry folds them all into the snapshot
+        purchase_data = {
+            "buyer_id": 1,
+            "lines": [{"item_id": 1, "quantity": 1}, {"item_id": 2, "quantity": 1}],
+        }
+        response = await test_app.post("/api/v1/buy/batch", json=purchase_data)
+        assert response.status_code == 200
+        assert await reported_balance(test_app, 1) == 150.0
+        [*_, (delta, _, linked)] = await entries(test_db, 1)
+        assert (delta, linked) == (-600.0, None)
+        balance, entry_id = await snapshot(test_db, 1)
+        result = await test_db.execute(select(LedgerEntry.id).order_by(LedgerEntry.id.desc()))
+        assert (balance, entry_id) == (150.0, result.scalars().first())
+
+    @pytest.mark.asyncio
+    async def test_debits_never_overdraw(
+        self,
+        test_app: AsyncClient,
+        test_db: AsyncSession,
+        setup_test_data: None,
+        balance_ledger: BalanceLedger,
+    ):
+        """Test that the balance checked covers the entries appended since the snapshot."""
+        exchange = {"user_id": 1, "from_universe_id": 1, "to_universe_id": 2, "amount": 600.0}
+        assert (await test_app.post("/api/v1/exchange", json=exchange)).status_code == 200
+        response = await test_app.post("/api/v1/exchange", json=exchange)
+        assert response.status_code == 400
+        assert "Insufficient balance" in response.json()["detail"]
+
+        purchase = {"buyer_id": 1, "item_id": 1, "quantity": 5}
+        response = await test_app.post("/api/v1/buy", json=purchase)
+        assert response.status_code == 400
+        assert len(await entries(test_db, 1)) == 1
+        result = await test_db.execute(select(Transaction.id))
+        assert result.all() == []
+        assert await reported_balance(test_app, 1) == 400.0
+
+    @pytest.mark.asyncio
+    async def test_snapshot_balances(
+        self,
+        test_app: AsyncClient,
+        test_db: AsyncSession,
+        test_redis: Redis,
+        setup_test_data: None,
+        balance_ledger: BalanceLedger,
+    ):
+        """Test that snapshotting folds pending entries, so the ledger can be turned off."""
+        users = UserRepository(test_db, ledger=balance_ledger)
+        service = MarketService(
+            users,
+            ItemRepository(test_db),
+            TransactionRepository(test_db),
+            UniverseRepository(test_db),
+            RedisCache(test_redis),
+            SQLAlchemyUnitOfWork(test_db),
+        )
+        await users.update_balance(1, 300.0)
+        assert await users.debit_balance(1, 25.0) is not None
+        await test_db.commit()
+        assert await snapshot(test_db, 1) == (1000.0, 0)
+
+        assert await service.snapshot_balances() == 1
+        assert (await snapshot(test_db, 1))[0] == 275.0
+        assert await service.snapshot_balances() == 0
+
+        test_db.expunge_all()
+        assert (await UserRepository(test_db).get(1)).balance == 275.0
+        rows = await users.list_rows(["id", "balance"])
+        assert rows == [{"id": 1, "balance": 275.0}]
@@ -0,0 +1,83 @@
+"""Conditional balance and stock updates under each concurrency strategy."""
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import ORMExecuteState
+
+from multiverse_market.exceptions import ConcurrentUpdateException
+from multiverse_market.infrastructure.metrics import OPTIMISTIC_CONFLICTS
+from multiverse_market.repositories import (
+    ConcurrencyControl,
+    ConcurrencyStrategy,
+    ItemRepository,
+    UserRepository,
+)
+
+
+def interfere(session: AsyncSession, times: int) -> None:
+    """Bump user 1's version behind the back of the next ``times`` compare-and-swaps."""
+    remaining = [times]
+
+    @event.listens_for(session.sync_session, "do_orm_execute")
+    def concurrent_write(state: ORMExecuteState) -> None:
+        if state.is_update and remaining[0] > 0:
+            remaining[0] -= 1
+            state.session.connection().execute(
+                text("UPDATE users SET version = version + 1 WHERE id = 1")
+            )
+
+
+@pytest.mark.integration
+class TestConcurrencyStrategies:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("strategy", list(ConcurrencyStrategy))
+    async def test_conditional_updates(
+        self, test_db: AsyncSession, setup_test_data: None, strategy: ConcurrencyStrategy
+    ):
+        """Test that every strategy checks, writes and bumps the row version."""
+        users = UserRepository(test_db, ConcurrencyControl(strategy))
+        items = ItemRepository(test_db, ConcurrencyControl(strategy))
+        async with test_db.begin():
+            user = await users.get(1)
+            assert user is not None
+            version = user.version
+
+            user = await users.debit_balance(1, 400.0)
+            assert user is not None
+            assert (user.balance, user.version) == (600.0, version + 1)
+            assert await users.debit_balance(1, 601.0) is None
+            assert await users.debit_balance(999, 1.0) is None
+
+            item = await items.decrement_stock(1, 4)
+            assert item is not None
+            assert item.stock == 6
+            assert await items.decrement_stock(1, 7) is None
+            assert await items.decrement_stock(999, 1) is None
+
+    @pytest.mark.asyncio
+    async def test_optimistic_retries_lost_swaps(
+        self, test_db: AsyncSession, setup_test_data: None
+    ):
+        """Test that a compare-and-swap losing to a concurrent write rereads and retries."""
+        control = ConcurrencyControl(ConcurrencyStrategy.OPTIMISTIC, max_retries=2, backoff=0)
+        users = UserRepository(test_db, control)
+        retried = OPTIMISTIC_CONFLICTS.value("User", "retried")
+        interfere(test_db, times=2)
+        async with test_db.begin():
+            user = await users.debit_balance(1, 100.0)
+        assert user is not None
+        assert user.balance == 900.0
+        assert OPTIMISTIC_CONFLICTS.value("User", "retried") == retried + 2
+
+    @pytest.mark.asyncio
+    async def test_optimistic_gives_up(self, test_db: AsyncSession, setup_test_data: None):
+        """Test that the swap is abandoned with a conflict once the retries run out."""
+        control = ConcurrencyControl(ConcurrencyStrategy.OPTIMISTIC, max_retries=2, backoff=0)
+        users = UserRepository(test_db, control)
+        aborted = OPTIMISTIC_CONFLICTS.value("User", "aborted")
+        interfere(test_db, times=3)
+        with pytest.raises(ConcurrentUpdateException):
+            async with test_db.begin():
+                await users.debit_balance(1, 100.0)
+        assert OPTIMISTIC_CONFLICTS.value("User", "aborted") == aborted + 1
@@ -0,0 +1,178 @@
+"""Integration tests for idempotency keys on /buy and /exchange."""
+
+import asyncio
+import typing as ty
+
+import pytest
+from httpx import AsyncClient
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from multiverse_market.exceptions import ConcurrentUpdateException
+from multiverse_market.infrastructure import IdempotencyStore, QueryStats
+from multiverse_market.models import ItemPurchase
+from multiverse_market.repositories import UserRepository
+
+PURCHASE = {"buyer_id": 1, "item_id": 1, "quantity": 1}
+
+
+def make_store(redis: Redis, **options: ty.Any) -> IdempotencyStore:
+    return IdempotencyStore(redis, **{"ttl": 60, "lock_ttl": 1, "wait_timeout": 5, **options})
+
+
+async def item_stock(test_app: AsyncClient, item_id: int) -> int:
+    response = await test_app.get("/api/v1/items")
+    return {item["id"]: item["stock"] for item in response.json()}[item_id]
+
+
+@pytest.mark.integration
+class TestIdempotency:
+    @pytest.mark.asyncio
+    async def test_retry_is_replayed_without_touching_the_database(
+        self, test_app: AsyncClient, setup_test_data: None, query_stats: QueryStats
+    ):
+        """Test that a retried purchase gets the first response and buys once."""
+        headers = {"Idempotency-Key": "purchase-1"}
+        first = await test_app.post("/api/v1/buy", json=PURCHASE, headers=headers)
+        statements = len(query_stats.statements)
+
+        retry = await test_app.post("/api/v1/buy", json=PURCHASE, headers=headers)
+
+        assert first.status_code == retry.status_code == 200
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert len(query_stats.statements) == statements
+        assert await item_stock(test_app, 1) == 9
+
+    @pytest.mark.asyncio
+    async def test_key_reused_for_another_request(
+        self, test_app: AsyncClient, setup_test_data: None
+    ):
+        """Test that a key cannot be replayed against a different body."""
+        headers = {"Idempotency-Key": "purchase-1"}
+        await test_app.post("/api/v1/buy", json=PURCHASE, headers=headers)
+
+        response = await test_app.post(
+            "/api/v1/buy", json={**PURCHASE, "quantity": 2}, headers=headers
+        )
+
+        assert response.status_code == 422
+        assert await item_stock(test_app, 1) == 9
+
+    @pytest.mark.asyncio
+    async def test_concurrent_duplicates_wait_for_the_original(
+        self, test_app: AsyncClient, setup_test_data: None
+    ):
+        """Test that duplicates in flight share one execution."""
+        headers = {"Idempotency-Key": "purchase-1"}
+        responses = await asyncio.gather(
+            *(test_app.post("/api/v1/buy", json=PURCHASE, headers=headers) for _ in range(3))
+        )
+
+        assert {response.status_code for response in responses} == {200}
+        assert len({response.json()["id"] for response in responses}) == 1
+        assert sum("Idempotent-Replayed" in response.headers for response in responses) == 2
+        assert await item_stock(test_app, 1) == 9
+
+    @pytest.mark.asyncio
+    async def test_client_errors_are_replayed(self, test_app: AsyncClient, setup_test_data: None):
+        """Test that a failed exchange is answered the same way when retried."""
+        exchange = {"user_id": 1, "from_universe_id": 1, "to_universe_id": 2, "amount": 1e6}
+        headers = {"Idempotency-Key": "exchange-1"}
+
+        first = await test_app.post("/api/v1/exchange", json=exchange, headers=headers)
+        retry = await test_app.post("/api/v1/exchange", json=exchange, headers=headers)
+
+        assert first.status_code == retry.status_code == 400
+        assert retry.json() == first.json() == {"detail": "Insufficient balance"}
+        assert retry.headers["Idempotent-Replayed"] == "true"
+
+    @pytest.mark.asyncio
+    async def test_conflicts_release_the_key(
+        self, test_app: AsyncClient, setup_test_data: None, monkeypatch: pytest.MonkeyPatch
+    ):
+        """Test that a purchase losing a concurrent update can be retried with its key."""
+        debit_balance = UserRepository.debit_balance
+        conflicts = [ConcurrentUpdateException()]
+
+        async def conflicting_debit(
+            self: UserRepository, user_id: int, amount: float, **ledger: ty.Any
+        ):
+            if conflicts:
+                raise conflicts.pop()
+            return await debit_balance(self, user_id, amount, **ledger)
+
+        monkeypatch.setattr(UserRepository, "debit_balance", conflicting_debit)
+        headers = {"Idempotency-Key": "purchase-1"}
+
+        first = await test_app.post("/api/v1/buy", json=PURCHASE, headers=headers)
+        retry = await test_app.post("/api/v1/buy", json=PURCHASE, headers=headers)
+
+        assert first.status_code == 409
+        assert retry.status_code == 200
+        assert "Idempotent-Replayed" not in retry.headers
+        assert await item_stock(test_app, 1) == 9
+
+    @pytest.mark.asyncio
+    async def test_claim_is_renewed_while_the_request_runs(self, test_redis: Redis):
+        """Test that a request running past the lock TTL still holds off duplicates."""
+        store = make_store(test_redis)
+        request = ItemPurchase(**PURCHASE)
+        calls = 0
+
+        async def slow_call() -> ItemPurchase:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(1.5)
+            return request
+
+        async def duplicate() -> ty.Any:
+            await asyncio.sleep(0.1)
+            return await store.run("purchase-1", request, slow_call)
+
+        first, second = await asyncio.gather(
+            store.run("purchase-1", request, slow_call), duplicate()
+        )
+
+        assert calls == 1
+        assert second.body == first.body
+        assert second.headers["Idempotent-Replayed"] == "true"
+
+    @pytest.mark.asyncio
+    async def test_committed_response_survives_a_failed_store(
+        self, test_redis: Redis, monkeypatch: pytest.MonkeyPatch
+    ):
+        """Test that a request that ran is answered even when its response cannot be stored."""
+        store = make_store(test_redis)
+        request = ItemPurchase(**PURCHASE)
+
+        async def failing_store(**kwargs: ty.Any) -> None:
+            raise RedisError("connection lost")
+
+        monkeypatch.setattr(store, "_store_script", failing_store)
+        response = await store.run("purchase-1", request, lambda: asyncio.sleep(0, request))
+
+        assert response.status_code == 200
+        assert response.body == request.model_dump_json().encode()
+
+    @pytest.mark.asyncio
+    async def test_lost_claim_is_left_to_its_new_owner(self, test_redis: Redis):
+        """Test that a request whose claim was taken over stores and releases nothing."""
+        store = make_store(test_redis)
+        request = ItemPurchase(**PURCHASE)
+
+        async def taken_over() -> ItemPurchase:
+            await test_redis.set("idempotency:purchase-1", "other", ex=60)
+            return request
+
+        async def taken_over_then_failing() -> ItemPurchase:
+            await taken_over()
+            raise RuntimeError("failed")
+
+        await store.run("purchase-1", request, taken_over)
+        assert await test_redis.get("idempotency:purchase-1") == "other"
+
+        await test_redis.delete("idempotency:purchase-1")
+        with pytest.raises(RuntimeError):
+            await store.run("purchase-1", request, taken_over_then_failing)
+        assert await test_redis.get("idempotency:purchase-1") == "other"
@@ -0,0 +1,34 @@
+"""Query budgets of the hot endpoints, so extra round trips show up as failures."""
+
+import pytest
+from httpx import AsyncClient
+
+from multiverse_market.infrastructure import QueryStats
+
+
+@pytest.mark.integration
+class TestQueryBudgets:
+    @pytest.mark.asyncio
+    async def test_buy_item(
+        self, test_app: AsyncClient, setup_test_data: None, query_stats: QueryStats
+    ):
+        """Test that a purchase reads the buyer and writes in one statement per row."""
+        response = await test_app.post(
+            "/api/v1/buy", json={"buyer_id": 1, "item_id": 1, "quantity": 1}
+        )
+        assert response.status_code == 200
+        assert len(query_stats.statements) <= 4, query_stats.statements
+        # Generations, then one pipeline tombstoning the buyer and item and bumping the catalog
+        assert len(query_stats.commands) <= 4, query_stats.commands
+
+    @pytest.mark.asyncio
+    async def test_get_user_is_cached(
+        self, test_app: AsyncClient, setup_test_data: None, query_stats: QueryStats
+    ):
+        """Test that a repeated user lookup is served from the cache without SQL."""
+        await test_app.get("/api/v1/users/1")
+        statements = len(query_stats.statements)
+
+        response = await test_app.get("/api/v1/users/1")
+        assert response.status_code == 200
+        assert len(query_stats.statements) == statements, query_stats.statements
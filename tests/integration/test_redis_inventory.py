@@ -0,0 +1,263 @@
+"""Integration tests for items whose stock is held in Redis and reconciled in the background."""
+
+import time
+
+import pytest
+from httpx import AsyncClient
+from redis.asyncio import Redis
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from multiverse_market import dependencies
+from multiverse_market.infrastructure import InventoryReconciler, RedisCache, RedisInventory
+from multiverse_market.models.entities import Item, Transaction, User
+from multiverse_market.models.requests import BatchItemPurchase, ItemPurchase, PurchaseLine
+from multiverse_market.repositories import (
+    ItemRepository,
+    SQLAlchemyUnitOfWork,
+    TransactionRepository,
+    UniverseRepository,
+    UserRepository,
+)
+from multiverse_market.services import MarketService
+
+
+def make_service(session: AsyncSession, redis: Redis) -> MarketService:
+    return MarketService(
+        UserRepository(session),
+        ItemRepository(session),
+        TransactionRepository(session),
+        UniverseRepository(session),
+        RedisCache(redis),
+        SQLAlchemyUnitOfWork(session),
+        inventory=RedisInventory(redis),
+    )
+
+
+def make_reconciler(service: MarketService, redis: Redis, **options) -> InventoryReconciler:
+    return InventoryReconciler(
+        RedisInventory(redis), service.apply_reservations, consumer="test", **options
+    )
+
+
+async def row_stock(session: AsyncSession, item_id: int) -> int:
+    result = await session.execute(select(Item.stock).where(Item.id == item_id))
+    return result.scalar_one()
+
+
+async def trade_count(session: AsyncSession) -> int:
+    return (await session.execute(select(func.count()).select_from(Transaction))).scalar_one()
+
+
+@pytest.fixture
+def redis_inventory(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(dependencies.settings, "REDIS_INVENTORY", True)
+
+
+@pytest.mark.integration
+class TestRedisInventory:
+    @pytest.mark.asyncio
+    async def test_purchases_are_reserved_then_reconciled(
+        self,
+        test_app: AsyncClient,
+        test_db: AsyncSession,
+        test_redis: Redis,
+        setup_test_data: None,
+        redis_inventory: None,
+    ):
+        """Test that held stock is taken in Redis and applied to the item's row in batches."""
+        service = make_service(test_db, test_redis)
+        item = await service.hold_item_stock(1)
+        assert item.stock == 10
+
+        for _ in range(2):
+            purchase = {"buyer_id": 1, "item_id": 1, "quantity": 2}
+            response = await test_app.post("/api/v1/buy", json=purchase)
+            assert response.status_code == 200
+            assert response.json()["id"] is None
+
+        # The buyer is debited at once; the item's row and the trades wait for the reconciler
+        assert (await test_app.get("/api/v1/users/1")).json()["balance"] == 600.0
+        assert await row_stock(test_db, 1) == 10
+        assert await trade_count(test_db) == 0
+        [count] = await service.check_inventory(rechecks=0)
+        assert (count.redis_stock, count.reserved, count.database_stock) == (6, 4, 10)
+        assert count.drift == 0
+
+        assert await make_reconciler(service, test_redis).run_once() == 2
+        assert await row_stock(test_db, 1) == 6
+        assert await trade_count(test_db) == 2
+        [count] = await service.check_inventory(rechecks=0)
+        assert (count.redis_stock, count.reserved, count.database_stock) == (6, 0, 6)
+
+        purchase = {"buyer_id": 1, "item_id": 1, "quantity": 7}
+        response = await test_app.post("/api/v1/buy", json=purchase)
+        assert response.status_code == 400
+        assert "Insufficient stock" in response.json()["detail"]
+
+    @pytest.mark.asyncio
+    async def test_failed_purchases_release_their_stock(
+        self,
+        test_app: AsyncClient,
+        test_db: AsyncSession,
+        test_redis: Redis,
+        setup_test_data: None,
+        redis_inventory: None,
+    ):
+        """Test that a purchase failing after its reservation gives the stock back."""
+        service = make_service(test_db, test_redis)
+        await service.hold_item_stock(1)
+
+        purchase = {"buyer_id": 999, "item_id": 1, "quantity": 3}
+        response = await test_app.post("/api/v1/buy", json=purchase)
+        assert response.status_code == 404
+
+        purchase_data = {
+            "buyer_id": 1,
+            "lines": [{"item_id": 1, "quantity": 4}, {"item_id": 2, "quantity": 6}],
+        }
+        response = await test_app.post("/api/v1/buy/batch", json=purchase_data)
+        assert response.status_code == 400
+
+        [count] = await service.check_inventory(rechecks=0)
+        assert (count.redis_stock, count.reserved, count.drift) == (10, 0, 0)
+
+    @pytest.mark.asyncio
+    async def test_carts_mix_held_and_unheld_items(
+        self,
+        test_app: AsyncClient,
+        test_db: AsyncSession,
+        test_redis: Redis,
+        setup_test_data: None,
+        redis_inventory: None,
+    ):
+        """Test that a cart reserves its held lines and buys the others from their rows."""
+        service = make_service(test_db, test_redis)
+        await service.hold_item_stock(1)
+
+        purchase_data = {
+            "buyer_id": 1,
+            "lines": [{"item_id": 1, "quantity": 2}, {"item_id": 2, "quantity": 1}],
+        }
+        response = await test_app.post("/api/v1/buy/batch", json=purchase_data)
+        assert response.status_code == 200
+        held, unheld = response.json()
+        assert held["id"] is None and unheld["id"] is not None
+        assert (await row_stock(test_db, 1), await row_stock(test_db, 2)) == (10, 4)
+
+        assert await make_reconciler(service, test_redis).run_once() == 1
+        assert await row_stock(test_db, 1) == 8
+        assert await trade_count(test_db) == 2
+
+    @pytest.mark.asyncio
+    async def test_reservations_are_replayed_or_released(
+        self,
+        test_app: AsyncClient,
+        test_db: AsyncSession,
+        test_redis: Redis,
+        setup_test_data: None,
+        redis_inventory: None,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        """Test that a crashed reconciler's reservations are claimed, and orphans released."""
+        service = make_service(test_db, test_redis)
+        inventory = RedisInventory(test_redis)
+        await service.hold_item_stock(1)
+        purchase = {"buyer_id": 1, "item_id": 1, "quantity": 1}
+        assert (await test_app.post("/api/v1/buy", json=purchase)).status_code == 200
+        # Reserved by a purchase that never committed, then read by a reconciler that crashed
+        await inventory.reserve(1, 2)
+        await inventory.create_group()
+        assert len(await inventory.read("crashed", 10)) == 2
+
+        # Orphans are aged on the Redis clock, not this host's, which may run ahead
+        local_time = time.time
+        reconciler = make_reconciler(service, test_redis, claim_idle=0, grace=60)
+        with monkeypatch.context() as patch:
+            patch.setattr(time, "time", lambda: local_time() + 3600)
+            assert await reconciler.run_once() == 1
+        assert await row_stock(test_db, 1) == 9
+        [count] = await service.check_inventory(rechecks=0)
+        assert (count.redis_stock, count.reserved) == (7, 2)
+
+        reconciler = make_reconciler(service, test_redis, claim_idle=0, grace=0)
+        assert await reconciler.run_once() == 0
+        [count] = await service.check_inventory(rechecks=0)
+        assert (count.redis_stock, count.reserved, count.database_stock) == (9, 0, 9)
+
+    @pytest.mark.asyncio
+    async def test_release_waits_for_pending_purchases(
+        self,
+        test_app: AsyncClient,
+        test_db: AsyncSession,
+        test_redis: Redis,
+        setup_test_data: None,
+        redis_inventory: None,
+    ):
+        """Test that releasing refuses reservations until the row has caught up."""
+        service = make_service(test_db, test_redis)
+        await service.hold_item_stock(1)
+        purchase = {"buyer_id": 1, "item_id": 1, "quantity": 3}
+        assert (await test_app.post("/api/v1/buy", json=purchase)).status_code == 200
+
+        with pytest.raises(TimeoutError):
+            await service.release_item_stock(1, timeout=0.05, poll=0.01)
+        # Still held, and selling again
+        assert (await test_app.post("/api/v1/buy", json=purchase)).status_code == 200
+
+        await make_reconciler(service, test_redis).run_once()
+        item = await service.release_item_stock(1, timeout=1)
+        assert item.stock == 4
+        assert await service.check_inventory() == []
+
+        response = await test_app.post("/api/v1/buy", json=purchase)
+        assert response.status_code == 200
+        assert response.json()["id"] is not None
+        assert await row_stock(test_db, 1) == 1
+        balance = await test_db.execute(select(User.balance).where(User.id == 1))
+        assert balance.scalar_one() == 100.0
+
+    @pytest.mark.asyncio
+    async def test_purchases_racing_a_hold_go_to_redis(
+        self,
+        test_db: AsyncSession,
+        test_redis: Redis,
+        setup_test_data: None,
+        redis_inventory: None,
+    ):
+        """Test that a purchase which found the item unheld cannot take from its row once held."""
+        inventory = RedisInventory(test_redis)
+        service = MarketService(
+            UserRepository(test_db),
+            ItemRepository(test_db),
+            TransactionRepository(test_db),
+            UniverseRepository(test_db),
+            RedisCache(test_redis),
+            SQLAlchemyUnitOfWork(test_db),
+            inventory=inventory,
+        )
+        reserve = inventory.reserve
+        holds = []
+
+        async def reserve_then_hold(item_id: int, quantity: int):
+            reservation = await reserve(item_id, quantity)
+            if not holds:
+                # The item is held between the purchase missing Redis and reaching the row
+                holds.append(await make_service(test_db, test_redis).hold_item_stock(item_id))
+            return reservation
+
+        inventory.reserve = reserve_then_hold
+        purchase = await service.buy_item(ItemPurchase(buyer_id=1, item_id=1, quantity=3))
+
+        assert holds[0].stock == 10
+        assert purchase.id is None
+        assert await row_stock(test_db, 1) == 10
+        [count] = await service.check_inventory(rechecks=0)
+        assert (count.redis_stock, count.reserved, count.drift) == (7, 3, 0)
+
+        holds.clear()
+        cart = BatchItemPurchase(buyer_id=1, lines=[PurchaseLine(item_id=2, quantity=1)])
+        [trade] = await service.buy_items(cart)
+        assert trade.id is None
+        [_, count] = sorted(await service.check_inventory(rechecks=0))
+        assert (count.item_id, count.redis_stock, count.reserved, count.drift) == (2, 4, 1, 0)
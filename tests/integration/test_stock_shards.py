@@ -0,0 +1,99 @@
+"""Integration tests for items whose stock is sharded over several rows."""
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from multiverse_market.models.entities import Item, ItemStockShard
+from multiverse_market.repositories import ItemRepository
+
+
+async def shard_stocks(session: AsyncSession, item_id: int) -> list[int]:
+    result = await session.execute(
+        select(ItemStockShard.stock)
+        .where(ItemStockShard.item_id == item_id)
+        .order_by(ItemStockShard.shard)
+    )
+    return list(result.scalars().all())
+
+
+async def listed_stock(test_app: AsyncClient, item_id: int) -> int:
+    response = await test_app.get("/api/v1/items")
+    return {item["id"]: item["stock"] for item in response.json()}[item_id]
+
+
+@pytest.mark.integration
+class TestStockShards:
+    @pytest.mark.asyncio
+    async def test_sharding_reports_the_total(self, test_db: AsyncSession, setup_test_data: None):
+        """Test that stock is spread evenly and still read as one total."""
+        items = ItemRepository(test_db)
+        async with test_db.begin():
+            item = await items.shard_stock(1, 3)
+        assert item is not None
+        assert (item.stock, item.stock_shards) == (10, 3)
+        assert await shard_stocks(test_db, 1) == [4, 3, 3]
+
+        test_db.expunge_all()
+        item = await items.get(1)
+        assert item is not None and item.stock == 10
+        rows = await items.list_rows(["id", "stock"], universe_id=1)
+        assert rows == [{"id": 1, "stock": 10}]
+        assert (await items.get_many_for_update([1]))[0].stock == 10
+        await test_db.rollback()
+
+    @pytest.mark.asyncio
+    async def test_purchases_spill_over_shards(
+        self, test_app: AsyncClient, test_db: AsyncSession, setup_test_data: None
+    ):
+        """Test that purchases leave the item's row alone and spill over short shards."""
+        async with test_db.begin():
+            item = await ItemRepository(test_db).shard_stock(1, 3)
+        assert item is not None
+        version = item.version
+
+        for quantity in (2, 6):
+            purchase = {"buyer_id": 1, "item_id": 1, "quantity": quantity}
+            response = await test_app.post("/api/v1/buy", json=purchase)
+            assert response.status_code == 200
+
+        assert await listed_stock(test_app, 1) == 2
+        assert sum(await shard_stocks(test_db, 1)) == 2
+        result = await test_db.execute(select(Item.stock, Item.version).where(Item.id == 1))
+        assert result.one() == (0, version)
+
+        purchase = {"buyer_id": 1, "item_id": 1, "quantity": 3}
+        response = await test_app.post("/api/v1/buy", json=purchase)
+        assert response.status_code == 400
+        assert "Insufficient stock" in response.json()["detail"]
+
+        purchase_data = {"buyer_id": 1, "lines": [{"item_id": 1, "quantity": 2}]}
+        response = await test_app.post("/api/v1/buy/batch", json=purchase_data)
+        assert response.status_code == 200
+        assert await listed_stock(test_app, 1) == 0
+
+    @pytest.mark.asyncio
+    async def test_rebalance_and_unshard(self, test_db: AsyncSession, setup_test_data: None):
+        """Test that rebalancing evens shards out and unsharding gathers the stock back."""
+        items = ItemRepository(test_db)
+        await items.shard_stock(1, 2)
+        assert await items.decrement_stock(1, 3) is not None
+        await test_db.commit()
+        assert sorted(await shard_stocks(test_db, 1)) == [2, 5]
+
+        await items.shard_stock(1)
+        await test_db.commit()
+        assert await shard_stocks(test_db, 1) == [4, 3]
+
+        await items.update_stock(1, 9)
+        await test_db.commit()
+        assert await shard_stocks(test_db, 1) == [5, 4]
+
+        item = await items.shard_stock(1, 0)
+        await test_db.commit()
+        assert item is not None
+        assert (item.stock, item.stock_shards) == (9, 0)
+        assert await shard_stocks(test_db, 1) == []
+        result = await test_db.execute(select(Item.stock).where(Item.id == 1))
+        assert result.scalar_one() == 9
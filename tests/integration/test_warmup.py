@@ -0,0 +1,103 @@
+"""Integration tests for the startup warm-up."""
+
+import logging
+
+import pytest
+from redis.asyncio import Redis
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from multiverse_market.infrastructure import ReadThroughCache, RedisCache, track_queries
+from multiverse_market.models.entities import LedgerEntry
+from multiverse_market.repositories import (
+    BalanceLedger,
+    ConcurrencyControl,
+    ConcurrencyStrategy,
+    ItemRepository,
+    SQLAlchemyUnitOfWork,
+    TransactionRepository,
+    UniverseRepository,
+    UserRepository,
+)
+from multiverse_market.services import ExchangeRateTable, MarketService, warm_up
+from multiverse_market.services.warmup import prime_statements
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+async def test_warm_up_primes_queries_and_caches(
+    test_db: AsyncSession, test_redis: Redis, setup_test_data: None
+):
+    """Test that warm-up runs every repository query and caches the catalog."""
+    engine = test_db.bind
+    read_through = ReadThroughCache()
+    exchange_rates = ExchangeRateTable()
+
+    def make_service(session: AsyncSession) -> MarketService:
+        return MarketService(
+            UserRepository(session),
+            ItemRepository(session),
+            TransactionRepository(session),
+            UniverseRepository(session),
+            RedisCache(test_redis),
+            SQLAlchemyUnitOfWork(session),
+            exchange_rates=exchange_rates,
+            read_through=read_through,
+        )
+
+    await warm_up(
+        engine,
+        async_sessionmaker(engine, expire_on_commit=False),
+        make_service,
+        pool_size=1,
+        top_items=10,
+    )
+
+    assert read_through.misses["universes"] == 1
+    assert read_through.misses["items"] >= 1
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        service = make_service(session)
+        await service.list_universes_json()
+        await service.list_items_json()
+        # Priming rolled back, so the seeded stock and balances are untouched
+        assert (await ItemRepository(session).get(1)).stock == 10
+    assert read_through.hits["universes"] == read_through.hits["items"] == 1
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+async def test_prime_statements_follows_the_configuration(
+    test_db: AsyncSession, setup_test_data: None
+):
+    """Test that priming runs the queries of the configured strategy and ledger, harmlessly."""
+    concurrency = ConcurrencyControl(ConcurrencyStrategy.PESSIMISTIC)
+    async with async_sessionmaker(test_db.bind, expire_on_commit=False)() as session:
+        with track_queries() as stats:
+            await prime_statements(session, concurrency, BalanceLedger())
+
+    statements = "\n".join(stats.statements)
+    assert "FROM ledger_entries" in statements
+    assert "INSERT INTO ledger_entries" in statements
+    assert "INSERT INTO stock_reservations" in statements
+    assert "UPDATE items SET stock=" in statements
+    assert "UPDATE users SET balance=" in statements
+    assert "FROM item_stock_shards" in statements
+    assert (await test_db.execute(select(func.count()).select_from(LedgerEntry))).scalar() == 0
+    assert (await ItemRepository(test_db).get(1)).stock == 10
+
+
+async def test_prime_statements_primes_optimistic_swaps(
+    test_db: AsyncSession, setup_test_data: None
+):
+    """Test that priming runs the compare-and-swaps of optimistic takes, harmlessly."""
+    concurrency = ConcurrencyControl(ConcurrencyStrategy.OPTIMISTIC)
+    async with async_sessionmaker(test_db.bind, expire_on_commit=False)() as session:
+        with track_queries() as stats:
+            await prime_statements(session, concurrency)
+
+    swaps = [s for s in stats.statements if s.startswith("UPDATE") and "version = " in s]
+    assert any(s.startswith("UPDATE items") for s in swaps)
+    assert any(s.startswith("UPDATE users") for s in swaps)
+    assert (await ItemRepository(test_db).get(1)).stock == 10
@@ -2,6 +2,7 @@ import logging
 import random
 import time
 import typing as ty
+import uuid
 from dataclasses import dataclass, field
 from datetime import datetime
 from typing import ClassVar
@@ -115,13 +116,13 @@ class BaseUser(HttpUser):
         """
         if response.status_code >= 400:
             self.session.errors += 1
-            logger.error(f"Error in {context}: {response.status_code} - {response.text}")
+            logger.error("Error in %s: %s - %s", context, response.status_code, response.text)
 
             if isinstance(response, ResponseContextManager):
                 response.failure(f"{context} failed: {response.status_code}")
 
             if self.session.errors >= MAX_ERRORS:
-                logger.error(f"User exceeded maximum errors ({MAX_ERRORS}), stopping")
+                logger.error("User exceeded maximum errors (%s), stopping", MAX_ERRORS)
                 self.environment.runner.quit()
             return False
 
@@ -156,10 +157,10 @@ class BaseUser(HttpUser):
                 return func()
             except Exception as e:
                 if attempt == MAX_RETRIES - 1:
-                    logger.error(f"Max retries reached: {e!s}")
+                    logger.error("Max retries reached: %s", e)
                     raise e
                 wait_time = INITIAL_RETRY_WAIT * (2**attempt)
-                logger.warning(f"Attempt {attempt + 1} failed, waiting {wait_time}s: {e!s}")
+                logger.warning("Attempt %s failed, waiting %ss: %s", attempt + 1, wait_time, e)
                 time.sleep(wait_time)
         # Should be unreachable
         raise Exception("max retries reached")
@@ -231,6 +232,9 @@ class TraderUser(BaseUser):
     @task(1)
     def exchange_currency(self) -> None:
         """Attempt to exchange currency between universes."""
+        # Retries resend the first request under the same key, so it is applied at most once
+        idempotency_key = str(uuid.uuid4())
+        sent: dict[str, ty.Any] = {}
 
         def do_exchange() -> ResponseType | None:
             user_id = random.choice(LoadTestConfig.USER_IDS)
@@ -256,16 +260,17 @@ class TraderUser(BaseUser):
                 [u for u in LoadTestConfig.UNIVERSE_IDS if u != from_universe]
             )
 
-            exchange_data = {
+            exchange_data = sent.setdefault("exchange", {
                 "user_id": user_id,
                 "amount": random.uniform(10.0, min(100.0, max_amount)),
                 "from_universe_id": from_universe,
                 "to_universe_id": to_universe,
-            }
+            })
 
             with self.client.post(
                 LoadTestConfig.EXCHANGE,
                 json=exchange_data,
+                headers={"Idempotency-Key": idempotency_key},
                 catch_response=True,
                 name="Exchange Currency",
             ) as response:
@@ -280,6 +285,9 @@ class TraderUser(BaseUser):
     @task(1)
     def buy_item(self) -> None:
         """Attempt to purchase an item."""
+        # Retries resend the first request under the same key, so it is applied at most once
+        idempotency_key = str(uuid.uuid4())
+        sent: dict[str, ty.Any] = {}
 
         def do_purchase() -> ResponseType | None:
             buyer_id = random.choice(LoadTestConfig.USER_IDS)
@@ -329,10 +337,20 @@ class TraderUser(BaseUser):
             if self.session.user_balances[buyer_id] < total_cost:
                 return None
 
-            purchase_data = {"buyer_id": buyer_id, "item_id": item_id, "quantity": quantity}
+            purchase_data = sent.setdefault(
+                "purchase", {"buyer_id": buyer_id, "item_id": item_id, "quantity": quantity}
+            )
+            buyer_id, item_id, quantity = (
+                purchase_data["buyer_id"], purchase_data["item_id"], purchase_data["quantity"]
+            )
+            total_cost = quantity * self.session.item_stocks[item_id].price
 
             with self.client.post(
-                LoadTestConfig.BUY, json=purchase_data, catch_response=True, name="Buy Item"
+                LoadTestConfig.BUY,
+                json=purchase_data,
+                headers={"Idempotency-Key": idempotency_key},
+                catch_response=True,
+                name="Buy Item",
             ) as response:
                 if self.handle_response(response, "buy_item"):
                     self.session.successful_trades += 1
@@ -370,7 +388,7 @@ def on_request(
 ) -> None:
     """Log failed requests with details."""
     if exception:
-        logger.error(f"Request failed: {name} - {exception!s}")
+        logger.error("Request failed: %s - %s", name, exception)
 
 
 @dataclass(frozen=True)
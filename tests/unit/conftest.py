@@ -8,6 +8,7 @@ from tests.unit.mocks import (
     InMemoryCacheService,
     MockItemRepository,
     MockTransactionRepository,
+    MockUnitOfWork,
     MockUniverseRepository,
     MockUserRepository,
 )
@@ -39,6 +40,11 @@ async def transaction_repo() -> MockTransactionRepository:
     return MockTransactionRepository()
 
 
+@pytest_asyncio.fixture
+async def unit_of_work() -> MockUnitOfWork:
+    return MockUnitOfWork()
+
+
 @pytest_asyncio.fixture
 async def setup_test_data(
     user_repo: MockUserRepository,
@@ -56,6 +62,6 @@ async def setup_test_data(
 
     item = Item(id=1, name="Test Item", universe_id=1, price=100.0, stock=10)
     item_repo._items[1] = item
-    logger.debug(f"Added test item: {item}")
+    logger.debug("Added test item: %s", item)
 
     return None
@@ -1,11 +1,15 @@
+import asyncio
 import logging
-from collections.abc import Sequence
+from collections import Counter
+from collections.abc import AsyncIterator, Iterable, Mapping, Sequence
+from contextlib import asynccontextmanager
 
 from multiverse_market.exceptions import (
     ItemNotFoundException,
     UserNotFoundException,
 )
-from multiverse_market.interfaces import CacheBackend
+from multiverse_market.infrastructure import InvalidationBus
+from multiverse_market.interfaces import CacheBackend, CachePipeline
 from multiverse_market.models.entities import Item, Transaction, Universe, User
 from multiverse_market.repositories import (
     ItemRepository,
@@ -25,19 +29,122 @@ class MockSession:
         pass
 
 
+class MockUnitOfWork:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    async def commit(self) -> None:
+        self.commits += 1
+
+    async def rollback(self) -> None:
+        self.rollbacks += 1
+
+
+class InMemoryCachePipeline(CachePipeline):
+    def __init__(self):
+        self.operations: list[tuple[str, tuple]] = []
+
+    def setex(self, key: str, expires: int, value: str) -> None:
+        self.operations.append(("setex", (key, expires, value)))
+
+    def delete(self, *keys: str) -> None:
+        self.operations.append(("delete", keys))
+
+    def incr(self, key: str) -> None:
+        self.operations.append(("incr", (key,)))
+
+
 class InMemoryCacheService(CacheBackend):
     def __init__(self):
         self._cache: dict[str, str] = {}
+        self.round_trips = 0
 
     async def get(self, key: str) -> str | None:
+        self.round_trips += 1
         return self._cache.get(key)
 
     async def setex(self, key: str, expires: int, value: str) -> None:
+        self.round_trips += 1
         self._cache[key] = value
 
     async def delete(self, key: str) -> None:
+        self.round_trips += 1
         self._cache.pop(key, None)
 
+    async def compare_and_setex(
+        self, key: str, expected: str | None, expires: int, value: str
+    ) -> bool:
+        self.round_trips += 1
+        if self._cache.get(key) != expected:
+            return False
+        self._cache[key] = value
+        return True
+
+    async def incr(self, key: str) -> int:
+        self.round_trips += 1
+        value = int(self._cache.get(key, 0)) + 1
+        self._cache[key] = str(value)
+        return value
+
+    async def get_many(self, keys: Sequence[str]) -> list[str | None]:
+        self.round_trips += 1
+        return [self._cache.get(key) for key in keys]
+
+    async def set_many(self, values: Mapping[str, str], expires: int) -> None:
+        self.round_trips += 1
+        self._cache.update(values)
+
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        self.round_trips += 1
+        for key in keys:
+            self._cache.pop(key, None)
+
+    @asynccontextmanager
+    async def pipeline(self) -> AsyncIterator[CachePipeline]:
+        pipeline = InMemoryCachePipeline()
+        yield pipeline
+        if not pipeline.operations:
+            return
+        self.round_trips += 1
+        for operation, args in pipeline.operations:
+            if operation == "setex":
+                key, _, value = args
+                self._cache[key] = value
+            elif operation == "delete":
+                for key in args:
+                    self._cache.pop(key, None)
+            else:
+                (key,) = args
+                self._cache[key] = str(int(self._cache.get(key, 0)) + 1)
+
+
+class InMemoryInvalidationBroker:
+    """Fans invalidations out to every bus except the publisher, like a pub/sub channel."""
+
+    def __init__(self):
+        self.subscribers: list[InMemoryInvalidationBus] = []
+
+
+class InMemoryInvalidationBus(InvalidationBus):
+    def __init__(self, broker: InMemoryInvalidationBroker):
+        self._broker = broker
+        self._queue: asyncio.Queue[list[str]] = asyncio.Queue()
+        self.published: list[list[str]] = []
+        broker.subscribers.append(self)
+
+    async def publish(self, keys: Sequence[str]) -> None:
+        if not keys:
+            return
+        self.published.append(list(keys))
+        for subscriber in self._broker.subscribers:
+            if subscriber is not self:
+                subscriber._queue.put_nowait(list(keys))
+
+    async def subscribe(self) -> AsyncIterator[list[str]]:
+        while True:
+            yield await self._queue.get()
+
 
 class MockUserRepository(UserRepository):
     def __init__(self):
@@ -47,6 +154,9 @@ class MockUserRepository(UserRepository):
     async def get(self, id: int) -> User | None:
         return self._users.get(id)
 
+    async def get_many(self, ids: Iterable[int]) -> Sequence[User]:
+        return [self._users[i] for i in set(ids) if i in self._users]
+
     async def list(self, **filters) -> Sequence[User]:
         return list(self._users.values())
 
@@ -58,6 +168,20 @@ class MockUserRepository(UserRepository):
             id=user.id, username=user.username, universe_id=user.universe_id, balance=new_balance
         )
 
+    async def debit_balance(self, user_id: int, amount: float, **ledger) -> User | None:
+        user = await self.get(user_id)
+        if not user or user.balance < amount:
+            return None
+        await self.update_balance(user_id, user.balance - amount)
+        return self._users[user_id]
+
+    async def debit_balances(self, amounts: Mapping[int, float], **ledger) -> set[int]:
+        return {
+            user_id
+            for user_id, amount in amounts.items()
+            if await self.debit_balance(user_id, amount) is not None
+        }
+
 
 class MockItemRepository(ItemRepository):
     def __init__(self):
@@ -67,18 +191,25 @@ class MockItemRepository(ItemRepository):
     async def get(self, id: int) -> Item | None:
         return self._items.get(id)
 
+    async def get_many(self, ids: Iterable[int]) -> Sequence[Item]:
+        return [self._items[id] for id in set(ids) if id in self._items]
+
     async def list(self, **filters) -> Sequence[Item]:
-        logger.debug(f"MockItemRepository.list called with filters: {filters}")
-        logger.debug(f"Current items: {self._items}")
+        logger.debug("MockItemRepository.list called with filters: %s", filters)
+        logger.debug("Current items: %s", self._items)
         if "universe_id" in filters and filters["universe_id"] is not None:
             result = [
                 item for item in self._items.values() if item.universe_id == filters["universe_id"]
             ]
         else:
             result = list(self._items.values())
-        logger.debug(f"Returning items: {result}")
+        logger.debug("Returning items: %s", result)
         return result
 
+    async def list_rows(self, fields: Iterable[str], **filters) -> Sequence[dict]:
+        fields = list(fields)
+        return [{f: getattr(item, f) for f in fields} for item in await self.list(**filters)]
+
     async def update_stock(self, item_id: int, new_stock: int) -> None:
         item = await self.get(item_id)
         if not item:
@@ -91,6 +222,29 @@ class MockItemRepository(ItemRepository):
             stock=new_stock,
         )
 
+    async def decrement_stock(self, item_id: int, quantity: int) -> Item | None:
+        item = await self.get(item_id)
+        if not item or item.stock < quantity:
+            return None
+        await self.update_stock(item_id, item.stock - quantity)
+        return self._items[item_id]
+
+    async def restock(self, item_id: int, quantity: int) -> None:
+        await self.update_stock(item_id, self._items[item_id].stock + quantity)
+
+    async def get_stocks(self, item_ids: Iterable[int]) -> dict[int, int]:
+        return {i: self._items[i].stock for i in set(item_ids) if i in self._items}
+
+    async def get_many_for_update(self, item_ids: Iterable[int]) -> Sequence[Item]:
+        return [self._items[i] for i in sorted(set(item_ids)) if i in self._items]
+
+    async def decrement_stocks(self, quantities: Mapping[int, int]) -> int:
+        updated = 0
+        for item_id, quantity in sorted(quantities.items()):
+            if await self.decrement_stock(item_id, quantity) is not None:
+                updated += 1
+        return updated
+
 
 class MockUniverseRepository(UniverseRepository):
     def __init__(self):
@@ -100,9 +254,16 @@ class MockUniverseRepository(UniverseRepository):
     async def get(self, id: int) -> Universe | None:
         return self._universes.get(id)
 
+    async def get_many(self, ids: Iterable[int]) -> Sequence[Universe]:
+        return [self._universes[i] for i in set(ids) if i in self._universes]
+
     async def list(self, **filters) -> Sequence[Universe]:
         return list(self._universes.values())
 
+    async def list_rows(self, fields: Iterable[str], **filters) -> Sequence[dict]:
+        fields = list(fields)
+        return [{f: getattr(u, f) for f in fields} for u in await self.list(**filters)]
+
 
 class MockTransactionRepository(TransactionRepository):
     def __init__(self):
@@ -118,11 +279,38 @@ class MockTransactionRepository(TransactionRepository):
     async def list(self, **filters) -> Sequence[Transaction]:
         return self._transactions
 
-    async def get_user_trades(self, user_id: int) -> Sequence[Transaction]:
-        return [t for t in self._transactions if t.buyer_id == user_id]
+    async def get_user_trades(
+        self,
+        user_id: int,
+        *,
+        limit: int = 50,
+        before: tuple | None = None,
+        after: tuple | None = None,
+    ) -> Sequence[Transaction]:
+        trades = sorted(
+            (t for t in self._transactions if user_id in (t.buyer_id, t.seller_id)),
+            key=lambda t: (t.transaction_time, t.id),
+            reverse=True,
+        )
+        if before is not None:
+            trades = [t for t in trades if (t.transaction_time, t.id) < before]
+        if after is not None:
+            trades = [t for t in trades if (t.transaction_time, t.id) > after][-limit:]
+        return trades[:limit]
+
+    async def most_traded_items(self, limit: int) -> Sequence[int]:
+        counts = Counter(t.item_id for t in self._transactions)
+        return sorted(counts, key=lambda item_id: (-counts[item_id], item_id))[:limit]
 
     async def add(self, entity: Transaction) -> Transaction:
         if not isinstance(entity, Transaction):
             raise ValueError("Can only add Transaction entities")
+        if entity.id is None:
+            entity.id = len(self._transactions) + 1
         self._transactions.append(entity)
         return entity
+
+    async def add_many(self, transactions: Sequence[Transaction]) -> Sequence[Transaction]:
+        for transaction in transactions:
+            await self.add(transaction)
+        return transactions
@@ -0,0 +1,50 @@
+import pytest
+
+from multiverse_market.exceptions import TooManyRequestsException
+from multiverse_market.infrastructure import WriteLimiter
+from multiverse_market.infrastructure.metrics import DecayingAverage
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestWriteLimiter:
+    async def test_sheds_writes_beyond_the_limit(self) -> None:
+        """Test that a write queueing too long for a slot is refused, and admitted once freed."""
+        limiter = WriteLimiter(1, 0.1, lambda: 0.0, queue_timeout=0.01)
+
+        async with limiter.admit():
+            with pytest.raises(TooManyRequestsException) as shed:
+                async with limiter.admit():
+                    pass
+        async with limiter.admit():
+            assert limiter.in_flight == 1
+
+        assert shed.value.headers == {"Retry-After": "1"}
+        assert limiter.in_flight == 0
+
+    async def test_sheds_writes_while_checkouts_wait(self) -> None:
+        """Test that writes are refused while the pool's recent checkout wait is too long."""
+        wait = 0.5
+        limiter = WriteLimiter(10, 0.1, lambda: wait, queue_timeout=0.01)
+
+        with pytest.raises(TooManyRequestsException):
+            async with limiter.admit():
+                pass
+        wait = 0.05
+        async with limiter.admit():
+            pass
+
+
+@pytest.mark.unit
+def test_decaying_average_fades_without_observations(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the average follows observations and halves every half-life without any."""
+    now = 100.0
+    monkeypatch.setattr("time.monotonic", lambda: now)
+    average = DecayingAverage(half_life=1.0, weight=0.5)
+
+    average.observe(0.4)
+    average.observe(0.4)
+    assert average.value() == pytest.approx(0.3)
+
+    now += 2.0
+    assert average.value() == pytest.approx(0.075)
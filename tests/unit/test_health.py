@@ -0,0 +1,59 @@
+import asyncio
+import logging
+
+import pytest
+
+from multiverse_market.infrastructure import HealthMonitor
+
+logger = logging.getLogger(__name__)
+
+
+async def ok() -> None:
+    pass
+
+
+async def failing() -> None:
+    raise ConnectionError("connection refused")
+
+
+async def hanging() -> None:
+    await asyncio.sleep(60)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestHealthMonitor:
+    async def test_check_records_each_dependency(self) -> None:
+        """Test that failing and timed out checks are reported unhealthy."""
+        monitor = HealthMonitor({"database": ok, "redis": failing, "search": hanging}, timeout=0.01)
+
+        status = await monitor.check()
+
+        assert status == {"database": True, "redis": False, "search": False}
+        assert not monitor.healthy
+
+    async def test_unchecked_dependencies_are_unhealthy(self) -> None:
+        """Test that nothing is reported healthy before it has been checked."""
+        monitor = HealthMonitor({"database": ok})
+
+        assert not monitor.healthy
+
+    async def test_background_checks_track_recovery(self) -> None:
+        """Test that the background task picks up a dependency coming back."""
+        available = asyncio.Event()
+
+        async def redis() -> None:
+            if not available.is_set():
+                raise ConnectionError("connection refused")
+
+        monitor = HealthMonitor({"redis": redis}, interval=0.001)
+        monitor.start()
+        try:
+            await asyncio.sleep(0.01)
+            assert not monitor.healthy
+
+            available.set()
+            await asyncio.sleep(0.01)
+            assert monitor.healthy
+        finally:
+            await monitor.close()
@@ -0,0 +1,53 @@
+import logging
+
+import pytest
+from starlette.types import Receive, Scope, Send
+
+from multiverse_market.logging_config import LogSamplingMiddleware, RequestSampler
+
+logger = logging.getLogger(__name__)
+
+
+def make_record(level: int) -> logging.LogRecord:
+    return logging.LogRecord("multiverse_market.api", level, __file__, 1, "message", None, None)
+
+
+async def receive() -> dict:
+    return {"type": "http.request"}
+
+
+async def send(_: dict) -> None:
+    pass
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestLogSampling:
+    @pytest.mark.parametrize("rate, kept", [(0.0, False), (1.0, True)])
+    async def test_request_info_records_follow_sampling(self, rate: float, kept: bool) -> None:
+        """Test that unsampled requests drop info records but keep warnings."""
+        sampler = RequestSampler()
+        seen: list[tuple[bool, bool]] = []
+
+        async def app(scope: Scope, receive: Receive, send: Send) -> None:
+            seen.append(
+                (
+                    sampler.filter(make_record(logging.INFO)),
+                    sampler.filter(make_record(logging.WARNING)),
+                )
+            )
+
+        await LogSamplingMiddleware(app, rate=rate)({"type": "http"}, receive, send)
+
+        assert seen == [(kept, True)]
+
+    async def test_records_outside_requests_are_kept(self) -> None:
+        """Test that startup and background records are not sampled."""
+        sampler = RequestSampler()
+
+        async def app(scope: Scope, receive: Receive, send: Send) -> None:
+            pass
+
+        await LogSamplingMiddleware(app, rate=0.0)({"type": "http"}, receive, send)
+
+        assert sampler.filter(make_record(logging.DEBUG))
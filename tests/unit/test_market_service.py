@@ -1,22 +1,36 @@
+import json
 import logging
+from datetime import UTC, datetime, timedelta
 
 import pytest
 import pytest_asyncio
+from pydantic import TypeAdapter, ValidationError
 
 from multiverse_market.exceptions import (
     InsufficientBalanceException,
     InsufficientStockException,
+    InvalidCursorException,
     ItemNotFoundException,
     UniverseNotFoundException,
     UserNotFoundException,
 )
+from multiverse_market.infrastructure import ITEMS, USERS, ReadThroughCache
+from multiverse_market.infrastructure.read_through import TOMBSTONE_PREFIX
 from multiverse_market.interfaces import CacheBackend
-from multiverse_market.models.entities import Item
-from multiverse_market.models.requests import CurrencyExchange, ItemPurchase
+from multiverse_market.models.entities import Item, Transaction, Universe, User
+from multiverse_market.models.requests import (
+    BatchItemPurchase,
+    CurrencyExchange,
+    ItemPurchase,
+    PurchaseLine,
+)
+from multiverse_market.models.schemas import TransactionSchema, UserSchema
 from multiverse_market.services.market import MarketService
 from tests.unit.mocks import (
+    InMemoryCacheService,
     MockItemRepository,
     MockTransactionRepository,
+    MockUnitOfWork,
     MockUniverseRepository,
     MockUserRepository,
 )
@@ -31,6 +45,7 @@ async def market_service(
     item_repo: MockItemRepository,
     universe_repo: MockUniverseRepository,
     transaction_repo: MockTransactionRepository,
+    unit_of_work: MockUnitOfWork,
     setup_test_data: None,
 ) -> MarketService:
     logger.debug("Creating market service with repositories")
@@ -40,8 +55,9 @@ async def market_service(
         transaction_repo=transaction_repo,
         universe_repo=universe_repo,
         cache=cache_backend,
+        unit_of_work=unit_of_work,
     )
-    logger.debug(f"Created market service with item_repo: {item_repo._items}")
+    logger.debug("Created market service with item_repo: %s", item_repo._items)
     return service
 
 
@@ -57,8 +73,10 @@ class TestMarketService:
         exchange = CurrencyExchange(user_id=1, amount=100.0, from_universe_id=1, to_universe_id=2)
 
         logger.debug(
-            f"Exchange details: {exchange.amount} from universe {exchange.from_universe_id} "
-            f"to {exchange.to_universe_id}"
+            "Exchange details: %s from universe %s to %s",
+            exchange.amount,
+            exchange.from_universe_id,
+            exchange.to_universe_id,
         )
 
         result = await market_service.exchange_currency(exchange)
@@ -100,6 +118,41 @@ class TestMarketService:
         with pytest.raises(UniverseNotFoundException):
             await market_service.exchange_currency(exchange)
 
+    @pytest.mark.currency
+    async def test_unknown_universes_do_not_rebuild_rates(
+        self,
+        market_service: MarketService,
+        universe_repo: MockUniverseRepository,
+        setup_test_data: None,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """Test that only universes that exist rebuild the exchange rate matrix."""
+        builds = 0
+        list_universes = universe_repo.list
+
+        async def counting_list(**filters):
+            nonlocal builds
+            builds += 1
+            return await list_universes(**filters)
+
+        monkeypatch.setattr(universe_repo, "list", counting_list)
+        exchange = CurrencyExchange(user_id=1, amount=1.0, from_universe_id=1, to_universe_id=2)
+        await market_service.exchange_currency(exchange)
+        bogus = exchange.model_copy(update={"to_universe_id": 999})
+        for _ in range(3):
+            with pytest.raises(UniverseNotFoundException):
+                await market_service.exchange_currency(bogus)
+        assert builds == 1
+
+        universe_repo._universes[3] = Universe(
+            id=3, name="Venus", currency_type="VNS", exchange_rate=5.0
+        )
+        result = await market_service.exchange_currency(
+            exchange.model_copy(update={"to_universe_id": 3})
+        )
+        assert result.exchange_rate == 5.0
+        assert builds == 2
+
     @pytest.mark.currency
     async def test_exchange_currency_between_same_universe(
         self, market_service: MarketService, setup_test_data: None
@@ -147,6 +200,29 @@ class TestMarketService:
         with pytest.raises(InsufficientStockException):
             await market_service.buy_item(purchase)
 
+    @pytest.mark.purchase
+    async def test_buy_item_exhausts_stock(
+        self,
+        market_service: MarketService,
+        user_repo: MockUserRepository,
+        item_repo: MockItemRepository,
+        setup_test_data: None,
+    ) -> None:
+        """Test that stock can be bought out exactly and no further."""
+        item_repo._items[1].price = 10.0
+
+        await market_service.buy_item(ItemPurchase(buyer_id=1, item_id=1, quantity=10))
+
+        with pytest.raises(InsufficientStockException):
+            await market_service.buy_item(ItemPurchase(buyer_id=1, item_id=1, quantity=1))
+
+        item = await item_repo.get(1)
+        user = await user_repo.get(1)
+        if item is None or user is None:
+            raise Exception("test data not found")
+        assert item.stock == 0
+        assert user.balance == 900.0  # 1000 - (10 * 10), failed purchase not charged
+
     @pytest.mark.purchase
     async def test_buy_item_invalid_item(
         self, market_service: MarketService, setup_test_data: None
@@ -192,6 +268,187 @@ class TestMarketService:
         with pytest.raises(InsufficientBalanceException):
             await market_service.buy_item(purchase)
 
+    @pytest.mark.purchase
+    async def test_buy_items_success(
+        self,
+        market_service: MarketService,
+        user_repo: MockUserRepository,
+        item_repo: MockItemRepository,
+        unit_of_work: MockUnitOfWork,
+        setup_test_data: None,
+    ) -> None:
+        """Test buying several items, including a cross-universe one, in one commit."""
+        item_repo._items[2] = Item(id=2, name="Mars Item", universe_id=2, price=100.0, stock=5)
+        purchase = BatchItemPurchase(
+            buyer_id=1,
+            lines=[PurchaseLine(item_id=1, quantity=2), PurchaseLine(item_id=2, quantity=1)],
+        )
+
+        result = await market_service.buy_items(purchase)
+
+        assert [t.item_id for t in result] == [1, 2]
+        assert [t.amount for t in result] == [200.0, 250.0]  # Mars item at rate 2.5
+        assert item_repo._items[1].stock == 8
+        assert item_repo._items[2].stock == 4
+        assert user_repo._users[1].balance == 550.0  # 1000 - (200 + 250)
+        assert unit_of_work.commits == 1
+
+    @pytest.mark.purchase
+    async def test_buy_items_is_all_or_nothing(
+        self,
+        market_service: MarketService,
+        item_repo: MockItemRepository,
+        transaction_repo: MockTransactionRepository,
+        unit_of_work: MockUnitOfWork,
+        setup_test_data: None,
+    ) -> None:
+        """Test that one short line fails the whole batch before anything is written."""
+        item_repo._items[2] = Item(id=2, name="Mars Item", universe_id=2, price=100.0, stock=1)
+        purchase = BatchItemPurchase(
+            buyer_id=1,
+            lines=[PurchaseLine(item_id=1, quantity=1), PurchaseLine(item_id=2, quantity=2)],
+        )
+
+        with pytest.raises(InsufficientStockException):
+            await market_service.buy_items(purchase)
+
+        assert item_repo._items[1].stock == 10
+        assert transaction_repo._transactions == []
+        assert unit_of_work.commits == 0
+        assert unit_of_work.rollbacks == 1
+
+    @pytest.mark.purchase
+    async def test_buy_items_unknown_item(
+        self, market_service: MarketService, setup_test_data: None
+    ) -> None:
+        """Test batch purchase fails when any line references an unknown item."""
+        purchase = BatchItemPurchase(
+            buyer_id=1,
+            lines=[PurchaseLine(item_id=1, quantity=1), PurchaseLine(item_id=999, quantity=1)],
+        )
+
+        with pytest.raises(ItemNotFoundException):
+            await market_service.buy_items(purchase)
+
+    @pytest.mark.purchase
+    async def test_batch_purchase_rejects_duplicate_items(self) -> None:
+        """Test that a batch may not list the same item twice."""
+        with pytest.raises(ValidationError):
+            BatchItemPurchase(
+                buyer_id=1,
+                lines=[PurchaseLine(item_id=1, quantity=1), PurchaseLine(item_id=1, quantity=2)],
+            )
+
+    @pytest.mark.purchase
+    async def test_buy_item_group_admits_purchases_in_order(
+        self,
+        market_service: MarketService,
+        user_repo: MockUserRepository,
+        item_repo: MockItemRepository,
+        unit_of_work: MockUnitOfWork,
+        setup_test_data: None,
+    ) -> None:
+        """Test that a purchase group fills in order and rejects only what cannot fit."""
+        item_repo._items[1].stock = 11
+        purchases = [
+            ItemPurchase(buyer_id=1, item_id=1, quantity=4),
+            ItemPurchase(buyer_id=999, item_id=1, quantity=1),
+            ItemPurchase(buyer_id=1, item_id=1, quantity=4),
+            ItemPurchase(buyer_id=1, item_id=1, quantity=4),
+            ItemPurchase(buyer_id=1, item_id=1, quantity=2),
+            ItemPurchase(buyer_id=1, item_id=1, quantity=1),
+        ]
+
+        results = await market_service.buy_item_group(1, purchases)
+
+        assert [type(r) for r in results] == [
+            TransactionSchema,
+            UserNotFoundException,
+            TransactionSchema,
+            InsufficientStockException,  # only 3 left after the first two purchases
+            TransactionSchema,
+            InsufficientBalanceException,  # all 1000 spent on 10 units at 100
+        ]
+        assert item_repo._items[1].stock == 1
+        assert user_repo._users[1].balance == 0.0
+        assert unit_of_work.commits == 1
+
+    @pytest.mark.purchase
+    async def test_buy_item_group_readmits_after_refused_debit(
+        self,
+        market_service: MarketService,
+        user_repo: MockUserRepository,
+        item_repo: MockItemRepository,
+        setup_test_data: None,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """Test that a refused debit turns away one purchase and frees its stock for others."""
+        user_repo._users[2] = User(id=2, username="other_user", universe_id=1, balance=1000.0)
+        item_repo._items[1].stock = 6
+        purchases = [
+            ItemPurchase(buyer_id=2, item_id=1, quantity=2),
+            ItemPurchase(buyer_id=2, item_id=1, quantity=3),
+            ItemPurchase(buyer_id=1, item_id=1, quantity=3),
+            ItemPurchase(buyer_id=1, item_id=1, quantity=1),
+        ]
+        get_many = user_repo.get_many
+
+        async def get_many_then_drain(ids):
+            users = [
+                User(**{c: getattr(u, c) for c in ("id", "username", "universe_id", "balance")})
+                for u in await get_many(ids)
+            ]
+            user_repo._users[2].balance = 250.0  # A concurrent debit lands after the read
+            return users
+
+        monkeypatch.setattr(user_repo, "get_many", get_many_then_drain)
+
+        results = await market_service.buy_item_group(1, purchases)
+
+        assert [type(r) for r in results] == [
+            TransactionSchema,
+            InsufficientBalanceException,  # the combined 500 is refused, then just this one
+            TransactionSchema,  # fits in the 3 units the refused purchase freed
+            TransactionSchema,
+        ]
+        assert item_repo._items[1].stock == 0
+        assert user_repo._users[1].balance == 600.0
+        assert user_repo._users[2].balance == 50.0
+
+    @pytest.mark.purchase
+    async def test_buy_item_group_turns_away_tail_when_stock_runs_short(
+        self,
+        market_service: MarketService,
+        user_repo: MockUserRepository,
+        item_repo: MockItemRepository,
+        setup_test_data: None,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """Test that stock taken since it was read only turns away purchases that no longer fit."""
+        get_many_for_update = item_repo.get_many_for_update
+
+        async def lock_then_take(item_ids):
+            items = [
+                Item(**{c: getattr(i, c) for c in ("id", "name", "universe_id", "price", "stock")})
+                for i in await get_many_for_update(item_ids)
+            ]
+            await item_repo.update_stock(1, 6)  # A single purchase takes from the shards
+            return items
+
+        monkeypatch.setattr(item_repo, "get_many_for_update", lock_then_take)
+        purchases = [ItemPurchase(buyer_id=1, item_id=1, quantity=q) for q in (3, 2, 4, 1)]
+
+        results = await market_service.buy_item_group(1, purchases)
+
+        assert [type(r) for r in results] == [
+            TransactionSchema,
+            TransactionSchema,
+            InsufficientStockException,
+            TransactionSchema,
+        ]
+        assert item_repo._items[1].stock == 0
+        assert user_repo._users[1].balance == 400.0
+
     @pytest.mark.user
     async def test_get_user_not_found(self, market_service: MarketService) -> None:
         """Test user retrieval fails for non-existent user."""
@@ -262,23 +519,215 @@ class TestMarketService:
 
     @pytest.mark.cache
     async def test_exchange_rate_cache_invalidation(
-        self, market_service: MarketService, cache_backend: CacheBackend, setup_test_data: None
+        self,
+        market_service: MarketService,
+        universe_repo: MockUniverseRepository,
+        cache_backend: CacheBackend,
+        setup_test_data: None,
     ) -> None:
-        """Test that exchange rate caches are properly invalidated."""
-        # First, make an exchange to cache the rate
+        """Test that exchange rates are served from memory until invalidated."""
         exchange = CurrencyExchange(user_id=1, amount=100.0, from_universe_id=1, to_universe_id=2)
         await market_service.exchange_currency(exchange)
 
-        # Verify rate is cached
-        cache_key = "exchange_rate:1:2"
-        assert await cache_backend.get(cache_key) is not None
+        # Rate changes are not seen until the rate version is bumped
+        universe_repo._universes[2].exchange_rate = 5.0
+        result = await market_service.exchange_currency(exchange)
+        assert result.exchange_rate == 2.5
 
-        # Invalidate cache for universe 1
-        await market_service._invalidate_exchange_rate_cache(1)
+        # Invalidate rates for universe 2
+        await market_service._invalidate_exchange_rate_cache(2)
+        assert await cache_backend.get("exchange_rate:generation") == "1"
 
-        # Verify cache is cleared
-        assert await cache_backend.get(cache_key) is None
-        assert await cache_backend.get("exchange_rate:2:1") is None
+        result = await market_service.exchange_currency(exchange)
+        assert result.exchange_rate == 5.0
+
+    @pytest.mark.cache
+    async def test_exchange_rate_lookup_avoids_cache_and_database(
+        self,
+        market_service: MarketService,
+        universe_repo: MockUniverseRepository,
+        cache_backend: InMemoryCacheService,
+        setup_test_data: None,
+    ) -> None:
+        """Test that a built rate matrix answers lookups without any I/O."""
+        exchange = CurrencyExchange(user_id=1, amount=10.0, from_universe_id=1, to_universe_id=2)
+        await market_service.exchange_currency(exchange)
+
+        universes = universe_repo._universes
+        universe_repo._universes = {}
+        cache_backend._cache.clear()
+        try:
+            result = await market_service.exchange_currency(exchange)
+        finally:
+            universe_repo._universes = universes
+
+        assert result.exchange_rate == 2.5
+
+    @pytest.mark.cache
+    async def test_bulk_invalidation_bumps_generation(
+        self, market_service: MarketService, cache_backend: CacheBackend, setup_test_data: None
+    ) -> None:
+        """Test that invalidating all users orphans every user key at once."""
+        stale_key = await USERS.key(cache_backend, 1)
+        await cache_backend.setex(stale_key, 60, "cached")
+
+        await market_service._invalidate_all_user_caches()
+
+        assert await USERS.key(cache_backend, 1) != stale_key
+        assert await cache_backend.get(await USERS.key(cache_backend, 1)) is None
+        assert await ITEMS.generation(cache_backend) == 0
+
+    @pytest.mark.cache
+    async def test_purchase_invalidation_is_one_pipelined_round_trip(
+        self,
+        market_service: MarketService,
+        cache_backend: InMemoryCacheService,
+        setup_test_data: None,
+    ) -> None:
+        """Test that post-commit invalidations are sent together in one pipeline."""
+        user_key = await USERS.key(cache_backend, 1)
+        item_key = await ITEMS.key(cache_backend, 1)
+        await cache_backend.set_many({user_key: "cached", item_key: "cached"}, 60)
+        cache_backend.round_trips = 0
+
+        await market_service.buy_item(ItemPurchase(buyer_id=1, item_id=1, quantity=1))
+
+        # One MGET resolving namespace generations, one pipeline carrying every invalidation
+        assert cache_backend.round_trips == 2
+        cached = await cache_backend.get_many([user_key, item_key])
+        assert all(value.startswith(TOMBSTONE_PREFIX) for value in cached)
+
+    @pytest.mark.cache
+    async def test_get_user_reads_through_cache(
+        self,
+        market_service: MarketService,
+        user_repo: MockUserRepository,
+        setup_test_data: None,
+    ) -> None:
+        """Test that a cached user is served without the database until it changes."""
+        await market_service.get_user(1)
+        user_repo._users[1].balance = 0.0  # Invisible until the user is invalidated
+
+        cached = await market_service.get_user(1)
+        assert cached.balance == 1000.0
+        assert market_service._read_through.hit_rate("user") == 0.5
+
+        await market_service._invalidate_user_cache(1)
+        assert (await market_service.get_user(1)).balance == 0.0
+
+    @pytest.mark.cache
+    async def test_invalidation_during_load_is_not_overwritten(
+        self,
+        market_service: MarketService,
+        user_repo: MockUserRepository,
+        cache_backend: InMemoryCacheService,
+        setup_test_data: None,
+    ) -> None:
+        """Test that a load racing an invalidation does not write its stale value back."""
+        read_through = market_service._read_through
+        user_key = await USERS.key(cache_backend, 1)
+
+        async def load_then_invalidate() -> UserSchema:
+            stale = UserSchema.model_validate(user_repo._users[1])
+            user_repo._users[1].balance = 0.0  # A writer commits while the load is in flight
+            await market_service._invalidate_user_cache(1)
+            return stale
+
+        adapter = TypeAdapter(UserSchema)
+        stale = await read_through.get(
+            cache_backend, "user", user_key, adapter, load_then_invalidate
+        )
+        assert stale.balance == 1000.0
+        assert (await cache_backend.get(user_key)).startswith(TOMBSTONE_PREFIX)
+        assert (await market_service.get_user(1)).balance == 0.0
+        assert (await market_service.get_user(1)).balance == 0.0
+
+    @pytest.mark.cache
+    async def test_purchase_refreshes_cached_reads(
+        self, market_service: MarketService, setup_test_data: None
+    ) -> None:
+        """Test that a committed purchase invalidates the buyer and every item listing."""
+        assert (await market_service.get_user(1)).balance == 1000.0
+        assert (await market_service.list_items(universe_id=1))[0].stock == 10
+        assert (await market_service.list_items())[0].stock == 10
+
+        await market_service.buy_item(ItemPurchase(buyer_id=1, item_id=1, quantity=2))
+
+        assert (await market_service.get_user(1)).balance == 800.0
+        assert (await market_service.list_items(universe_id=1))[0].stock == 8
+        assert (await market_service.list_items())[0].stock == 8
+
+    @pytest.mark.cache
+    async def test_zero_ttl_disables_read_through(
+        self,
+        user_repo: MockUserRepository,
+        item_repo: MockItemRepository,
+        transaction_repo: MockTransactionRepository,
+        universe_repo: MockUniverseRepository,
+        cache_backend: InMemoryCacheService,
+        unit_of_work: MockUnitOfWork,
+        setup_test_data: None,
+    ) -> None:
+        """Test that a kind with a zero TTL always goes to the database."""
+        read_through = ReadThroughCache(ttls={"universes": 0})
+        service = MarketService(
+            user_repo,
+            item_repo,
+            transaction_repo,
+            universe_repo,
+            cache_backend,
+            unit_of_work,
+            read_through=read_through,
+        )
+
+        await service.list_universes()
+        await service.list_universes()
+
+        assert read_through.hits["universes"] == read_through.misses["universes"] == 0
+        assert not [key for key in cache_backend._cache if key.endswith("universes")]
+
+    @pytest.mark.cache
+    async def test_list_items_json_serves_cached_bytes(
+        self,
+        market_service: MarketService,
+        item_repo: MockItemRepository,
+        setup_test_data: None,
+    ) -> None:
+        """Test that listings are encoded once and then served as cached bytes."""
+        encoded = await market_service.list_items_json(universe_id=1)
+        assert json.loads(encoded) == [
+            item.model_dump() for item in await market_service.list_items(universe_id=1)
+        ]
+
+        item_repo._items.clear()  # Invisible until the catalog version changes
+        assert await market_service.list_items_json(universe_id=1) == encoded
+        assert market_service._read_through.hits["items"] == 2
+
+    @pytest.mark.cache
+    async def test_warm_caches_loads_hot_listings(
+        self,
+        market_service: MarketService,
+        item_repo: MockItemRepository,
+        transaction_repo: MockTransactionRepository,
+        setup_test_data: None,
+    ) -> None:
+        """Test that warm-up caches rates, universes and the listings of the hottest items."""
+        item_repo._items[2] = Item(id=2, name="Mars Item", universe_id=2, price=5.0, stock=5)
+        for item_id in (1, 1, 2):
+            await transaction_repo.add(
+                Transaction(buyer_id=1, seller_id=1, item_id=item_id, amount=1.0, quantity=1)
+            )
+
+        await market_service.warm_caches(top_items=1)
+
+        read_through = market_service._read_through
+        assert market_service._exchange_rates._matrix is not None
+        assert (read_through.misses["universes"], read_through.misses["items"]) == (1, 2)
+        await market_service.list_universes_json()
+        await market_service.list_items_json()
+        await market_service.list_items_json(universe_id=1)
+        assert (read_through.hits["universes"], read_through.hits["items"]) == (1, 2)
+        assert read_through.misses["items"] == 2
 
     @pytest.mark.item
     async def test_list_items_without_universe_filter(
@@ -289,11 +738,11 @@ class TestMarketService:
     ) -> None:
         """Test listing all items without universe filter."""
         logger.debug("Starting test_list_items_without_universe_filter")
-        logger.debug(f"Initial items in repo: {item_repo._items}")
+        logger.debug("Initial items in repo: %s", item_repo._items)
 
         # Get initial items (should be one from setup_test_data)
         initial_items = await market_service.list_items()
-        logger.debug(f"Initial items from list_items: {initial_items}")
+        logger.debug("Initial items from list_items: %s", initial_items)
         assert len(initial_items) == 1
         assert initial_items[0].name == "Test Item"
         assert initial_items[0].universe_id == 1
@@ -307,11 +756,12 @@ class TestMarketService:
             stock=5,
         )
         item_repo._items[2] = mars_item
-        logger.debug(f"Added Mars item, current items: {item_repo._items}")
+        await market_service._invalidate_item_cache(mars_item.id)
+        logger.debug("Added Mars item, current items: %s", item_repo._items)
 
         # Get all items
         result = await market_service.list_items()
-        logger.debug(f"Final items from list_items: {result}")
+        logger.debug("Final items from list_items: %s", result)
 
         # Verify all items are returned
         assert len(result) == 2
@@ -359,10 +809,103 @@ class TestMarketService:
         await market_service.buy_item(purchase2)
 
         # Get trade history
-        trades = await market_service.get_user_trades(1)
+        page = await market_service.get_user_trades(1)
+        trades = page.trades
 
-        # Verify all trades are returned
+        # Verify all trades are returned, newest first
         assert len(trades) == 2
-        assert trades[0].quantity == 1
-        assert trades[1].quantity == 2
+        assert trades[0].quantity == 2
+        assert trades[1].quantity == 1
         assert all(trade.buyer_id == 1 for trade in trades)
+        assert page.next_cursor is None and page.prev_cursor is None
+
+    @pytest.mark.transaction
+    async def test_get_user_trades_keyset_pagination(
+        self,
+        market_service: MarketService,
+        transaction_repo: MockTransactionRepository,
+        setup_test_data: None,
+    ) -> None:
+        """Test walking the trade history backwards and forwards with cursors."""
+        start = datetime(2024, 1, 1, tzinfo=UTC)
+        for i in range(1, 6):
+            await transaction_repo.add(
+                Transaction(
+                    id=i,
+                    buyer_id=1,
+                    seller_id=1,
+                    item_id=1,
+                    amount=1.0,
+                    quantity=i,
+                    from_universe_id=1,
+                    to_universe_id=1,
+                    transaction_time=start + timedelta(minutes=i),
+                )
+            )
+
+        first = await market_service.get_user_trades(1, limit=2)
+        assert [t.id for t in first.trades] == [5, 4]
+        assert first.prev_cursor is None
+
+        second = await market_service.get_user_trades(1, limit=2, before=first.next_cursor)
+        assert [t.id for t in second.trades] == [3, 2]
+
+        last = await market_service.get_user_trades(1, limit=2, before=second.next_cursor)
+        assert [t.id for t in last.trades] == [1]
+        assert last.next_cursor is None
+
+        back = await market_service.get_user_trades(1, limit=2, after=last.prev_cursor)
+        assert [t.id for t in back.trades] == [3, 2]
+        assert back.prev_cursor is not None
+
+    @pytest.mark.transaction
+    async def test_get_user_trades_rejects_bad_cursor(
+        self, market_service: MarketService, setup_test_data: None
+    ) -> None:
+        """Test that malformed or conflicting cursors are rejected."""
+        with pytest.raises(InvalidCursorException):
+            await market_service.get_user_trades(1, before="not-a-cursor")
+        with pytest.raises(InvalidCursorException):
+            await market_service.get_user_trades(1, before="x", after="y")
+
+    @pytest.mark.transaction
+    async def test_buy_item_commits_once(
+        self,
+        market_service: MarketService,
+        unit_of_work: MockUnitOfWork,
+        setup_test_data: None,
+    ) -> None:
+        """Test that a purchase is committed as a single unit of work."""
+        await market_service.buy_item(ItemPurchase(buyer_id=1, item_id=1, quantity=1))
+
+        assert unit_of_work.commits == 1
+        assert unit_of_work.rollbacks == 0
+
+    @pytest.mark.transaction
+    async def test_exchange_currency_commits_once(
+        self,
+        market_service: MarketService,
+        unit_of_work: MockUnitOfWork,
+        setup_test_data: None,
+    ) -> None:
+        """Test that a currency exchange is committed as a single unit of work."""
+        exchange = CurrencyExchange(user_id=1, amount=100.0, from_universe_id=1, to_universe_id=2)
+
+        await market_service.exchange_currency(exchange)
+
+        assert unit_of_work.commits == 1
+        assert unit_of_work.rollbacks == 0
+
+    @pytest.mark.transaction
+    async def test_failed_purchase_rolls_back(
+        self,
+        market_service: MarketService,
+        unit_of_work: MockUnitOfWork,
+        setup_test_data: None,
+    ) -> None:
+        """Test that a failed purchase rolls back instead of committing."""
+        with pytest.raises(InsufficientStockException):
+            await market_service.buy_item(ItemPurchase(buyer_id=1, item_id=1, quantity=20))
+
+        assert unit_of_work.commits == 0
+        assert unit_of_work.rollbacks == 1
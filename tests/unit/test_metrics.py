@@ -0,0 +1,87 @@
+import pytest
+
+from multiverse_market.infrastructure.metrics import (
+    REPOSITORY_CALL_DURATION,
+    Metric,
+    MetricsRegistry,
+    time_repository_methods,
+)
+
+
+@pytest.mark.unit
+class TestMetricsRegistry:
+    def test_counter_renders_per_label_set(self) -> None:
+        """Test that counters render one escaped sample per label set."""
+        registry = MetricsRegistry()
+        lookups = registry.counter("lookups_total", "Lookups", ("backend", "result"))
+        lookups.inc("redis", "hit")
+        lookups.inc("redis", "hit", amount=2)
+        lookups.inc('lo"cal', "miss")
+
+        assert registry.render() == (
+            "# HELP lookups_total Lookups\n"
+            "# TYPE lookups_total counter\n"
+            'lookups_total{backend="lo\\"cal",result="miss"} 1\n'
+            'lookups_total{backend="redis",result="hit"} 3\n'
+        )
+
+    def test_histogram_buckets_are_cumulative(self) -> None:
+        """Test that histogram buckets count every observation at or below their bound."""
+        registry = MetricsRegistry()
+        latency = registry.histogram("latency_seconds", "Latency", ("route",), (0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            latency.observe(value, "/items")
+
+        lines = registry.render().splitlines()[2:]
+        assert lines == [
+            'latency_seconds_bucket{route="/items",le="0.1"} 2',
+            'latency_seconds_bucket{route="/items",le="1"} 3',
+            'latency_seconds_bucket{route="/items",le="+Inf"} 4',
+            'latency_seconds_sum{route="/items"} 3.65',
+            'latency_seconds_count{route="/items"} 4',
+        ]
+        assert latency.count("/items") == 4
+
+    def test_callbacks_are_read_at_render_time(self) -> None:
+        """Test that callback metrics collect fresh values and failures skip the metric."""
+        registry = MetricsRegistry()
+        in_use = {"database": 0}
+        registry.callback(
+            "in_use", "In use", ("pool",), lambda: [(("database",), in_use["database"])]
+        )
+        registry.callback("broken", "Broken", (), lambda: [((), 1 / 0)])
+
+        in_use["database"] = 4
+
+        assert registry.render() == (
+            '# HELP in_use In use\n# TYPE in_use gauge\nin_use{pool="database"} 4\n'
+        )
+
+    def test_metrics_must_define_their_samples(self) -> None:
+        """Test that a metric type without samples cannot be instantiated."""
+
+        class Gauge(Metric):
+            type = "gauge"
+
+        with pytest.raises(TypeError):
+            Gauge("gauge", "Gauge")  # type: ignore[abstract]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_repository_methods_are_timed() -> None:
+    """Test that public coroutine methods are timed per repository class."""
+
+    class ThingRepository:
+        async def get(self, thing_id: int) -> int:
+            return thing_id
+
+        def _helper(self) -> None:
+            pass
+
+    time_repository_methods(ThingRepository)
+
+    assert await ThingRepository().get(3) == 3
+    assert ThingRepository.get.__name__ == "get"
+    assert REPOSITORY_CALL_DURATION.count("ThingRepository", "get") == 1
+    assert REPOSITORY_CALL_DURATION.count("ThingRepository", "_helper") == 0
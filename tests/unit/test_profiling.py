@@ -0,0 +1,66 @@
+import pstats
+from pathlib import Path
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.types import Message, Receive, Scope, Send
+
+from multiverse_market.infrastructure import ProfilingMiddleware, track_queries
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def request(middleware: ProfilingMiddleware, token: bytes | None) -> dict[bytes, bytes]:
+    headers = [] if token is None else [(b"x-profile", token)]
+    scope = {"type": "http", "method": "GET", "path": "/api/v1/items", "headers": headers}
+    messages: list[Message] = []
+
+    async def receive() -> Message:
+        return {"type": "http.request"}
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return dict(messages[0]["headers"])
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestProfilingMiddleware:
+    async def test_profiles_requests_with_the_token(self, tmp_path: Path) -> None:
+        """Test that an opted-in request gets timings and a profile on disk."""
+        middleware = ProfilingMiddleware(app, token="secret", directory=tmp_path)
+
+        headers = await request(middleware, b"secret")
+
+        assert headers[b"server-timing"].startswith(b'sql;dur=0.00;desc="0 statements", redis')
+        profile = tmp_path / headers[b"x-profile-file"].decode()
+        assert "app" in {function for _, _, function in pstats.Stats(str(profile)).stats}
+
+    @pytest.mark.parametrize("token", [None, b"guess"])
+    async def test_ignores_other_requests(self, tmp_path: Path, token: bytes | None) -> None:
+        """Test that requests without the right token are served untouched."""
+        middleware = ProfilingMiddleware(app, token="secret", directory=tmp_path)
+
+        assert await request(middleware, token) == {}
+        assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_failed_statements_are_accounted() -> None:
+    """Test that a failing statement is counted, and its error reaches the caller."""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    with track_queries() as stats:
+        async with engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                await connection.execute(text("SELECT * FROM missing"))
+    await engine.dispose()
+
+    assert stats.statements == ["SELECT * FROM missing"]
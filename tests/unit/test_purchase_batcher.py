@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from collections.abc import Sequence
+
+import pytest
+
+from multiverse_market.exceptions import InsufficientStockException
+from multiverse_market.models.requests import ItemPurchase
+from multiverse_market.models.schemas import TransactionSchema
+from multiverse_market.services import PurchaseBatcher
+from multiverse_market.services.batcher import PurchaseResult
+
+logger = logging.getLogger(__name__)
+
+
+class RecordingApply:
+    """Applies purchase groups against a fixed stock, recording each group."""
+
+    def __init__(self, stock: int, delay: float = 0.0):
+        self.stock = stock
+        self.delay = delay
+        self.groups: list[list[ItemPurchase]] = []
+
+    async def __call__(
+        self, item_id: int, purchases: Sequence[ItemPurchase]
+    ) -> list[PurchaseResult]:
+        self.groups.append(list(purchases))
+        await asyncio.sleep(self.delay)
+        results: list[PurchaseResult] = []
+        for purchase in purchases:
+            if purchase.quantity > self.stock:
+                results.append(InsufficientStockException())
+                continue
+            self.stock -= purchase.quantity
+            results.append(
+                TransactionSchema(
+                    buyer_id=purchase.buyer_id,
+                    seller_id=1,
+                    item_id=item_id,
+                    amount=1.0,
+                    quantity=purchase.quantity,
+                    from_universe_id=1,
+                    to_universe_id=1,
+                )
+            )
+        return results
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+@pytest.mark.purchase
+class TestPurchaseBatcher:
+    async def test_concurrent_purchases_form_one_group(self) -> None:
+        """Test that purchases arriving within the window are applied together."""
+        apply = RecordingApply(stock=100)
+        batcher = PurchaseBatcher(apply, window=0.01)
+
+        results = await asyncio.gather(
+            *(batcher.submit(ItemPurchase(buyer_id=i, item_id=1, quantity=1)) for i in range(10))
+        )
+
+        assert len(apply.groups) == 1
+        assert [r.buyer_id for r in results] == list(range(10))
+
+    async def test_each_caller_gets_its_own_error(self) -> None:
+        """Test that a rejected purchase fails only its own caller."""
+        apply = RecordingApply(stock=3)
+        batcher = PurchaseBatcher(apply, window=0.01)
+
+        results = await asyncio.gather(
+            batcher.submit(ItemPurchase(buyer_id=1, item_id=1, quantity=2)),
+            batcher.submit(ItemPurchase(buyer_id=2, item_id=1, quantity=2)),
+            batcher.submit(ItemPurchase(buyer_id=3, item_id=1, quantity=1)),
+            return_exceptions=True,
+        )
+
+        assert isinstance(results[0], TransactionSchema)
+        assert isinstance(results[1], InsufficientStockException)
+        assert isinstance(results[2], TransactionSchema)
+
+    async def test_max_batch_size_flushes_early(self) -> None:
+        """Test that a full group is applied without waiting for the window."""
+        apply = RecordingApply(stock=100)
+        batcher = PurchaseBatcher(apply, window=60, max_batch_size=4)
+
+        results = await asyncio.wait_for(
+            asyncio.gather(
+                *(batcher.submit(ItemPurchase(buyer_id=i, item_id=1, quantity=1)) for i in range(4))
+            ),
+            timeout=1,
+        )
+
+        assert len(results) == 4
+        assert len(apply.groups) == 1
+
+    async def test_purchases_queue_behind_group_in_flight(self) -> None:
+        """Test that purchases arriving during a group's commit form the next group."""
+        apply = RecordingApply(stock=100, delay=0.05)
+        batcher = PurchaseBatcher(apply, window=0.001)
+
+        first = asyncio.create_task(batcher.submit(ItemPurchase(buyer_id=1, item_id=1, quantity=1)))
+        await asyncio.sleep(0.01)
+        rest = [
+            asyncio.create_task(batcher.submit(ItemPurchase(buyer_id=i, item_id=1, quantity=1)))
+            for i in range(2, 6)
+        ]
+        await asyncio.gather(first, *rest)
+
+        assert [len(group) for group in apply.groups] == [1, 4]
+
+    async def test_group_failure_fails_every_caller(self) -> None:
+        """Test that an error applying the group is raised to all of its callers."""
+
+        async def failing_apply(
+            item_id: int, purchases: Sequence[ItemPurchase]
+        ) -> list[PurchaseResult]:
+            raise RuntimeError("database unavailable")
+
+        batcher = PurchaseBatcher(failing_apply, window=0.001)
+
+        results = await asyncio.gather(
+            batcher.submit(ItemPurchase(buyer_id=1, item_id=1, quantity=1)),
+            batcher.submit(ItemPurchase(buyer_id=2, item_id=1, quantity=1)),
+            return_exceptions=True,
+        )
+
+        assert all(isinstance(r, RuntimeError) for r in results)
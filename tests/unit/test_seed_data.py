@@ -0,0 +1,82 @@
+import json
+import logging
+import random
+from pathlib import Path
+
+import pytest
+
+from multiverse_market.scripts.generate_data import DataGenerator, ZipfSampler
+from multiverse_market.scripts.seed_data import load_seed_file
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.unit
+class TestLoadSeedFile:
+    def test_loads_json(self, tmp_path: Path) -> None:
+        """Test that a JSON file of rows per table is validated."""
+        path = tmp_path / "seed.json"
+        path.write_text(
+            json.dumps(
+                {
+                    "universes": [
+                        {"id": 1, "name": "Earth", "currency_type": "USD", "exchange_rate": 1}
+                    ]
+                }
+            )
+        )
+
+        data = load_seed_file(path)
+
+        assert data == {
+            "universes": [{"id": 1, "name": "Earth", "currency_type": "USD", "exchange_rate": 1.0}]
+        }
+
+    def test_loads_csv_directory(self, tmp_path: Path) -> None:
+        """Test that CSV files are read per table and their values coerced."""
+        (tmp_path / "items.csv").write_text(
+            "id,name,universe_id,price,stock\n1,Earth Coffee,1,5.5,100\n"
+        )
+        (tmp_path / "users.csv").write_text("id,username,universe_id,balance\n2,mary,1,25\n")
+
+        data = load_seed_file(tmp_path)
+
+        assert data["items"] == [
+            {"id": 1, "name": "Earth Coffee", "universe_id": 1, "price": 5.5, "stock": 100}
+        ]
+        assert data["users"] == [{"id": 2, "username": "mary", "universe_id": 1, "balance": 25.0}]
+
+    def test_rejects_unknown_table(self, tmp_path: Path) -> None:
+        """Test that rows for tables the seeder does not know are refused."""
+        path = tmp_path / "orders.csv"
+        path.write_text("id\n1\n")
+
+        with pytest.raises(ValueError, match="orders"):
+            load_seed_file(path)
+
+
+@pytest.mark.unit
+class TestDataGenerator:
+    def test_zipf_skew_concentrates_popularity(self) -> None:
+        """Test that a higher skew hands more traffic to the most popular values."""
+        uniform = ZipfSampler(range(1000), 0, random.Random(1))
+        skewed = ZipfSampler(range(1000), 1.1, random.Random(1))
+
+        assert uniform.share_of_top(0.01) == pytest.approx(0.01)
+        assert skewed.share_of_top(0.01) > 0.4
+
+    def test_generation_is_reproducible(self) -> None:
+        """Test that a seed yields the same rows, referencing only generated ids."""
+
+        def generate() -> DataGenerator:
+            return DataGenerator(universes=3, users=20, items=10, transactions=25, seed=7)
+
+        chunks = list(generate().transaction_chunks(10))
+        rows = [row for chunk in chunks for row in chunk]
+
+        assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+        again = [row for chunk in generate().transaction_chunks(10) for row in chunk]
+        # Timestamps are relative to now, everything else comes from the seed
+        assert [row[:-1] for row in rows] == [row[:-1] for row in again]
+        assert all(1 <= row[0] <= 20 and 1 <= row[2] <= 10 for row in rows)
+        assert [row[-1] for row in rows] == sorted(row[-1] for row in rows)
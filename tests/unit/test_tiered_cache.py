@@ -0,0 +1,92 @@
+import asyncio
+import logging
+
+import pytest
+
+from multiverse_market.infrastructure import LocalCache, TieredCache
+from tests.unit.mocks import (
+    InMemoryCacheService,
+    InMemoryInvalidationBroker,
+    InMemoryInvalidationBus,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.unit
+@pytest.mark.cache
+class TestLocalCache:
+    def test_evicts_least_recently_used(self) -> None:
+        """Test that the cache stays within its size limit, dropping the coldest key."""
+        local = LocalCache(max_size=2)
+        local.set("a", "1")
+        local.set("b", "2")
+        assert local.get("a") == "1"
+
+        local.set("c", "3")
+
+        assert len(local) == 2
+        assert local.get("b") is None
+        assert local.get("a") == "1"
+        assert local.evictions == 1
+
+    def test_expired_entries_miss(self) -> None:
+        """Test that entries are not served past their TTL."""
+        local = LocalCache(ttl=60.0)
+        local.set("a", "1", ttl=0)
+
+        assert local.get("a") is None
+        assert (local.hits, local.misses) == (0, 1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+@pytest.mark.cache
+class TestTieredCache:
+    async def test_repeated_reads_served_locally(self) -> None:
+        """Test that only the first read of a key reaches the remote cache."""
+        remote = InMemoryCacheService()
+        remote._cache["item:v0:1"] = "cached"
+        cache = TieredCache(remote, InMemoryInvalidationBus(InMemoryInvalidationBroker()))
+
+        for _ in range(5):
+            assert await cache.get("item:v0:1") == "cached"
+        assert await cache.get_many(["item:v0:1", "item:v0:2"]) == ["cached", None]
+
+        assert remote.round_trips == 2
+        assert cache.local.hits == 5
+        await cache.close()
+
+    async def test_writes_invalidate_other_processes(self) -> None:
+        """Test that a write in one process evicts the key from every other process."""
+        remote = InMemoryCacheService()
+        broker = InMemoryInvalidationBroker()
+        writer = TieredCache(remote, InMemoryInvalidationBus(broker))
+        reader = TieredCache(remote, InMemoryInvalidationBus(broker))
+
+        await writer.setex("user:v0:1", 60, "old")
+        assert await reader.get("user:v0:1") == "old"
+
+        async with writer.pipeline() as pipeline:
+            pipeline.delete("user:v0:1")
+        await asyncio.sleep(0)
+
+        assert await reader.get("user:v0:1") is None
+        await writer.close()
+        await reader.close()
+
+    async def test_generation_bump_reaches_other_processes(self) -> None:
+        """Test that a namespace generation read from memory follows a remote INCR."""
+        remote = InMemoryCacheService()
+        broker = InMemoryInvalidationBroker()
+        writer = TieredCache(remote, InMemoryInvalidationBus(broker))
+        reader = TieredCache(remote, InMemoryInvalidationBus(broker))
+        await writer.incr("item:generation")
+        assert await reader.get("item:generation") == "1"
+
+        await writer.incr("item:generation")
+        await asyncio.sleep(0)
+
+        assert await reader.get("item:generation") == "2"
+        await writer.close()
+        await reader.close()